@@ -0,0 +1,269 @@
+"""In-memory stand-ins for the Discord objects TicketBot touches.
+
+They carry only the attributes and coroutines the cog reads or calls, and
+every REST call is a no-op that counts itself, so benchmarks measure the
+bot's own work and never touch the network.
+"""
+import bisect
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import discord
+
+# Discord epoch offset in milliseconds, for building realistic snowflakes
+DISCORD_EPOCH = 1420070400000
+
+
+def snowflake(when: datetime, sequence: int = 0) -> int:
+    return (int(when.timestamp() * 1000) - DISCORD_EPOCH) << 22 | (sequence & 0x3FFFFF)
+
+
+class RestCounter:
+    """Counts the REST calls the fakes would have sent"""
+
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+
+    def hit(self, route: str):
+        self.calls[route] = self.calls.get(route, 0) + 1
+
+
+class FakePermissions:
+    def __init__(self, administrator: bool = False):
+        self.administrator = administrator
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str, administrator: bool = False):
+        self.id = role_id
+        self.name = name
+        self.permissions = FakePermissions(administrator)
+        self.mention = f"<@&{role_id}>"
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+
+class FakeMember:
+    def __init__(self, member_id: int, guild: "FakeGuild", name: str, role_ids=(), administrator: bool = False):
+        self.id = member_id
+        self.guild = guild
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{member_id}>"
+        self.bot = False
+        self._roles = list(role_ids)
+        self.guild_permissions = FakePermissions(administrator)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __str__(self):
+        return self.name
+
+
+class FakeAttachment:
+    def __init__(self, attachment_id: int, channel_id: int, filename: str):
+        self.id = attachment_id
+        self.filename = filename
+        self.url = f"https://cdn.discordapp.com/attachments/{channel_id}/{attachment_id}/{filename}"
+
+
+class FakeMessage:
+    def __init__(self, message_id: int, channel, author: FakeMember, content: str, attachments=()):
+        self.id = message_id
+        self.channel = channel
+        self.guild = getattr(channel, "guild", None)
+        self.author = author
+        self.content = content
+        self.clean_content = content
+        self.attachments = list(attachments)
+        self.created_at = discord.utils.snowflake_time(message_id)
+
+
+class FakeCategory:
+    def __init__(self, category_id: int, guild: "FakeGuild", name: str):
+        self.id = category_id
+        self.guild = guild
+        self.name = name
+        self.text_channels: List["FakeTextChannel"] = []
+
+
+class FakeTextChannel:
+    def __init__(self, channel_id: int, guild: "FakeGuild", name: str, rest: RestCounter,
+                 category: Optional[FakeCategory] = None):
+        self.id = channel_id
+        self.guild = guild
+        self.name = name
+        self.rest = rest
+        self.category = category
+        self.category_id = category.id if category else None
+        self.mention = f"<#{channel_id}>"
+        self.overwrites: Dict = {}
+        self.messages: List[FakeMessage] = []
+        self._message_ids: List[int] = []
+
+    @property
+    def last_message_id(self) -> Optional[int]:
+        return self._message_ids[-1] if self._message_ids else None
+
+    def add_messages(self, messages: List[FakeMessage]):
+        self.messages.extend(messages)
+        self._message_ids.extend(message.id for message in messages)
+
+    async def history(self, limit=None, oldest_first=False, after=None, before=None):
+        """Walk stored messages in pages of 100, like the real paginated endpoint"""
+        start = bisect.bisect_right(self._message_ids, after.id) if after is not None else 0
+        end = bisect.bisect_left(self._message_ids, before.id) if before is not None else len(self._message_ids)
+        if limit is not None:
+            end = min(end, start + limit)
+        indices = range(start, end) if oldest_first else range(end - 1, start - 1, -1)
+        for count, index in enumerate(indices):
+            if count % 100 == 0:
+                self.rest.hit("GET /channels/{id}/messages")
+            yield self.messages[index]
+
+    async def send(self, content=None, **kwargs):
+        self.rest.hit("POST /channels/{id}/messages")
+        return FakeMessage(snowflake(datetime.now(timezone.utc)), self, self.guild.me, content or "")
+
+    async def edit(self, **kwargs):
+        self.rest.hit("PATCH /channels/{id}")
+        if "overwrites" in kwargs:
+            self.overwrites = kwargs["overwrites"]
+
+    async def set_permissions(self, target, **kwargs):
+        self.rest.hit("PUT /channels/{id}/permissions/{target}")
+        self.overwrites[target] = discord.PermissionOverwrite(**kwargs)
+
+    async def delete(self, **kwargs):
+        self.rest.hit("DELETE /channels/{id}")
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, rest: RestCounter):
+        self.id = guild_id
+        self.rest = rest
+        self.default_role = FakeRole(guild_id, "@everyone")
+        self.roles: List[FakeRole] = [self.default_role]
+        self.categories: List[FakeCategory] = []
+        self.text_channels: List[FakeTextChannel] = []
+        self.members: Dict[int, FakeMember] = {}
+        self._channels: Dict[int, object] = {}
+        self._roles: Dict[int, FakeRole] = {self.default_role.id: self.default_role}
+        self.me = self.add_member(guild_id + 1, "TicketBot", administrator=True)
+
+    def add_role(self, role_id: int, name: str, administrator: bool = False) -> FakeRole:
+        role = FakeRole(role_id, name, administrator)
+        self.roles.append(role)
+        self._roles[role_id] = role
+        return role
+
+    def add_member(self, member_id: int, name: str, role_ids=(), administrator: bool = False) -> FakeMember:
+        member = FakeMember(member_id, self, name, role_ids, administrator)
+        self.members[member_id] = member
+        return member
+
+    def add_category(self, category_id: int, name: str) -> FakeCategory:
+        category = FakeCategory(category_id, self, name)
+        self.categories.append(category)
+        self._channels[category_id] = category
+        return category
+
+    def add_text_channel(self, channel_id: int, name: str, category: Optional[FakeCategory] = None) -> FakeTextChannel:
+        channel = FakeTextChannel(channel_id, self, name, self.rest, category)
+        self.text_channels.append(channel)
+        self._channels[channel_id] = channel
+        if category is not None:
+            category.text_channels.append(channel)
+        return channel
+
+    def get_channel(self, channel_id: int):
+        return self._channels.get(channel_id)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self._roles.get(role_id)
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self.members.get(member_id)
+
+
+class FakeFollowup:
+    def __init__(self, rest: RestCounter):
+        self.rest = rest
+
+    async def send(self, content=None, **kwargs):
+        self.rest.hit("POST /webhooks/{application_id}/{token}")
+
+
+class FakeInteraction:
+    def __init__(self, interaction_id: int, guild: FakeGuild, channel: FakeTextChannel, user: FakeMember):
+        self.id = interaction_id
+        self.guild = guild
+        self.channel = channel
+        self.user = user
+        self.followup = FakeFollowup(guild.rest)
+
+
+class FakeContext:
+    def __init__(self, guild: FakeGuild, channel: FakeTextChannel, author: FakeMember):
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+def build_ticket_guild(cog, members: int = 2, messages: int = 0, attachment_every: int = 25,
+                       extra_roles: int = 0):
+    """A guild with the support roles, the ticket category and one ticket channel.
+
+    The ticket has `members` members, each with a permission overwrite, and a
+    history of `messages` messages with an attachment every `attachment_every`
+    messages. Returns (guild, ticket channel, staff member).
+    """
+    rest = RestCounter()
+    created = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    guild = FakeGuild(snowflake(created, 1), rest)
+    next_id = iter(range(snowflake(created, 1000), snowflake(created, 1000) + 10_000_000))
+
+    support_roles = [guild.add_role(next(next_id), name) for name in cog.support_roles.values()]
+    for i in range(extra_roles):
+        guild.add_role(next(next_id), f"role-{i}")
+    staff = guild.add_member(next(next_id), "staff", role_ids=[support_roles[-1].id])
+
+    category = guild.add_category(next(next_id), cog.ticket_category_name)
+    guild.add_text_channel(next(next_id), cog.transcripts_channel_name, category)
+    opened = created + timedelta(days=1)
+    ticket = guild.add_text_channel(snowflake(opened), "trial_middleman-1", category)
+
+    member_ids = []
+    ticket.overwrites[guild.default_role] = discord.PermissionOverwrite(read_messages=False)
+    ticket.overwrites[guild.me] = discord.PermissionOverwrite(read_messages=True, manage_channels=True)
+    for role in support_roles:
+        ticket.overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+    for i in range(members):
+        member = guild.add_member(next(next_id), f"member-{i}")
+        member_ids.append(member.id)
+        ticket.overwrites[member] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+    cog.ticket_members[ticket.id] = member_ids
+
+    authors = [guild.get_member(member_id) for member_id in member_ids[:2]] + [staff]
+    history = []
+    for i in range(messages):
+        message_id = snowflake(opened + timedelta(seconds=1 + i))
+        attachments = ()
+        if attachment_every and i % attachment_every == attachment_every - 1:
+            attachments = (FakeAttachment(message_id + 1, ticket.id, f"proof-{i}.png"),)
+        history.append(FakeMessage(message_id, ticket, authors[i % len(authors)],
+                                   f"Message {i}: sending the items now, please confirm <@{staff.id}> & check",
+                                   attachments))
+    ticket.add_messages(history)
+    return guild, ticket, staff
@@ -0,0 +1,254 @@
+"""Benchmarks for TicketBot's hot paths, run against in-memory fakes.
+
+    python -m benchmarks.run [--quick] [--verbose] [--only NAME] [--output results.json] [--compare baseline.json]
+
+Each case is timed over a few repeats, then run once more under tracemalloc
+to record peak Python memory. Results are written as JSON; passing an
+earlier results file with --compare prints the change in median time and
+peak memory per case and flags anything that got worse by more than
+--threshold percent. Everything runs in a temporary directory, with no
+network and no bot token.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+class Case:
+    def __init__(self, name: str, params: dict, setup, run, repeat: int = 5):
+        self.name = name
+        self.params = params
+        self.setup = setup
+        self.run = run
+        self.repeat = repeat
+
+    @property
+    def key(self) -> str:
+        return self.name + "[" + ",".join(f"{k}={v}" for k, v in self.params.items()) + "]"
+
+
+def build_cases(quick: bool):
+    import bot as bot_module
+    from benchmarks.fakes import FakeInteraction, FakeMessage, build_ticket_guild
+
+    def new_cog():
+        return bot_module.TicketBot(bot_module.bot)
+
+    cases = []
+    message_sizes = [1_000] if quick else [1_000, 10_000, 100_000]
+    member_sizes = [1_000] if quick else [1_000, 50_000]
+    role_sizes = [100] if quick else [100, 1_000, 5_000]
+
+    for size in message_sizes:
+        def setup(size=size):
+            cog = new_cog()
+            _, ticket, _ = build_ticket_guild(cog, messages=size)
+            records = [cog._message_record(message) for message in ticket.messages]
+            return cog, ticket, records
+
+        async def run(state):
+            cog, ticket, records = state
+            await cog.create_html_transcript(ticket, records)
+
+        cases.append(Case("create_html_transcript", {"messages": size}, setup, run,
+                          repeat=5 if size < 100_000 else 2))
+
+    for size in message_sizes:
+        def setup(size=size):
+            cog = new_cog()
+            _, ticket, staff = build_ticket_guild(cog, messages=size)
+            return cog, ticket, staff
+
+        async def run(state):
+            cog, ticket, staff = state
+            url, _ = await cog.generate_transcript(ticket, staff.display_name)
+            if url is None:
+                raise RuntimeError("generate_transcript failed")
+
+        cases.append(Case("generate_transcript", {"messages": size}, setup, run,
+                          repeat=3 if size < 100_000 else 1))
+
+    for size in member_sizes:
+        def setup(size=size):
+            cog = new_cog()
+            guild, ticket, staff = build_ticket_guild(cog, members=size)
+            return cog, FakeInteraction(1, guild, ticket, staff)
+
+        async def run(state):
+            cog, interaction = state
+            await cog.close_ticket(interaction)
+
+        cases.append(Case("close_ticket", {"members": size}, setup, run, repeat=3))
+
+    for size in role_sizes:
+        def setup(size=size):
+            cog = new_cog()
+            guild, _, _ = build_ticket_guild(cog, extra_roles=size)
+            # A member holding every role except the support ones: the slowest check to answer
+            member = guild.add_member(7, "busy", role_ids=[role.id for role in guild.roles[-size:]])
+            return cog, guild, member
+
+        async def run(state, calls=10_000):
+            cog, _, member = state
+            for _ in range(calls):
+                await cog.has_permission(member)
+
+        async def run_cold(state, calls=100):
+            cog, guild, member = state
+            for _ in range(calls):
+                cog._invalidate_snapshot(guild)
+                await cog.has_permission(member)
+
+        cases.append(Case("has_permission", {"roles": size, "calls": 10_000}, setup, run))
+        cases.append(Case("has_permission_cold", {"roles": size, "calls": 100}, setup, run_cold))
+
+    def setup_calc():
+        cog = new_cog()
+        guild, ticket, _ = build_ticket_guild(cog)
+        authors = [guild.add_member(1_000_000 + i, f"calc-{i}") for i in range(1_000)]
+        return cog, ticket, authors
+
+    async def run_calc(state):
+        cog, ticket, authors = state
+        bot_module.user_cooldowns.clear()
+        for i, author in enumerate(authors):
+            await cog.on_message(FakeMessage(ticket.id + 1 + i, ticket, author, "$calc (2 + 3) * math.sqrt(16) / 7"))
+
+    cases.append(Case("on_message_calc", {"messages": 1_000}, setup_calc, run_calc))
+    return cases
+
+
+async def measure(case: Case) -> dict:
+    state = case.setup()
+    await case.run(state)  # warm-up: imports, template compilation, sqlite schema
+
+    times = []
+    for _ in range(case.repeat):
+        gc.collect()
+        start = time.perf_counter()
+        await case.run(state)
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        await case.run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "name": case.name,
+        "params": case.params,
+        "repeat": case.repeat,
+        "time_s": {
+            "min": min(times),
+            "median": statistics.median(times),
+            "mean": statistics.fmean(times),
+            "max": max(times)
+        },
+        "peak_bytes": peak
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: dict, baseline_path: Path, threshold: float) -> int:
+    """Print changes against an earlier run; returns the number of regressions"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {result["key"]: result for result in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"\nCompared with {baseline_path} (regression threshold {threshold:.0f}%)")
+    for result in results["results"]:
+        old = baseline.get(result["key"])
+        if old is None:
+            print(f"  {result['key']}: new")
+            continue
+        time_change = (result["time_s"]["median"] / old["time_s"]["median"] - 1) * 100
+        memory_change = (result["peak_bytes"] / old["peak_bytes"] - 1) * 100 if old["peak_bytes"] else 0.0
+        flag = ""
+        if time_change > threshold or memory_change > threshold:
+            flag = "  ⚠️ regression"
+            regressions += 1
+        print(f"  {result['key']}: time {time_change:+.1f}%, peak memory {memory_change:+.1f}%{flag}")
+    return regressions
+
+
+async def run_all(args) -> dict:
+    results = []
+    # The bot's own progress prints would drown the results
+    quiet = contextlib.nullcontext(sys.stdout) if args.verbose else open(os.devnull, "w")
+    with quiet as bot_output:
+        for case in build_cases(args.quick):
+            if args.only and args.only not in case.key:
+                continue
+            with contextlib.redirect_stdout(bot_output):
+                result = await measure(case)
+            result["key"] = case.key
+            results.append(result)
+            print(f"{case.key:<55} median {result['time_s']['median'] * 1000:>10.2f} ms"
+                  f"   peak {result['peak_bytes'] / 1024 / 1024:>8.2f} MiB", flush=True)
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "quick": args.quick
+        },
+        "results": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="smallest size of each case only")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own output")
+    parser.add_argument("--only", help="run cases whose key contains this text")
+    parser.add_argument("--output", type=Path, help="write results as JSON to this file")
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=20.0, help="regression threshold in percent")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(REPO_DIR))
+    output = args.output.resolve() if args.output else None
+    baseline = args.compare.resolve() if args.compare else None
+
+    # The cog creates its transcript, log and state files relative to the working directory
+    with tempfile.TemporaryDirectory(prefix="ticketbot-bench-") as workdir:
+        os.chdir(workdir)
+        os.environ.setdefault("TICKET_STATE_PATH", str(Path(workdir) / "ticket_state.sqlite3"))
+        results = asyncio.run(run_all(args))
+        os.chdir(REPO_DIR)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✅ Results written to {output}")
+    if baseline and compare(results, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
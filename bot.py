@@ -2,19 +2,47 @@ import discord
 from discord.ext import commands
 from discord import ui, ButtonStyle, SelectOption
 import asyncio
+import functools
+import io
 import os
 import re
 import time
 import math
 import shutil
+import signal
 from typing import Optional, Dict, List
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from metrics import REGISTRY, log_event, start_metrics_server
+from rest_scheduler import BACKGROUND, INTERACTIVE, RestScheduler
+from ticket_capture import CaptureLog
+from transcript_attachments import ATTACHMENTS_DIRNAME, AttachmentArchive, attachment_storage
+from transcript_catalog import CATALOG_FILENAME, TranscriptCatalog
+from transcript_format import dump_header, dump_message, sidecar_path
+from transcript_ingest import INGEST_PATH, OUTBOX_FILENAME, IngestClient
+from transcript_jobs import TranscriptJobQueue
+from transcript_search import SEARCH_FILENAME, SearchIndex
+from transcript_segments import SegmentStore
+from transcript_storage import LocalStorage, compress_stored, storage_from_env
+from transcript_templates import render_footer, render_header, render_message
+from ticket_state import STATE_FILENAME, TicketStateStore
 
 # Global variables
 user_cooldowns = {}
 COOLDOWN_SECONDS = 5
 
+# Exported on /metrics when METRICS_PORT is set
+TRANSCRIPT_PHASE_SECONDS = REGISTRY.histogram(
+    "ticketbot_transcript_phase_seconds", "Time spent in each phase of transcript generation", ["phase"])
+TRANSCRIPT_MESSAGES = REGISTRY.histogram(
+    "ticketbot_transcript_messages", "Messages per generated transcript", [],
+    buckets=(10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000))
+TRANSCRIPTS_GENERATED = REGISTRY.counter("ticketbot_transcripts_total", "Transcripts generated", ["result"])
+TICKET_EVENTS = REGISTRY.counter("ticketbot_tickets_total", "Tickets opened, closed, reopened and deleted", ["event"])
+INTERACTION_SECONDS = REGISTRY.histogram(
+    "ticketbot_interaction_seconds", "Time spent handling button and modal interactions", ["handler"])
+
 # CORRECT INTENTS SETUP
 intents = discord.Intents.default()
 intents.message_content = True
@@ -57,8 +85,9 @@ class TicketForm(ui.Modal, title="Trade Information"):
         await interaction.response.defer(ephemeral=True)
         cog = interaction.client.get_cog("TicketBot")
         if cog:
-            await cog.process_ticket_form(interaction, self.ticket_type, self.your_side.value, 
-                                        self.their_side.value, self.their_id.value, self.tip.value)
+            with INTERACTION_SECONDS.time(handler="ticket_form"):
+                await cog.process_ticket_form(interaction, self.ticket_type, self.your_side.value, 
+                                            self.their_side.value, self.their_id.value, self.tip.value)
 
 class TicketPanelView(ui.View):
     def __init__(self):
@@ -100,21 +129,24 @@ class TicketControlView(ui.View):
         await interaction.response.defer()
         cog = interaction.client.get_cog("TicketBot")
         if cog:
-            await cog.close_ticket(interaction)
+            with INTERACTION_SECONDS.time(handler="close_ticket"):
+                await cog.close_ticket(interaction)
     
     @ui.button(label="Transcript", style=ButtonStyle.blurple, custom_id="generate_transcript")
     async def generate_transcript(self, interaction: discord.Interaction, button: ui.Button):
         await interaction.response.defer()
         cog = interaction.client.get_cog("TicketBot")
         if cog:
-            await cog.generate_transcript_button(interaction)
+            with INTERACTION_SECONDS.time(handler="generate_transcript"):
+                await cog.generate_transcript_button(interaction)
     
     @ui.button(label="Delete", style=ButtonStyle.grey, custom_id="delete_ticket")
     async def delete_ticket(self, interaction: discord.Interaction, button: ui.Button):
         await interaction.response.defer()
         cog = interaction.client.get_cog("TicketBot")
         if cog:
-            await cog.delete_ticket(interaction)
+            with INTERACTION_SECONDS.time(handler="delete_ticket"):
+                await cog.delete_ticket(interaction)
 
 class TicketOpenView(ui.View):
     def __init__(self):
@@ -125,21 +157,39 @@ class TicketOpenView(ui.View):
         await interaction.response.defer()
         cog = interaction.client.get_cog("TicketBot")
         if cog:
-            await cog.open_ticket_button(interaction)
+            with INTERACTION_SECONDS.time(handler="open_ticket"):
+                await cog.open_ticket_button(interaction)
     
     @ui.button(label="Transcript", style=ButtonStyle.blurple, custom_id="generate_transcript_closed")
     async def generate_transcript_closed(self, interaction: discord.Interaction, button: ui.Button):
         await interaction.response.defer()
         cog = interaction.client.get_cog("TicketBot")
         if cog:
-            await cog.generate_transcript_button(interaction)
+            with INTERACTION_SECONDS.time(handler="generate_transcript"):
+                await cog.generate_transcript_button(interaction)
     
     @ui.button(label="Delete", style=ButtonStyle.grey, custom_id="delete_ticket_closed")
     async def delete_ticket_closed(self, interaction: discord.Interaction, button: ui.Button):
         await interaction.response.defer()
         cog = interaction.client.get_cog("TicketBot")
         if cog:
-            await cog.delete_ticket(interaction)
+            with INTERACTION_SECONDS.time(handler="delete_ticket"):
+                await cog.delete_ticket(interaction)
+
+class GuildSnapshot:
+    """Ticket-related objects of one guild, resolved once.
+
+    Maps support role names to role ids and remembers the ticket category and
+    transcripts channel, so hot paths do id lookups instead of scanning the
+    guild's roles and channels.
+    """
+
+    def __init__(self, support_role_ids: Dict[str, int], ticket_category_id: Optional[int],
+                 transcripts_channel_id: Optional[int]):
+        self.support_role_ids = support_role_ids
+        self.support_role_id_set = frozenset(support_role_ids.values())
+        self.ticket_category_id = ticket_category_id
+        self.transcripts_channel_id = transcripts_channel_id
 
 class TicketBot(commands.Cog):
     def __init__(self, bot):
@@ -159,13 +209,78 @@ class TicketBot(commands.Cog):
         self.TICKET_CATEGORY_ID = None
         self.ticket_members: Dict[int, List[int]] = {}
         
+        # Ticket state survives restarts; writes are batched in the background
+        self.state_store = TicketStateStore(Path(os.environ.get("TICKET_STATE_PATH", STATE_FILENAME)))
+        self._reconcile_task: Optional[asyncio.Task] = None
+        
+        # Per-guild role and channel lookups, invalidated by role and channel events
+        self.guild_snapshots: Dict[int, GuildSnapshot] = {}
+        
         # Transcripts directory setup
         self.transcripts_dir = Path("transcripts")
         self._ensure_directory(self.transcripts_dir)
+        self.catalog = TranscriptCatalog(self.transcripts_dir / CATALOG_FILENAME)
+        self.search_index = SearchIndex(self.transcripts_dir / SEARCH_FILENAME)
+        # Pages, records and compressed copies go to the configured backend (local directory or S3)
+        self.storage = storage_from_env(self.transcripts_dir)
         self.website_url = os.environ.get("WEBSITE_URL", "https://xiangw-transcripts.onrender.com")
         
+        # Older transcripts are packed into monthly segments; retention 0 keeps them forever
+        self.segment_store = SegmentStore(self.transcripts_dir)
+        self.transcript_loose_days = float(os.environ.get("TRANSCRIPT_LOOSE_DAYS", 30))
+        self.transcript_retention_days = float(os.environ.get("TRANSCRIPT_RETENTION_DAYS", 0))
+        self.compact_interval_hours = float(os.environ.get("TRANSCRIPT_COMPACT_HOURS", 6))
+        self._compact_task: Optional[asyncio.Task] = None
+        
         if self.website_url.endswith('/'):
             self.website_url = self.website_url[:-1]
+        
+        # Finished transcripts are pushed to the web app in batches when an ingest token is set
+        self.ingest_token = os.environ.get("TRANSCRIPT_INGEST_TOKEN")
+        self.ingest = IngestClient(
+            os.environ.get("TRANSCRIPT_INGEST_URL", self.website_url + INGEST_PATH),
+            self.ingest_token,
+            self.storage,
+            self.transcripts_dir / OUTBOX_FILENAME,
+            batch_seconds=float(os.environ.get("TRANSCRIPT_INGEST_BATCH_SECONDS", 2)),
+            batch_max_items=int(os.environ.get("TRANSCRIPT_INGEST_BATCH_ITEMS", 50)),
+            batch_max_bytes=int(os.environ.get("TRANSCRIPT_INGEST_BATCH_BYTES", 32 * 1024 * 1024)),
+            catalog=self.catalog,
+            resync_seconds=float(os.environ.get("TRANSCRIPT_INGEST_RESYNC_SECONDS", 600))
+        )
+        
+        # Concurrent history capture: the channel lifetime is split into this many
+        # snowflake ranges, with at most `history_concurrency` fetched at once and
+        # each buffering up to `history_range_buffer` messages ahead of the reader
+        self.history_concurrency = int(os.environ.get("TRANSCRIPT_FETCH_CONCURRENCY", 4))
+        self.history_ranges = int(os.environ.get("TRANSCRIPT_FETCH_RANGES", 8))
+        self.history_range_buffer = int(os.environ.get("TRANSCRIPT_FETCH_BUFFER", 500))
+        
+        # Live capture of ticket messages, so transcripts need no full history replay
+        self.capture_log = CaptureLog(Path("ticket_logs"))
+        
+        # Transcript generation runs on a bounded, per-channel deduplicated queue
+        self.transcript_jobs = TranscriptJobQueue(
+            workers=int(os.environ.get("TRANSCRIPT_WORKERS", 2)),
+            io_threads=int(os.environ.get("TRANSCRIPT_IO_THREADS", 2))
+        )
+        
+        # Attachments are copied off Discord's expiring CDN links while transcripts are written
+        self.archive_attachments = os.environ.get("ARCHIVE_ATTACHMENTS", "1") != "0"
+        self.attachment_archive = AttachmentArchive(
+            attachment_storage(self.storage),
+            self.transcripts_dir / ATTACHMENTS_DIRNAME,
+            concurrency=int(os.environ.get("ATTACHMENT_FETCH_CONCURRENCY", 4)),
+            max_bytes=int(os.environ.get("ATTACHMENT_MAX_BYTES", 50 * 1024 * 1024))
+        )
+        
+        # Channel edits, uploads and deletes are queued per route bucket, interaction replies first
+        self.rest = RestScheduler(concurrency=int(os.environ.get("REST_CONCURRENCY", 4)))
+        
+        # Prometheus-style metrics listener, off unless a port and a scrape token are configured
+        self.metrics_port = int(os.environ.get("METRICS_PORT", 0))
+        self.metrics_token = os.environ.get("METRICS_TOKEN")
+        self._metrics_runner = None
 
     def _ensure_directory(self, path):
         """Safely create directory if it doesn't exist"""
@@ -177,139 +292,509 @@ class TicketBot(commands.Cog):
         except Exception as e:
             print(f"Error creating directory {path}: {e}")
 
+    def _capture_since(self) -> int:
+        """Snowflake up to which the REST backfill covers this gateway session.
+
+        It is a minute past the ready time, so the backfill overlaps the start
+        of live capture rather than leaving a gap before it; messages seen both
+        live and through the backfill are merged by id.
+        """
+        return discord.utils.time_snowflake(discord.utils.utcnow() + timedelta(minutes=1))
+
     async def cog_load(self):
         self.bot.add_view(TicketPanelView())
         self.bot.add_view(TicketControlView())
         self.bot.add_view(TicketOpenView())
+        self.transcript_jobs.start()
+        self.rest.start()
+        self.capture_log.start_writer(self.transcript_jobs.run_io)
+        if self.archive_attachments:
+            self.attachment_archive.start(self.transcript_jobs.run_io)
+        if self.ingest_token:
+            self.ingest.start(self.transcript_jobs.run_io)
+        if self.metrics_port and not self.metrics_token:
+            print("❌ METRICS_PORT is set without METRICS_TOKEN; metrics listener not started")
+        elif self.metrics_port:
+            try:
+                self._metrics_runner = await start_metrics_server(REGISTRY, self.metrics_port, self.metrics_token)
+                print(f"✅ Metrics on port {self.metrics_port}")
+            except Exception as e:
+                print(f"❌ Error starting metrics listener: {e}")
+        await self.load_state()
+        # Segment packing works on the local directory only
+        if self.compact_interval_hours > 0 and isinstance(self.storage, LocalStorage):
+            self._compact_task = asyncio.create_task(self.compact_transcripts_periodically())
+
+    async def cog_unload(self):
+        if self._reconcile_task is not None:
+            self._reconcile_task.cancel()
+        if self._compact_task is not None:
+            self._compact_task.cancel()
+        # Let queued transcripts finish before the bot disconnects
+        await self.transcript_jobs.drain()
+        await self.rest.drain()
+        await self.attachment_archive.close()
+        await self.ingest.close()
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+        await self.capture_log.close()
+        try:
+            await self.state_store.close()
+        except Exception as e:
+            print(f"❌ Error saving ticket state: {e}")
+        # Last, once nothing else can submit work to the I/O pool
+        self.transcript_jobs.close()
+
+    async def load_state(self):
+        """Restore ticket state from the store, then check it against the guilds once connected"""
+        try:
+            members, settings = await self.transcript_jobs.run_io(self.state_store.load)
+        except Exception as e:
+            print(f"❌ Error loading ticket state: {e}")
+            members, settings = {}, {}
+        for channel_id, member_ids in members.items():
+            self.ticket_members.setdefault(channel_id, member_ids)
+        self.ticket_counter = max(self.ticket_counter, settings.get("ticket_counter") or 1)
+        if self.TICKET_CATEGORY_ID is None:
+            self.TICKET_CATEGORY_ID = settings.get("ticket_category_id")
+        print(f"✅ Loaded state for {len(members)} tickets (next ticket #{self.ticket_counter})")
+        
+        self.state_store.start(self.transcript_jobs.run_io)
+        self._reconcile_task = asyncio.create_task(self.reconcile_state())
+
+    async def reconcile_state(self):
+        """Drop state for channels deleted while offline and catch the counter up with existing tickets"""
+        await self.bot.wait_until_ready()
+        stale = [channel_id for channel_id in self.ticket_members if self.bot.get_channel(channel_id) is None]
+        for channel_id in stale:
+            self._forget_ticket(channel_id)
+        
+        if self.TICKET_CATEGORY_ID is not None and self.bot.get_channel(self.TICKET_CATEGORY_ID) is None:
+            self._set_ticket_category(None)
+        
+        counter = self.ticket_counter
+        for guild in self.bot.guilds:
+            category_id = self.guild_snapshot(guild).ticket_category_id
+            category = guild.get_channel(category_id) if category_id else None
+            for channel in getattr(category, "text_channels", []):
+                match = re.search(r"-(\d+)$", channel.name)
+                if match:
+                    counter = max(counter, int(match.group(1)) + 1)
+        if counter != self.ticket_counter:
+            self.ticket_counter = counter
+            self.state_store.set_value("ticket_counter", counter)
+        print(f"✅ Reconciled ticket state: {len(stale)} stale tickets dropped, next ticket #{self.ticket_counter}")
+
+    async def compact_transcripts(self) -> Dict[str, int]:
+        """Pack old transcripts into segments and apply the retention period"""
+        started = time.perf_counter()
+        result = await self.transcript_jobs.run_io(
+            self.segment_store.compact, self.transcript_loose_days, self.transcript_retention_days,
+            self.catalog, self.search_index
+        )
+        log_event("transcripts_compacted", ms=round((time.perf_counter() - started) * 1000, 1), **result)
+        return result
+
+    async def compact_transcripts_periodically(self):
+        while True:
+            try:
+                await self.compact_transcripts()
+            except Exception as e:
+                print(f"❌ Error compacting transcripts: {e}")
+            await asyncio.sleep(self.compact_interval_hours * 3600)
+
+    def _save_ticket_members(self, channel_id: int):
+        self.state_store.set_members(channel_id, self.ticket_members.get(channel_id, []))
+
+    def _forget_ticket(self, channel_id: int):
+        self.ticket_members.pop(channel_id, None)
+        self.state_store.forget(channel_id)
+
+    def _set_ticket_category(self, category_id: Optional[int]):
+        if category_id != self.TICKET_CATEGORY_ID:
+            self.TICKET_CATEGORY_ID = category_id
+            self.state_store.set_value("ticket_category_id", category_id)
+
+    def followup(self, interaction: discord.Interaction, *args, **kwargs):
+        """Send an interaction followup through the REST scheduler, ahead of background work"""
+        return self.rest.run(f"interaction:{interaction.id}",
+                             lambda: interaction.followup.send(*args, **kwargs), priority=INTERACTIVE)
+
+    def channel_call(self, channel, factory, priority: int = BACKGROUND, merge_key=None, merge_state=None):
+        """Queue a REST call against a channel in that channel's bucket"""
+        return self.rest.run(f"channel:{channel.id}", factory, priority=priority,
+                             merge_key=merge_key, merge_state=merge_state)
+
+    def guild_snapshot(self, guild: discord.Guild) -> GuildSnapshot:
+        """Return the guild's snapshot, building it with one pass over roles and channels"""
+        snapshot = self.guild_snapshots.get(guild.id)
+        if snapshot is not None:
+            return snapshot
+        
+        support_names = set(self.support_roles.values())
+        found_roles = {}
+        for role in guild.roles:
+            if role.name in support_names:
+                found_roles.setdefault(role.name, role.id)
+        support_role_ids = {name: found_roles[name] for name in self.support_roles.values() if name in found_roles}
+        
+        category = discord.utils.get(guild.categories, name=self.ticket_category_name)
+        if category is None and self.TICKET_CATEGORY_ID is not None:
+            category = guild.get_channel(self.TICKET_CATEGORY_ID)
+            if not isinstance(category, discord.CategoryChannel):
+                category = None
+        transcripts_channel = discord.utils.get(guild.text_channels, name=self.transcripts_channel_name)
+        
+        snapshot = GuildSnapshot(
+            support_role_ids,
+            category.id if category else None,
+            transcripts_channel.id if transcripts_channel else None
+        )
+        self.guild_snapshots[guild.id] = snapshot
+        return snapshot
+
+    def support_role_objects(self, guild: discord.Guild) -> List[discord.Role]:
+        """Support roles that exist in the guild, in configuration order"""
+        roles = (guild.get_role(role_id) for role_id in self.guild_snapshot(guild).support_role_ids.values())
+        return [role for role in roles if role is not None]
+
+    def _invalidate_snapshot(self, guild: discord.Guild):
+        self.guild_snapshots.pop(guild.id, None)
 
     async def is_ticket_channel(self, channel: discord.TextChannel) -> bool:
         if not channel.category:
             return False
-        if self.TICKET_CATEGORY_ID is None:
-            category = discord.utils.get(channel.guild.categories, name=self.ticket_category_name)
-            if category:
-                self.TICKET_CATEGORY_ID = category.id
-        return channel.category and channel.category.id == self.TICKET_CATEGORY_ID
+        return channel.category_id == self.guild_snapshot(channel.guild).ticket_category_id
 
     async def has_permission(self, member: discord.Member) -> bool:
         if member.guild_permissions.administrator:
             return True
-        for role_name in self.support_roles.values():
-            support_role = discord.utils.get(member.guild.roles, name=role_name)
-            if support_role and support_role in member.roles:
-                return True
-        return False
+        # member._roles holds the member's role ids; no Role objects are built
+        return not self.guild_snapshot(member.guild).support_role_id_set.isdisjoint(member._roles)
+
+    def _message_record(self, message: discord.Message) -> dict:
+        """Convert a Discord message into a transcript message record"""
+        return {
+            "timestamp": message.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            "author": message.author.display_name,
+            "author_id": message.author.id,
+            "content": message.clean_content,
+            "attachments": [{"url": att.url, "filename": att.filename} 
+                           for att in message.attachments]
+        }
 
-    async def create_html_transcript(self, channel: discord.TextChannel) -> str:
-        """Create HTML transcript content"""
+    async def fetch_transcript_messages(self, channel: discord.TextChannel) -> List[dict]:
+        """Collect the channel history as transcript message records"""
         messages = []
-        async for message in channel.history(limit=None, oldest_first=True):
-            messages.append({
-                "timestamp": message.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                "author": message.author.display_name,
-                "content": message.clean_content,
-                "attachments": [{"url": att.url, "filename": att.filename} 
-                               for att in message.attachments]
-            })
-        
-        # Generate HTML
-        html = f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>Transcript #{channel.name}</title>
-    <style>
-        body {{ font-family: Arial, sans-serif; margin: 40px; background: #f5f5f5; }}
-        .container {{ max-width: 1000px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px; box-shadow: 0 4px 20px rgba(0,0,0,0.1); }}
-        .header {{ text-align: center; margin-bottom: 30px; border-bottom: 2px solid #eee; padding-bottom: 20px; }}
-        .message {{ margin: 15px 0; padding: 15px; border-left: 4px solid #007bff; background: #f8f9fa; border-radius: 4px; }}
-        .timestamp {{ color: #6c757d; font-size: 0.9em; margin-bottom: 5px; }}
-        .author {{ font-weight: bold; color: #495057; }}
-        .content {{ margin: 5px 0; line-height: 1.5; }}
-        .attachments {{ margin-top: 10px; }}
-        .attachment {{ display: block; color: #007bff; text-decoration: none; margin: 5px 0; }}
-        .attachment:hover {{ text-decoration: underline; }}
-        .back-link {{ display: inline-block; margin-top: 20px; color: #6c757d; text-decoration: none; }}
-        .back-link:hover {{ color: #495057; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>Transcript #{channel.name}</h1>
-            <p>Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-            <a href="/" class="back-link">← Back to all transcripts</a>
-        </div>
-        <div class="messages">
-"""
-        
-        for msg in messages:
-            attachments_html = ""
-            if msg['attachments']:
-                attachments_html = '<div class="attachments">' + \
-                    ''.join(f'<a href="{att["url"]}" class="attachment" target="_blank">📎 {att["filename"]}</a>' 
-                            for att in msg['attachments']) + \
-                    '</div>'
-            
-            html += f"""
-            <div class="message">
-                <div class="timestamp">{msg['timestamp']}</div>
-                <div class="author">{msg['author']}</div>
-                <div class="content">{msg['content']}</div>
-                {attachments_html}
-            </div>
-            """
-        
-        html += """
-        </div>
-    </div>
-</body>
-</html>
-"""
-        return html
-
-    async def generate_transcript(self, channel: discord.TextChannel):
-        """Generate HTML transcript and save to directory"""
+        async for msg in self.iter_transcript_records(channel):
+            messages.append(msg)
+        return messages
+
+    async def iter_transcript_records(self, channel: discord.TextChannel):
+        """Yield the ticket's message records oldest first.
+
+        Tickets with a live capture log are rebuilt from the log, and only the
+        ranges missed while the bot was disconnected are fetched from the API.
+        Other channels fall back to walking the full history.
+        """
+        run_io = self.transcript_jobs.run_io
+        self.capture_log.mark_session(channel.id)
+        index = await run_io(self.capture_log.index, channel.id)
+        if index is None:
+            async for message in self.iter_channel_history(channel):
+                yield self._message_record(message)
+            return
+
+        # Logged records are read back a batch at a time and merged by id with the backfilled gaps
+        backfill = self._iter_capture_gaps(channel, index)
         try:
-            # Generate HTML content
-            html_content = await self.create_html_transcript(channel)
+            gap = await self._next_or_none(backfill)
+            ids = sorted(index.offsets)
+            for start in range(0, len(ids), self.CAPTURE_READ_BATCH):
+                batch = ids[start:start + self.CAPTURE_READ_BATCH]
+                records = await run_io(self.capture_log.read_records, channel.id,
+                                       [index.offsets[message_id] for message_id in batch])
+                for message_id, record in zip(batch, records):
+                    while gap is not None and gap.id < message_id:
+                        yield self._message_record(gap)
+                        gap = await self._next_or_none(backfill)
+                    yield record
+            while gap is not None:
+                yield self._message_record(gap)
+                gap = await self._next_or_none(backfill)
+        finally:
+            await backfill.aclose()
+
+    async def _iter_capture_gaps(self, channel: discord.TextChannel, index):
+        """Messages from the ranges the capture log missed, oldest first, skipping logged and deleted ones"""
+        last_id = 0
+        for after_id, before_id in index.gaps:
+            async for message in channel.history(limit=None, oldest_first=True,
+                                                 after=discord.Object(id=max(after_id, last_id)),
+                                                 before=discord.Object(id=before_id)):
+                last_id = message.id
+                if message.id not in index.offsets and message.id not in index.deleted:
+                    yield message
+
+    @staticmethod
+    async def _next_or_none(iterator):
+        try:
+            return await iterator.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def _snowflake_ranges(self, first_id: int, last_id: int, count: int) -> List[tuple]:
+        """Split [first_id, last_id] into `count` contiguous (after, before) id bounds.
+
+        The final range has no upper bound, so messages sent while the capture
+        is running are still included.
+        """
+        span = last_id - first_id + 1
+        count = max(1, min(count, span))
+        edges = [first_id + span * i // count for i in range(count)]
+        bounds = []
+        for i, edge in enumerate(edges):
+            before_id = edges[i + 1] if i + 1 < len(edges) else None
+            bounds.append((edge - 1, before_id))
+        return bounds
+
+    async def iter_channel_history(self, channel: discord.TextChannel):
+        """Yield the whole channel history oldest first.
+
+        With concurrency enabled, the range between the channel creation id and
+        the last message id is split into snowflake ranges that are fetched in
+        parallel and yielded back in order, giving the same sequence as a single
+        sequential `channel.history` walk. Only a window of `history_concurrency`
+        ranges is in flight at a time, and each holds at most
+        `history_range_buffer` messages that the ranges before it have not
+        yet let through, so memory stays bounded however long the ticket is.
+        """
+        last_id = getattr(channel, "last_message_id", None)
+        if self.history_concurrency <= 1 or self.history_ranges <= 1 or not last_id or last_id <= channel.id:
+            async for message in channel.history(limit=None, oldest_first=True):
+                yield message
+            return
+        
+        async def fetch_range(queue, after_id, before_id):
+            # Blocks once the queue is full, until the consumer reaches this range
+            before = discord.Object(id=before_id) if before_id is not None else None
+            try:
+                async for message in channel.history(
+                    limit=None, oldest_first=True, after=discord.Object(id=after_id), before=before
+                ):
+                    await queue.put(message)
+            except Exception as e:
+                await queue.put(e)
+                return
+            await queue.put(None)
+        
+        bounds = self._snowflake_ranges(channel.id, last_id, self.history_ranges)
+        pending = []
+        next_range = 0
+        try:
+            while next_range < len(bounds) or pending:
+                while next_range < len(bounds) and len(pending) < self.history_concurrency:
+                    queue = asyncio.Queue(maxsize=self.history_range_buffer)
+                    pending.append((asyncio.create_task(fetch_range(queue, *bounds[next_range])), queue))
+                    next_range += 1
+                _, queue = pending[0]
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+                pending.pop(0)
+        finally:
+            for task, _ in pending:
+                task.cancel()
+
+    # Rendered output is handed to the I/O pool in chunks of about this many characters
+    TRANSCRIPT_WRITE_BUFFER = 64 * 1024
+    # Records read back from a capture log per trip to the I/O pool
+    CAPTURE_READ_BATCH = 500
+
+    async def create_html_transcript(self, channel: discord.TextChannel, messages: Optional[List[dict]] = None) -> str:
+        """Create HTML transcript content"""
+        if messages is None:
+            messages = await self.fetch_transcript_messages(channel)
+        
+        parts = [render_header(channel.name, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), self.website_url)]
+        parts.extend(render_message(msg, position) for position, msg in enumerate(messages))
+        parts.append(render_footer(self.website_url))
+        return "".join(parts)
+
+    async def write_transcript_stream(self, channel: discord.TextChannel, html_filename: str,
+                                      timings: Optional[Dict[str, float]] = None) -> int:
+        """Stream the channel history straight into the transcript page and its record.
+
+        Each message is written as the history iterator yields it, so memory use
+        does not grow with ticket length. Attachments are archived on the way
+        and their links rewritten to the web app. Neither file appears in
+        storage until both are complete. Returns the
+        message count; seconds spent fetching, rendering and writing are added
+        to `timings`.
+        """
+        generated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        record_filename = sidecar_path(Path(html_filename)).name
+        run_io = self.transcript_jobs.run_io
+        
+        count = 0
+        render_seconds = write_seconds = 0.0
+        started = time.perf_counter()
+        html_file = record_file = None
+        try:
+            html_file = await run_io(self.storage.open_write, html_filename)
+            record_file = await run_io(self.storage.open_write, record_filename)
+            html_parts = [render_header(channel.name, generated_at, self.website_url)]
+            record_parts = [dump_header(channel.name, channel.id, generated_at)]
+            buffered = 0
+            
+            records = self.iter_transcript_records(channel)
+            if self.attachment_archive.enabled:
+                records = self.attachment_archive.archive_records(records, self.website_url)
+            async for msg in records:
+                render_start = time.perf_counter()
+                chunk = render_message(msg, count)
+                line = dump_message(msg)
+                render_seconds += time.perf_counter() - render_start
+                html_parts.append(chunk)
+                record_parts.append(line)
+                buffered += len(chunk) + len(line)
+                count += 1
+                if buffered >= self.TRANSCRIPT_WRITE_BUFFER:
+                    write_start = time.perf_counter()
+                    await run_io(self._write_transcript_chunks, html_file, html_parts, record_file, record_parts)
+                    write_seconds += time.perf_counter() - write_start
+                    html_parts, record_parts, buffered = [], [], 0
+            
+            # Whatever the loop spent outside rendering and writing was waiting on history
+            fetch_seconds = time.perf_counter() - started - render_seconds - write_seconds
+            write_start = time.perf_counter()
+            html_parts.append(render_footer(self.website_url))
+            await run_io(self._write_transcript_chunks, html_file, html_parts, record_file, record_parts)
             
+            # The record goes first so the page never appears without it
+            await run_io(record_file.commit)
+            record_file = None
+            await run_io(html_file.commit)
+            write_seconds += time.perf_counter() - write_start
+        except BaseException:
+            await run_io(self._discard_transcript_files, (html_file, record_file))
+            raise
+        if timings is not None:
+            timings["fetch"] = timings.get("fetch", 0.0) + fetch_seconds
+            timings["render"] = timings.get("render", 0.0) + render_seconds
+            timings["write"] = timings.get("write", 0.0) + write_seconds
+        return count
+
+    @staticmethod
+    def _write_transcript_chunks(html_file, html_parts, record_file, record_parts):
+        html_file.write("".join(html_parts).encode("utf-8"))
+        record_file.write("".join(record_parts).encode("utf-8"))
+
+    @staticmethod
+    def _discard_transcript_files(writers):
+        for writer in writers:
+            if writer is not None:
+                writer.abort()
+
+    def _index_stored_transcript(self, html_filename: str) -> Optional[int]:
+        with self.storage.open_read(sidecar_path(Path(html_filename)).name) as f:
+            return self.search_index.index_record(html_filename, f)
+
+    async def transcript_file(self, html_filename: str) -> discord.File:
+        """The saved page as an upload, straight from disk when storage is local"""
+        path = self.storage.local_path(html_filename)
+        if path is not None:
+            return discord.File(path, filename=html_filename)
+        data = await self.transcript_jobs.run_io(self.storage.read_bytes, html_filename)
+        return discord.File(io.BytesIO(data), filename=html_filename)
+
+    async def generate_transcript(self, channel: discord.TextChannel, generator: Optional[str] = None):
+        """Generate HTML transcript and save to directory"""
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        try:
             # Create filename
             timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
             html_filename = f"transcript-{channel.name}-{timestamp}.html"
             
-            html_filepath = self.transcripts_dir / html_filename
-            
             # Ensure directory exists
-            self.transcripts_dir.mkdir(exist_ok=True)
+            await self.transcript_jobs.run_io(self._ensure_directory, self.transcripts_dir)
             
-            # Save file
-            with open(html_filepath, "w", encoding="utf-8") as f:
-                f.write(html_content)
+            # Stream the page and its message record to storage
+            message_count = await self.write_transcript_stream(channel, html_filename, timings)
+            file_size = (await self.transcript_jobs.run_io(self.storage.stat, html_filename)).size
             
-            print(f"Saved file: {html_filepath}")
-            print(f"Files in transcripts directory: {[f.name for f in self.transcripts_dir.glob('*')]}")
-
-            # Verify file was created
-            if html_filepath.exists():
-                print(f"✅ File successfully created: {html_filepath}")
-                print(f"✅ File size: {html_filepath.stat().st_size} bytes")
-            else:
-                print(f"❌ File was not created: {html_filepath}")
+            # Compress once here so the web app never compresses per request
+            encodings = []
+            stage_start = time.perf_counter()
+            try:
+                encodings = await self.transcript_jobs.run_io(compress_stored, self.storage, html_filename)
+            except Exception as e:
+                print(f"❌ Error compressing transcript: {e}")
+            timings["compress"] = time.perf_counter() - stage_start
+            
+            # Add it to the catalog the web app lists transcripts from
+            created_at = int(time.time())
+            stage_start = time.perf_counter()
+            try:
+                await self.transcript_jobs.run_io(
+                    self.catalog.record, html_filename, channel.name, channel.id, generator,
+                    created_at, file_size, message_count
+                )
+            except Exception as e:
+                print(f"❌ Error updating transcript catalog: {e}")
+            timings["catalog"] = time.perf_counter() - stage_start
+            
+            # Index message text for staff search, reading back the record just written
+            stage_start = time.perf_counter()
+            try:
+                await self.transcript_jobs.run_io(self._index_stored_transcript, html_filename)
+            except Exception as e:
+                print(f"❌ Error indexing transcript: {e}")
+            timings["index"] = time.perf_counter() - stage_start
+            
+            # Queue it for the web app; the push itself happens in the background, batched
+            if self.ingest.enabled:
+                try:
+                    await self.ingest.push({
+                        "filename": html_filename,
+                        "channel_name": channel.name,
+                        "channel_id": channel.id,
+                        "generator": generator,
+                        "created_at": created_at,
+                        "file_size": file_size,
+                        "message_count": message_count
+                    })
+                except Exception as e:
+                    print(f"❌ Error queueing transcript for the web app: {e}")
+            timings["total"] = time.perf_counter() - started
+            
+            for phase, seconds in timings.items():
+                TRANSCRIPT_PHASE_SECONDS.observe(seconds, phase=phase)
+            TRANSCRIPT_MESSAGES.observe(message_count)
+            TRANSCRIPTS_GENERATED.inc(result="ok")
             
             # Return URL and filename
             html_url = f"{self.website_url}/transcripts/{html_filename}"
-            print(f"✅ Generated URL: {html_url}")
+            log_event("transcript_generated", file=html_filename, channel=channel.name, messages=message_count,
+                      bytes=file_size, encodings=encodings,
+                      **{f"{phase}_ms": round(seconds * 1000, 1) for phase, seconds in timings.items()})
             
             return html_url, html_filename
             
         except Exception as e:
+            TRANSCRIPTS_GENERATED.inc(result="error")
             print(f"Error generating transcript: {e}")
             return None, None
 
     async def send_to_transcripts_channel(self, ctx, html_url, html_filename):
         """Send HTML transcript to the dedicated transcripts channel with embed and button"""
         try:
-            transcripts_channel = discord.utils.get(ctx.guild.text_channels, name=self.transcripts_channel_name)
+            transcripts_channel = self._get_transcripts_channel(ctx.guild)
             if not transcripts_channel:
                 print(f"Transcripts channel '{self.transcripts_channel_name}' not found!")
                 return False
@@ -326,12 +811,14 @@ class TicketBot(commands.Cog):
             embed.add_field(name="🗓️ Generated", value=f"<t:{int(datetime.now().timestamp())}:R>", inline=False)
             embed.set_footer(text=f"Channel ID: {ctx.channel.id}")
             
-            # Send embed with button and file
-            await transcripts_channel.send(
-                embed=embed,
-                view=TranscriptView(html_url),
-                file=discord.File(self.transcripts_dir / html_filename, filename=html_filename)
-            )
+            # Send embed with button and file; uploads are background work
+            with TRANSCRIPT_PHASE_SECONDS.time(phase="upload"):
+                file = await self.transcript_file(html_filename)
+                await self.channel_call(transcripts_channel, lambda: transcripts_channel.send(
+                    embed=embed,
+                    view=TranscriptView(html_url),
+                    file=file
+                ))
             return True
             
         except Exception as e:
@@ -341,7 +828,7 @@ class TicketBot(commands.Cog):
     async def send_to_transcripts_channel_interaction(self, interaction, html_url, html_filename):
         """Send HTML transcript to the dedicated transcripts channel with embed and button (for interactions)"""
         try:
-            transcripts_channel = discord.utils.get(interaction.guild.text_channels, name=self.transcripts_channel_name)
+            transcripts_channel = self._get_transcripts_channel(interaction.guild)
             if not transcripts_channel:
                 print(f"Transcripts channel '{self.transcripts_channel_name}' not found!")
                 return False
@@ -358,41 +845,63 @@ class TicketBot(commands.Cog):
             embed.add_field(name="🗓️ Generated", value=f"<t:{int(datetime.now().timestamp())}:R>", inline=False)
             embed.set_footer(text=f"Channel ID: {interaction.channel.id} | Generated by {interaction.user.display_name}")
             
-            # Send embed with button and file
-            await transcripts_channel.send(
-                embed=embed,
-                view=TranscriptView(html_url),
-                file=discord.File(self.transcripts_dir / html_filename, filename=html_filename)
-            )
+            # Send embed with button and file; uploads are background work
+            with TRANSCRIPT_PHASE_SECONDS.time(phase="upload"):
+                file = await self.transcript_file(html_filename)
+                await self.channel_call(transcripts_channel, lambda: transcripts_channel.send(
+                    embed=embed,
+                    view=TranscriptView(html_url),
+                    file=file
+                ))
             return True
             
         except Exception as e:
             print(f"Error sending to transcripts channel: {e}")
             return False
 
+    async def _run_transcript_job(self, ctx_or_interaction, is_interaction):
+        """Generate a transcript and post it to the transcripts channel (runs on the job queue)"""
+        if is_interaction:
+            generator = ctx_or_interaction.user.display_name
+        else:
+            generator = ctx_or_interaction.author.display_name
+        html_url, html_filename = await self.generate_transcript(ctx_or_interaction.channel, generator)
+        if not html_url:
+            return None, None, False
+        
+        if is_interaction:
+            success = await self.send_to_transcripts_channel_interaction(ctx_or_interaction, html_url, html_filename)
+        else:
+            success = await self.send_to_transcripts_channel(ctx_or_interaction, html_url, html_filename)
+        return html_url, html_filename, success
+
+    def queue_transcript(self, ctx_or_interaction, is_interaction=False):
+        """Queue a transcript for the channel, joining any job already pending for it.
+
+        Returns the job future, which resolves to (html_url, html_filename, sent),
+        and whether the request was coalesced into an existing job.
+        """
+        return self.transcript_jobs.submit(
+            ctx_or_interaction.channel.id,
+            lambda: self._run_transcript_job(ctx_or_interaction, is_interaction)
+        )
+
     async def handle_transcript_generation(self, ctx_or_interaction, is_interaction=False):
         """Handle transcript generation for both commands and buttons"""
         try:
             if is_interaction:
-                channel = ctx_or_interaction.channel
-                send_response = ctx_or_interaction.followup.send
+                send_response = functools.partial(self.followup, ctx_or_interaction)
             else:
-                channel = ctx_or_interaction.channel
                 send_response = ctx_or_interaction.send
             
-            # Generate transcript
-            html_url, html_filename = await self.generate_transcript(channel)
+            # Generate transcript and send it to the transcripts channel
+            future, _ = self.queue_transcript(ctx_or_interaction, is_interaction)
+            html_url, html_filename, success = await future
             
             if not html_url:
                 await send_response("❌ Failed to generate transcript.", ephemeral=is_interaction)
                 return
             
-            # Send to transcripts channel
-            if is_interaction:
-                success = await self.send_to_transcripts_channel_interaction(ctx_or_interaction, html_url, html_filename)
-            else:
-                success = await self.send_to_transcripts_channel(ctx_or_interaction, html_url, html_filename)
-            
             if success:
                 await send_response(
                     f"✅ Transcript generated and sent to <#{self._get_transcripts_channel_id(ctx_or_interaction.guild)}>!",
@@ -407,14 +916,18 @@ class TicketBot(commands.Cog):
         except Exception as e:
             error_msg = f"❌ Error generating transcript: {str(e)}"
             if is_interaction:
-                await ctx_or_interaction.followup.send(error_msg, ephemeral=True)
+                await self.followup(ctx_or_interaction, error_msg, ephemeral=True)
             else:
                 await ctx_or_interaction.send(error_msg, delete_after=15)
 
+    def _get_transcripts_channel(self, guild):
+        """Get the transcripts channel from the guild snapshot"""
+        channel_id = self.guild_snapshot(guild).transcripts_channel_id
+        return guild.get_channel(channel_id) if channel_id else None
+
     def _get_transcripts_channel_id(self, guild):
         """Get the transcripts channel ID"""
-        channel = discord.utils.get(guild.text_channels, name=self.transcripts_channel_name)
-        return channel.id if channel else 0
+        return self.guild_snapshot(guild).transcripts_channel_id or 0
 
     @commands.command()
     @commands.has_permissions(administrator=True)
@@ -432,29 +945,58 @@ class TicketBot(commands.Cog):
         )
         await ctx.send(embed=embed, view=TicketPanelView())
 
+    @commands.command(name="reststats")
+    @commands.has_permissions(administrator=True)
+    async def rest_stats(self, ctx):
+        """Show the REST scheduler's queue depth and recent wait times"""
+        stats = self.rest.stats()
+        embed = discord.Embed(title="REST Scheduler", color=discord.Color.blue())
+        embed.add_field(name="Queued", value=", ".join(f"{name}: {count}" for name, count in stats["queued"].items()),
+                        inline=False)
+        embed.add_field(name="Running", value=str(stats["running"]), inline=True)
+        embed.add_field(name="Completed", value=str(stats["completed"]), inline=True)
+        embed.add_field(name="Merged", value=str(stats["merged"]), inline=True)
+        for name, waits in stats["waits"].items():
+            embed.add_field(
+                name=f"Wait ({name})",
+                value=f"avg {waits['avg_ms']}ms, p95 {waits['p95_ms']}ms, max {waits['max_ms']}ms ({waits['samples']} samples)",
+                inline=False
+            )
+        if stats["busiest_buckets"]:
+            embed.add_field(name="Busiest buckets",
+                            value="\n".join(f"`{bucket}`: {count}" for bucket, count in stats["busiest_buckets"]),
+                            inline=False)
+        await ctx.send(embed=embed)
+
     async def process_ticket_form(self, interaction: discord.Interaction, ticket_type: str, 
                                 your_side: str, their_side: str, their_id: str, tip: str = None):
-        category = discord.utils.get(interaction.guild.categories, name=self.ticket_category_name)
+        timings = {}
+        stage_start = started = time.perf_counter()
+        snapshot = self.guild_snapshot(interaction.guild)
+        category = interaction.guild.get_channel(snapshot.ticket_category_id) if snapshot.ticket_category_id else None
         if not category:
-            await interaction.followup.send("Ticket system not configured. Use `$setup` first.", ephemeral=True)
+            await self.followup(interaction, "Ticket system not configured. Use `$setup` first.", ephemeral=True)
             return
 
         role_name = self.support_roles.get(ticket_type)
         if not role_name:
-            await interaction.followup.send("Invalid ticket type selected.", ephemeral=True)
+            await self.followup(interaction, "Invalid ticket type selected.", ephemeral=True)
             return
 
         try:
             their_id = int(their_id)
             other_user = interaction.guild.get_member(their_id)
             if not other_user:
-                await interaction.followup.send("Couldn't find that user in this server.", ephemeral=True)
+                await self.followup(interaction, "Couldn't find that user in this server.", ephemeral=True)
                 return
         except ValueError:
-            await interaction.followup.send("Invalid user ID format. Please provide a numeric Discord ID.", ephemeral=True)
+            await self.followup(interaction, "Invalid user ID format. Please provide a numeric Discord ID.", ephemeral=True)
             return
 
+        # Everything that doesn't need the channel is built before creating it
         channel_name = f"{ticket_type}-{self.ticket_counter}"
+        self.ticket_counter += 1  # reserved now so concurrent submissions get distinct names
+        self.state_store.set_value("ticket_counter", self.ticket_counter)
         overwrites = {
             interaction.guild.default_role: discord.PermissionOverwrite(read_messages=False),
             interaction.user: discord.PermissionOverwrite(read_messages=True, send_messages=True),
@@ -462,24 +1004,11 @@ class TicketBot(commands.Cog):
             interaction.guild.me: discord.PermissionOverwrite(read_messages=True, manage_channels=True)
         }
         
-        for role in self.support_roles.values():
-            support_role = discord.utils.get(interaction.guild.roles, name=role)
-            if support_role:
-                overwrites[support_role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+        support_roles = self.support_role_objects(interaction.guild)
+        for support_role in support_roles:
+            overwrites[support_role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
 
-        ticket_channel = await category.create_text_channel(
-            channel_name,
-            overwrites=overwrites
-        )
-        self.ticket_counter += 1
-        self.TICKET_CATEGORY_ID = category.id
-        self.ticket_members[ticket_channel.id] = [interaction.user.id, other_user.id]
-
-        ping_roles = []
-        for role in self.support_roles.values():
-            discord_role = discord.utils.get(interaction.guild.roles, name=role)
-            if discord_role:
-                ping_roles.append(discord_role.mention)
+        ping_roles = [support_role.mention for support_role in support_roles]
         
         trade_embed = discord.Embed(
             title="New Middleman Request",
@@ -492,15 +1021,35 @@ class TicketBot(commands.Cog):
             trade_embed.add_field(name="Tip", value=tip, inline=False)
         
         trade_embed.set_footer(text=f"Ticket created by {interaction.user.display_name}")
+        timings["prepare"] = time.perf_counter() - stage_start
         
-        await ticket_channel.send(
-            f"{interaction.user.mention} has requested a middleman service with {other_user.mention}!\n"
-            + " ".join(ping_roles),
-            embed=trade_embed
+        stage_start = time.perf_counter()
+        ticket_channel = await category.create_text_channel(
+            channel_name,
+            overwrites=overwrites
         )
+        timings["create_channel"] = time.perf_counter() - stage_start
+        self._set_ticket_category(category.id)
+        self.ticket_members[ticket_channel.id] = [interaction.user.id, other_user.id]
+        self._save_ticket_members(ticket_channel.id)
+        self.capture_log.start(ticket_channel.id)
         
-        await ticket_channel.send(view=TicketControlView())
-        await interaction.followup.send(f"Created your ticket: {ticket_channel.mention}", ephemeral=True)
+        # Ping, trade details and controls go out as one message, alongside the reply to the user
+        stage_start = time.perf_counter()
+        await asyncio.gather(
+            ticket_channel.send(
+                f"{interaction.user.mention} has requested a middleman service with {other_user.mention}!\n"
+                + " ".join(ping_roles),
+                embed=trade_embed,
+                view=TicketControlView()
+            ),
+            self.followup(interaction, f"Created your ticket: {ticket_channel.mention}", ephemeral=True)
+        )
+        timings["send"] = time.perf_counter() - stage_start
+        timings["total"] = time.perf_counter() - started
+        TICKET_EVENTS.inc(event="opened")
+        log_event("ticket_created", channel=ticket_channel.name,
+                  **{f"{stage}_ms": round(seconds * 1000, 1) for stage, seconds in timings.items()})
 
     @commands.command(name="rename")
     @commands.has_any_role("Trial Middleman", "Novice Middleman", "Advanced Middleman","Expert Middleman","Senior Middleman", "Head Middleman", "Middleman Team")
@@ -532,9 +1081,13 @@ class TicketBot(commands.Cog):
             await ctx.send("You don't have permission.", delete_after=10)
             return
 
-        await ctx.channel.set_permissions(member, read_messages=True, send_messages=True)
+        await self.channel_call(ctx.channel,
+                                lambda: ctx.channel.set_permissions(member, read_messages=True, send_messages=True),
+                                priority=INTERACTIVE, merge_key=("permissions", ctx.channel.id, member.id),
+                                merge_state="add")
         if member.id not in self.ticket_members.get(ctx.channel.id, []):
             self.ticket_members.setdefault(ctx.channel.id, []).append(member.id)
+            self._save_ticket_members(ctx.channel.id)
         await ctx.send(f"Added {member.mention} to ticket.")
 
     @commands.command()
@@ -546,11 +1099,76 @@ class TicketBot(commands.Cog):
             await ctx.send("You don't have permission.", delete_after=10)
             return
 
-        await ctx.channel.set_permissions(member, read_messages=False, send_messages=False)
+        await self.channel_call(ctx.channel,
+                                lambda: ctx.channel.set_permissions(member, read_messages=False, send_messages=False),
+                                priority=INTERACTIVE, merge_key=("permissions", ctx.channel.id, member.id),
+                                merge_state="remove")
         if ctx.channel.id in self.ticket_members and member.id in self.ticket_members[ctx.channel.id]:
             self.ticket_members[ctx.channel.id].remove(member.id)
+            self._save_ticket_members(ctx.channel.id)
         await ctx.send(f"Removed {member.mention} from ticket.")
 
+    def ticket_overwrites(self, channel: discord.TextChannel, is_open: bool) -> Dict:
+        """Compute a ticket channel's overwrites for the open or closed state.
+
+        Starts from the channel's current overwrites. Opening allows the ticket
+        members and support roles; closing denies every non-staff member and
+        role that has an overwrite, plus the ticket members.
+        """
+        guild = channel.guild
+        snapshot = self.guild_snapshot(guild)
+        overwrites = {target: discord.PermissionOverwrite(**dict(overwrite))
+                      for target, overwrite in channel.overwrites.items()}
+        member_ids = self.ticket_members.get(channel.id, [])
+        
+        if is_open:
+            targets = [guild.get_member(member_id) or discord.Object(member_id, type=discord.Member)
+                       for member_id in member_ids]
+            targets += self.support_role_objects(guild)
+            for target in targets:
+                overwrite = overwrites.setdefault(target, discord.PermissionOverwrite())
+                overwrite.update(read_messages=True, send_messages=True)
+            return overwrites
+        
+        overwritten_ids = {target.id for target in overwrites}
+        for member_id in member_ids:
+            if member_id not in overwritten_ids:
+                overwrites[guild.get_member(member_id) or discord.Object(member_id, type=discord.Member)] = \
+                    discord.PermissionOverwrite()
+        for target, overwrite in overwrites.items():
+            if target.id == guild.me.id or target.id in snapshot.support_role_id_set:
+                continue
+            if isinstance(target, discord.Member) and (target.guild_permissions.administrator
+                                                       or not snapshot.support_role_id_set.isdisjoint(target._roles)):
+                continue
+            if isinstance(target, discord.Role) and target.permissions.administrator:
+                continue
+            if target.id == guild.default_role.id:
+                overwrite.update(read_messages=False)
+            else:
+                overwrite.update(read_messages=False, send_messages=False)
+        return overwrites
+
+    async def apply_ticket_overwrites(self, channel: discord.TextChannel, is_open: bool, reason: str) -> float:
+        """Open or close a ticket with a single channel edit; returns the seconds it took.
+
+        Overwrites are computed when the edit is dispatched. A repeated close
+        (or open) is merged into the newest one still waiting, unless the
+        opposite edit was queued after it, so the latest request always wins.
+        """
+        start = time.perf_counter()
+        
+        async def edit():
+            overwrites = self.ticket_overwrites(channel, is_open)
+            await channel.edit(overwrites=overwrites, reason=reason)
+            return len(overwrites)
+        
+        count = await self.channel_call(channel, edit, priority=INTERACTIVE, merge_key=("overwrites", channel.id),
+                                        merge_state=is_open)
+        elapsed = time.perf_counter() - start
+        print(f"🔒 {'Opened' if is_open else 'Closed'} {channel.name}: {count} overwrites in {elapsed:.2f}s")
+        return elapsed
+
     @commands.command()
     async def open(self, ctx):
         if not await self.is_ticket_channel(ctx.channel):
@@ -560,40 +1178,24 @@ class TicketBot(commands.Cog):
             await ctx.send("You don't have permission.", delete_after=10)
             return
 
-        if ctx.channel.id in self.ticket_members:
-            for member_id in self.ticket_members[ctx.channel.id]:
-                member = ctx.guild.get_member(member_id)
-                if member:
-                    await ctx.channel.set_permissions(member, read_messages=True, send_messages=True)
-        
-        for role_name in self.support_roles.values():
-            role = discord.utils.get(ctx.guild.roles, name=role_name)
-            if role:
-                await ctx.channel.set_permissions(role, read_messages=True, send_messages=True)
-        
-        await ctx.send(f"Ticket reopened by {ctx.author.mention}", view=TicketControlView())
+        elapsed = await self.apply_ticket_overwrites(ctx.channel, is_open=True, reason=f"Reopened by {ctx.author}")
+        TICKET_EVENTS.inc(event="reopened")
+        await ctx.send(f"Ticket reopened by {ctx.author.mention} (permissions updated in {elapsed:.2f}s)",
+                       view=TicketControlView())
 
     async def open_ticket_button(self, interaction: discord.Interaction):
         if not await self.is_ticket_channel(interaction.channel):
-            await interaction.followup.send("Not a ticket channel.", ephemeral=True)
+            await self.followup(interaction, "Not a ticket channel.", ephemeral=True)
             return
         if not await self.has_permission(interaction.user):
-            await interaction.followup.send("You don't have permission.", ephemeral=True)
+            await self.followup(interaction, "You don't have permission.", ephemeral=True)
             return
 
-        if interaction.channel.id in self.ticket_members:
-            for member_id in self.ticket_members[interaction.channel.id]:
-                member = interaction.guild.get_member(member_id)
-                if member:
-                    await interaction.channel.set_permissions(member, read_messages=True, send_messages=True)
-        
-        for role_name in self.support_roles.values():
-            role = discord.utils.get(interaction.guild.roles, name=role_name)
-            if role:
-                await interaction.channel.set_permissions(role, read_messages=True, send_messages=True)
-        
+        elapsed = await self.apply_ticket_overwrites(interaction.channel, is_open=True,
+                                                     reason=f"Reopened by {interaction.user}")
+        TICKET_EVENTS.inc(event="reopened")
         await interaction.channel.send(f"Ticket reopened by {interaction.user.mention}", view=TicketControlView())
-        await interaction.followup.send("Ticket reopened.", ephemeral=True)
+        await self.followup(interaction, f"Ticket reopened. Permissions updated in {elapsed:.2f}s.", ephemeral=True)
 
     @commands.command()
     async def close(self, ctx):
@@ -604,48 +1206,49 @@ class TicketBot(commands.Cog):
             await ctx.send("You don't have permission.", delete_after=10)
             return
 
+        elapsed = await self.apply_ticket_overwrites(ctx.channel, is_open=False, reason=f"Closed by {ctx.author}")
+        TICKET_EVENTS.inc(event="closed")
         embed = discord.Embed(
             title="Ticket Closed",
             description=f"Closed by {ctx.author.mention}",
             color=discord.Color.red()
         )
+        embed.set_footer(text=f"Permissions updated in {elapsed:.2f}s")
         await ctx.send(embed=embed, view=TicketOpenView())
-        
-        for member in ctx.guild.members:
-            if not await self.has_permission(member) and member != ctx.guild.me:
-                await ctx.channel.set_permissions(member, read_messages=False, send_messages=False)
 
     async def close_ticket(self, interaction: discord.Interaction):
         if not await self.is_ticket_channel(interaction.channel):
-            await interaction.followup.send("Not a ticket channel.", ephemeral=True)
+            await self.followup(interaction, "Not a ticket channel.", ephemeral=True)
             return
         if not await self.has_permission(interaction.user):
-            await interaction.followup.send("You don't have permission.", ephemeral=True)
+            await self.followup(interaction, "You don't have permission.", ephemeral=True)
             return
 
+        elapsed = await self.apply_ticket_overwrites(interaction.channel, is_open=False,
+                                                     reason=f"Closed by {interaction.user}")
+        TICKET_EVENTS.inc(event="closed")
         embed = discord.Embed(
             title="Ticket Closed",
             description=f"Closed by {interaction.user.mention}",
             color=discord.Color.red()
         )
+        embed.set_footer(text=f"Permissions updated in {elapsed:.2f}s")
         await interaction.channel.send(embed=embed, view=TicketOpenView())
-        
-        for member in interaction.guild.members:
-            if not await self.has_permission(member) and member != interaction.guild.me:
-                await interaction.channel.set_permissions(member, read_messages=False, send_messages=False)
-        
-        await interaction.followup.send("Ticket closed.", ephemeral=True)
+        await self.followup(interaction, f"Ticket closed. Permissions updated in {elapsed:.2f}s.", ephemeral=True)
 
     async def generate_transcript_button(self, interaction: discord.Interaction):
         """Button handler for generating transcripts - shows only one ephemeral message"""
         if not await self.is_ticket_channel(interaction.channel):
-            await interaction.followup.send("Not a ticket channel.", ephemeral=True)
+            await self.followup(interaction, "Not a ticket channel.", ephemeral=True)
             return
         if not await self.has_permission(interaction.user):
-            await interaction.followup.send("You don't have permission.", ephemeral=True)
+            await self.followup(interaction, "You don't have permission.", ephemeral=True)
             return
 
-        await interaction.followup.send("🔄 Generating transcript...", ephemeral=True)
+        if self.transcript_jobs.status(interaction.channel.id):
+            await self.followup(interaction, "🔄 A transcript is already being generated for this ticket...", ephemeral=True)
+        else:
+            await self.followup(interaction, "🔄 Generating transcript...", ephemeral=True)
         await self.handle_transcript_generation(interaction, is_interaction=True)
 
     @commands.command()
@@ -671,11 +1274,10 @@ class TicketBot(commands.Cog):
         try:
             # Generate transcript first
             transcript_msg = await ctx.send("🔄 Generating transcript before deletion...")
-            html_url, html_filename = await self.generate_transcript(ctx.channel)
+            future, _ = self.queue_transcript(ctx, is_interaction=False)
+            html_url, html_filename, success = await future
             
             if html_url:
-                # Send to transcripts channel
-                success = await self.send_to_transcripts_channel(ctx, html_url, html_filename)
                 if success:
                     await ctx.send(f"✅ Transcript saved to <#{self._get_transcripts_channel_id(ctx.guild)}>")
                 else:
@@ -684,54 +1286,55 @@ class TicketBot(commands.Cog):
                 await ctx.send("❌ Failed to generate transcript, but will proceed with deletion.")
             
             # Add 5-second delay before deletion
-            await ctx.send("🗑️ Channel will be deleted in 5 seconds...")
+            await self.channel_call(ctx.channel, lambda: ctx.send("🗑️ Channel will be deleted in 5 seconds..."))
             await asyncio.sleep(5)
             
-            # Delete the channel
-            if ctx.channel.id in self.ticket_members:
-                del self.ticket_members[ctx.channel.id]
-            await ctx.channel.delete()
+            # Delete the channel; concurrent deletes of the same ticket send one request
+            self._forget_ticket(ctx.channel.id)
+            await self.channel_call(ctx.channel, ctx.channel.delete, merge_key=("delete", ctx.channel.id))
+            TICKET_EVENTS.inc(event="deleted")
             
         except Exception as e:
             await ctx.send(f"❌ Error during deletion: {e}")
 
     async def delete_ticket(self, interaction: discord.Interaction):
         if not await self.is_ticket_channel(interaction.channel):
-            await interaction.followup.send("Not a ticket channel.", ephemeral=True)
+            await self.followup(interaction, "Not a ticket channel.", ephemeral=True)
             return
         if not await self.has_permission(interaction.user):
-            await interaction.followup.send("You don't have permission.", ephemeral=True)
+            await self.followup(interaction, "You don't have permission.", ephemeral=True)
             return
 
         try:
             # Generate transcript first
-            await interaction.followup.send("🔄 Generating transcript before deletion...", ephemeral=True)
-            html_url, html_filename = await self.generate_transcript(interaction.channel)
+            await self.followup(interaction, "🔄 Generating transcript before deletion...", ephemeral=True)
+            future, _ = self.queue_transcript(interaction, is_interaction=True)
+            html_url, html_filename, success = await future
             
             if html_url:
-                # Send to transcripts channel
-                success = await self.send_to_transcripts_channel_interaction(interaction, html_url, html_filename)
                 if success:
-                    await interaction.followup.send(
+                    await self.followup(interaction, 
                         f"✅ Transcript saved to <#{self._get_transcripts_channel_id(interaction.guild)}>",
                         ephemeral=True
                     )
                 else:
-                    await interaction.followup.send("✅ Transcript generated locally", ephemeral=True)
+                    await self.followup(interaction, "✅ Transcript generated locally", ephemeral=True)
             else:
-                await interaction.followup.send("❌ Failed to generate transcript, but will proceed with deletion.", ephemeral=True)
+                await self.followup(interaction, "❌ Failed to generate transcript, but will proceed with deletion.", ephemeral=True)
             
             # Add 5-second delay before deletion
-            await interaction.channel.send("🗑️ Channel will be deleted in 5 seconds...")
+            await self.channel_call(interaction.channel,
+                                    lambda: interaction.channel.send("🗑️ Channel will be deleted in 5 seconds..."))
             await asyncio.sleep(5)
             
-            # Delete the channel
-            if interaction.channel.id in self.ticket_members:
-                del self.ticket_members[interaction.channel.id]
-            await interaction.channel.delete()
+            # Delete the channel; concurrent deletes of the same ticket send one request
+            self._forget_ticket(interaction.channel.id)
+            await self.channel_call(interaction.channel, interaction.channel.delete,
+                                    merge_key=("delete", interaction.channel.id))
+            TICKET_EVENTS.inc(event="deleted")
             
         except Exception as e:
-            await interaction.followup.send(f"❌ Error during deletion: {e}", ephemeral=True)
+            await self.followup(interaction, f"❌ Error during deletion: {e}", ephemeral=True)
 
     @commands.command()
     @commands.has_permissions(administrator=True)
@@ -773,7 +1376,7 @@ class TicketBot(commands.Cog):
                     overwrites=overwrites,
                     reason="Ticket system setup"
                 )
-                self.TICKET_CATEGORY_ID = category.id
+                self._set_ticket_category(category.id)
                 await ctx.send(f"Created ticket category: {category.name}")
             except Exception as e:
                 await ctx.send(f"Failed to create category: {e}")
@@ -800,14 +1403,96 @@ class TicketBot(commands.Cog):
                 await ctx.send(f"Failed to create transcripts channel: {e}")
                 return
 
+        self._invalidate_snapshot(ctx.guild)
         await ctx.send(
             "Ticket system setup complete!\n"
             f"Roles: {', '.join(created_roles)}\n"
             "Assign these roles to your middleman team."
         )
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Anything sent while disconnected is backfilled from the API on demand
+        self.capture_log.new_session(self._capture_since())
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        if not self.capture_log.has_log(payload.channel_id):
+            return
+        message = getattr(payload, "message", None)
+        if message is None:
+            channel = self.bot.get_channel(payload.channel_id)
+            if channel is None:
+                return
+            try:
+                message = await channel.fetch_message(payload.message_id)
+            except discord.HTTPException:
+                return
+        self.capture_log.append(payload.channel_id, "edit", message.id, self._message_record(message))
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.capture_log.append(payload.channel_id, "delete", payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        for message_id in payload.message_ids:
+            self.capture_log.append(payload.channel_id, "delete", message_id)
+
+    def _is_snapshot_channel(self, channel) -> bool:
+        """Whether a channel is (or was) the ticket category or transcripts channel"""
+        snapshot = self.guild_snapshots.get(channel.guild.id)
+        if snapshot and channel.id in (snapshot.ticket_category_id, snapshot.transcripts_channel_id):
+            return True
+        if isinstance(channel, discord.CategoryChannel):
+            return channel.name == self.ticket_category_name
+        return isinstance(channel, discord.TextChannel) and channel.name == self.transcripts_channel_name
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: discord.Role):
+        if role.name in self.support_roles.values():
+            self._invalidate_snapshot(role.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if before.name != after.name and (before.name in self.support_roles.values()
+                                          or after.name in self.support_roles.values()):
+            self._invalidate_snapshot(after.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role):
+        snapshot = self.guild_snapshots.get(role.guild.id)
+        if snapshot and role.id in snapshot.support_role_id_set:
+            self._invalidate_snapshot(role.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        if self._is_snapshot_channel(channel):
+            self._invalidate_snapshot(channel.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        if before.name != after.name and (self._is_snapshot_channel(before) or self._is_snapshot_channel(after)):
+            self._invalidate_snapshot(after.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.capture_log.discard(channel.id)
+        if channel.id in self.ticket_members:
+            self._forget_ticket(channel.id)
+        if self._is_snapshot_channel(channel):
+            self._invalidate_snapshot(channel.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self._invalidate_snapshot(guild)
+
     @commands.Cog.listener()
     async def on_message(self, message):
+        # Record ticket messages (including the bot's own) in the capture log
+        if message.guild is not None:
+            self.capture_log.append(message.channel.id, "create", message.id, self._message_record(message))
+        
         # Ignore the bot's own messages
         if message.author == self.bot.user:
             return
@@ -854,6 +1539,13 @@ async def main():
         exit(1)
     
     await setup(bot)
+    
+    # Close cleanly on SIGTERM (e.g. a redeploy) so queued transcripts are drained
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+    except NotImplementedError:
+        pass
+    
     await bot.start(bot_token)
 
 if __name__ == "__main__":
@@ -0,0 +1,207 @@
+"""Counters, histograms and sampled structured logs for the bot and web app.
+
+Each process keeps its metrics in memory in the module-level ``REGISTRY``
+and exposes ``REGISTRY.render()`` in the Prometheus text format: the web
+app on ``/metrics``, the bot on a small HTTP listener when ``METRICS_PORT``
+is set. Both require ``Authorization: Bearer <METRICS_TOKEN>`` and stay
+closed when no token is configured. Under gunicorn every worker has its own registry, so a scrape sees
+the worker that answered it.
+
+``log_event`` writes one JSON object per line to stdout. Callers pass a
+sample rate, so per-request events cost nothing most of the time while
+errors and rare events are always logged.
+"""
+import hmac
+import json
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; wide enough for both a single request and a 100k-message transcript
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self.samples()
+
+    def samples(self):
+        return iter(())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """A value read when the registry is rendered, from ``func`` returning {label values: value}"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str], func: Callable[[], Dict[Tuple, float]]):
+        super().__init__(name, help_text, labelnames)
+        self.func = func
+
+    def samples(self):
+        for key, value in self.func().items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [per-bucket counts, sum, count]
+        self.series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time spent in the ``with`` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self.lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self.series.items()]
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, labelnames: Iterable[str],
+              func: Callable[[], Dict[Tuple, float]]) -> Gauge:
+        return self._add(Gauge(name, help_text, labelnames, func))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def bearer_matches(authorization: Optional[str], token: Optional[str]) -> bool:
+    """Whether an Authorization header carries `token`; always False when no token is set"""
+    if not token:
+        return False
+    return hmac.compare_digest((authorization or "").encode("utf-8"), f"Bearer {token}".encode("utf-8"))
+
+
+def log_event(event: str, sample_rate: float = 1.0, **fields):
+    """Write one structured log line, keeping only `sample_rate` of the calls"""
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    record = {"ts": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z", "event": event}
+    if sample_rate < 1.0:
+        record["sample_rate"] = sample_rate
+    record.update(fields)
+    print(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str), flush=True)
+
+
+async def start_metrics_server(registry: Registry, port: int, token: str, host: str = "0.0.0.0"):
+    """Serve ``/metrics`` from the running event loop (bot side); returns the runner to clean up"""
+    from aiohttp import web
+
+    async def handle(request):
+        if not bearer_matches(request.headers.get("Authorization"), token):
+            return web.Response(status=401, headers={"WWW-Authenticate": "Bearer"})
+        return web.Response(body=registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    web_app = web.Application()
+    web_app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(web_app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
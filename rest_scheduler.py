@@ -0,0 +1,174 @@
+"""Priority scheduler for the bot's Discord REST calls.
+
+Calls are queued under a route bucket such as ``channel:<id>``. Calls in
+one bucket run one at a time, mirroring Discord's per-route rate limits.
+At most ``concurrency`` calls run at once across all buckets, which keeps
+bursts below the global limit. When a slot frees up, the waiting call with
+the best priority whose bucket is idle runs next, so interaction work is
+never stuck behind transcript uploads.
+
+``merge_key`` names what a call changes (a channel's overwrites, one
+member's permissions) and ``merge_state`` what it changes it to. A call
+joins the newest pending call for its key when both set the same state,
+and both callers get the result of the single request that is sent. A call
+for another state is queued after it instead, so calls for one key still
+run in the order they were made and the latest one wins.
+
+``stats()`` reports queue depth and recent wait times.
+"""
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Number of recent wait times kept per priority
+WAIT_SAMPLES = 256
+
+
+class RestCall:
+    def __init__(self, bucket: str, factory: Callable[[], Awaitable], priority: int,
+                 merge_key: Optional[Hashable], merge_state: Optional[Hashable], future: asyncio.Future, seq: int):
+        self.bucket = bucket
+        self.factory = factory
+        self.priority = priority
+        self.merge_key = merge_key
+        self.merge_state = merge_state
+        self.future = future
+        self.seq = seq
+        self.queued_at = time.monotonic()
+
+
+class RestScheduler:
+    def __init__(self, concurrency: int = 4):
+        self.concurrency = max(1, concurrency)
+        self.pending: List[RestCall] = []
+        self.busy_buckets = set()
+        # merge_key -> calls for it that have not started yet, oldest first
+        self.merged: Dict[Hashable, List[RestCall]] = {}
+        self.waits: Dict[int, Deque[float]] = {priority: deque(maxlen=WAIT_SAMPLES) for priority in PRIORITY_NAMES}
+        self.completed = 0
+        self.merged_count = 0
+        self._seq = itertools.count()
+        self._changed: Optional[asyncio.Condition] = None
+        self._workers = []
+
+    def start(self):
+        """Start the dispatch tasks on the running event loop"""
+        self._changed = asyncio.Condition()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def run(self, bucket: str, factory: Callable[[], Awaitable], priority: int = BACKGROUND,
+                  merge_key: Optional[Hashable] = None, merge_state: Optional[Hashable] = None):
+        """Queue a call and wait for its result.
+
+        ``factory`` is only invoked when the call is dispatched, so it should
+        build its request from current state.
+        """
+        if self._changed is None:
+            # Not started (or already stopped): send directly
+            return await factory()
+
+        queued = self.merged.get(merge_key, []) if merge_key is not None else []
+        if queued and queued[-1].merge_state == merge_state:
+            existing = queued[-1]
+            existing.factory = factory
+            self._promote(queued, priority)
+            self.merged_count += 1
+            return await asyncio.shield(existing.future)
+
+        call = RestCall(bucket, factory, priority, merge_key, merge_state,
+                        asyncio.get_running_loop().create_future(), next(self._seq))
+        self.pending.append(call)
+        if merge_key is not None:
+            # Earlier calls for the key must not be overtaken by this one
+            self._promote(queued, priority)
+            self.merged.setdefault(merge_key, []).append(call)
+        async with self._changed:
+            self._changed.notify_all()
+        return await asyncio.shield(call.future)
+
+    @staticmethod
+    def _promote(calls: List[RestCall], priority: int):
+        for call in calls:
+            if priority < call.priority:
+                call.priority = priority
+
+    def _take_next(self) -> Optional[RestCall]:
+        ready = [call for call in self.pending if call.bucket not in self.busy_buckets]
+        if not ready:
+            return None
+        call = min(ready, key=lambda c: (c.priority, c.seq))
+        self.pending.remove(call)
+        if call.merge_key is not None:
+            queued = self.merged[call.merge_key]
+            queued.remove(call)
+            if not queued:
+                del self.merged[call.merge_key]
+        return call
+
+    async def _worker(self):
+        while True:
+            async with self._changed:
+                call = self._take_next()
+                while call is None:
+                    await self._changed.wait()
+                    call = self._take_next()
+                self.busy_buckets.add(call.bucket)
+
+            self.waits[call.priority].append(time.monotonic() - call.queued_at)
+            try:
+                result = await call.factory()
+            except Exception as e:
+                if not call.future.done():
+                    call.future.set_exception(e)
+            else:
+                if not call.future.done():
+                    call.future.set_result(result)
+            finally:
+                self.completed += 1
+                async with self._changed:
+                    self.busy_buckets.discard(call.bucket)
+                    self._changed.notify_all()
+
+    async def drain(self):
+        """Wait for every queued call to finish, then stop the dispatch tasks"""
+        if self._changed is not None:
+            async with self._changed:
+                while self.pending or self.busy_buckets:
+                    await self._changed.wait()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._changed = None
+
+    def stats(self) -> Dict:
+        """Queue depth per priority and bucket, and recent wait times in milliseconds"""
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        buckets: Dict[str, int] = {}
+        for call in self.pending:
+            depth[PRIORITY_NAMES[call.priority]] += 1
+            buckets[call.bucket] = buckets.get(call.bucket, 0) + 1
+
+        waits = {}
+        for priority, samples in self.waits.items():
+            ordered = sorted(samples)
+            waits[PRIORITY_NAMES[priority]] = {
+                "samples": len(ordered),
+                "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1) if ordered else 0.0,
+                "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1 if len(ordered) > 1 else 0] * 1000, 1) if ordered else 0.0,
+                "max_ms": round(ordered[-1] * 1000, 1) if ordered else 0.0
+            }
+        return {
+            "queued": depth,
+            "running": len(self.busy_buckets),
+            "busiest_buckets": sorted(buckets.items(), key=lambda item: -item[1])[:5],
+            "completed": self.completed,
+            "merged": self.merged_count,
+            "waits": waits
+        }
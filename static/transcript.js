@@ -0,0 +1,71 @@
+(function () {
+    var list = document.getElementById('messages');
+    var status = document.getElementById('load-more');
+    var next = status.dataset.next;
+    var loading = false;
+
+    function element(tag, className, text) {
+        var node = document.createElement(tag);
+        node.className = className;
+        if (text !== undefined) node.textContent = text;
+        return node;
+    }
+
+    function render(msg) {
+        var div = element('div', 'message');
+        div.id = 'm' + msg.position;
+        div.appendChild(element('div', 'timestamp', msg.timestamp));
+        div.appendChild(element('div', 'author', msg.author));
+        div.appendChild(element('div', 'content', msg.content));
+        if (msg.attachments && msg.attachments.length) {
+            var box = element('div', 'attachments');
+            msg.attachments.forEach(function (att) {
+                var link = element('a', 'attachment', '📎 ' + att.filename);
+                link.href = att.url;
+                link.target = '_blank';
+                box.appendChild(link);
+            });
+            div.appendChild(box);
+        }
+        return div;
+    }
+
+    // Deep links (#m123) keep loading pages until the message exists
+    function pendingAnchor() {
+        var match = /^#m(\d+)$/.exec(location.hash);
+        return match && !document.getElementById('m' + match[1]) ? match[1] : null;
+    }
+
+    function loadMore() {
+        if (loading || !next) return;
+        loading = true;
+        fetch(status.dataset.url + '?cursor=' + encodeURIComponent(next))
+            .then(function (response) { return response.json(); })
+            .then(function (page) {
+                var fragment = document.createDocumentFragment();
+                page.messages.forEach(function (msg) { fragment.appendChild(render(msg)); });
+                list.appendChild(fragment);
+                next = page.next_cursor;
+                loading = false;
+                if (!next) {
+                    observer.disconnect();
+                    status.remove();
+                }
+                if (pendingAnchor()) {
+                    loadMore();
+                } else if (/^#m\d+$/.test(location.hash)) {
+                    document.getElementById(location.hash.slice(1)).scrollIntoView();
+                }
+            })
+            .catch(function () {
+                loading = false;
+                status.textContent = 'Could not load more messages.';
+            });
+    }
+
+    var observer = new IntersectionObserver(function (entries) {
+        if (entries[0].isIntersecting) loadMore();
+    }, { rootMargin: '1000px' });
+    observer.observe(status);
+    if (pendingAnchor()) loadMore();
+})();
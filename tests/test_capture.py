@@ -0,0 +1,65 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+from ticket_capture import CaptureLog
+
+
+async def run_inline(func, *args):
+    return func(*args)
+
+
+class CaptureLogTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.log = CaptureLog(Path(self.dir.name))
+
+    async def asyncTearDown(self):
+        await self.log.close()
+        self.dir.cleanup()
+
+    def replay(self, channel_id):
+        index = self.log.index(channel_id)
+        ids = sorted(index.offsets)
+        return index, self.log.read_records(channel_id, [index.offsets[message_id] for message_id in ids])
+
+    async def test_writer_appends_in_background(self):
+        self.log.start_writer(run_inline)
+        self.log.start(100)
+        self.log.append(100, "create", 101, {"id": 101, "content": "a"})
+        self.assertFalse(self.log.path(100).exists())
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual(len(self.log.path(100).read_text().splitlines()), 2)
+
+    async def test_replay_applies_edits_and_deletes(self):
+        self.log.start(100)
+        self.log.append(100, "create", 102, {"id": 102, "content": "b"})
+        self.log.append(100, "create", 101, {"id": 101, "content": "a"})
+        self.log.append(100, "edit", 101, {"id": 101, "content": "a2"})
+        self.log.append(100, "create", 103, {"id": 103, "content": "c"})
+        self.log.append(100, "delete", 103)
+
+        index, records = self.replay(100)
+        self.assertEqual([r["content"] for r in records], ["a2", "b"])
+        self.assertEqual(index.deleted, {103})
+        self.assertEqual(index.gaps, [])
+
+    async def test_new_session_records_gap(self):
+        self.log.start(100)
+        self.log.append(100, "create", 101, {"id": 101})
+        self.log.new_session(150)
+        self.log.mark_session(100)
+        self.log.mark_session(100)
+        self.assertEqual(self.log.index(100).gaps, [(101, 150)])
+
+    async def test_discard_removes_log(self):
+        self.log.start(100)
+        self.log.discard(100)
+        self.assertIsNone(self.log.index(100))
+        self.assertFalse(self.log.path(100).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
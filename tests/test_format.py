@@ -0,0 +1,16 @@
+import unittest
+
+from transcript_format import channel_name_from_filename
+
+
+class ChannelNameTest(unittest.TestCase):
+    def test_strips_timestamp_only(self):
+        self.assertEqual(channel_name_from_filename("transcript-ticket-0007-20260101-120000.html"), "ticket-0007")
+        self.assertEqual(channel_name_from_filename("transcript-trade-2025-20250301-080910.html"), "trade-2025")
+
+    def test_without_timestamp(self):
+        self.assertEqual(channel_name_from_filename("transcript-legacy.html"), "legacy")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import hashlib
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+from transcript_attachments import attachment_storage
+from transcript_format import dump_header, dump_message
+from transcript_ingest import IngestClient, IngestLog, apply_batch, open_batch
+from transcript_storage import LocalStorage
+
+
+async def run_inline(func, *args):
+    return func(*args)
+
+
+class RetryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        root = Path(self.dir.name)
+        self.storage = LocalStorage(root)
+        self.client = IngestClient("http://web/api/ingest", "token", self.storage, root / "outbox.sqlite3",
+                                   max_backoff=0.01)
+        self.client._run_io = run_inline
+        for name in ("a.html", "b.html"):
+            with self.storage.open_write(name) as writer:
+                writer.write(b"<html></html>")
+            self.client.outbox.add({"filename": name})
+        self.posted = []
+
+    async def asyncTearDown(self):
+        self.dir.cleanup()
+
+    async def test_retry_rebuilds_batch_after_local_failure(self):
+        async def post(entries):
+            self.posted.append([entry["filename"] for entry in entries])
+            if len(self.posted) == 1:
+                # Expired by retention while the first attempt was streaming
+                self.storage.delete("a.html")
+                return 0, {"error": "a.html is shorter than when the batch was built"}, None
+            return 200, {"accepted": len(entries), "duplicates": 0}, None
+        self.client._post = post
+
+        self.assertTrue(await self.client._send_next_batch())
+        self.assertEqual(self.posted, [["a.html", "b.html"], ["b.html"]])
+        self.assertEqual(self.client.outbox.count(), 0)
+        self.assertEqual(self.client.dropped, 1)
+
+    async def test_server_errors_resend_the_same_batch(self):
+        async def post(entries):
+            self.posted.append([entry["filename"] for entry in entries])
+            if len(self.posted) == 1:
+                return 503, {"error": "unavailable"}, None
+            return 200, {"accepted": len(entries), "duplicates": 0}, None
+        self.client._post = post
+
+        self.assertTrue(await self.client._send_next_batch())
+        self.assertEqual(self.posted, [["a.html", "b.html"], ["a.html", "b.html"]])
+
+
+class AttachmentBatchTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        root = Path(self.dir.name)
+        self.bot_storage = LocalStorage(root / "bot")
+        self.web_storage = LocalStorage(root / "web")
+        (root / "bot").mkdir()
+        (root / "web").mkdir()
+        self.client = IngestClient("http://web/api/ingest", "token", self.bot_storage, root / "outbox.sqlite3")
+        self.client._run_io = run_inline
+        self.ingest_log = IngestLog(root / "web" / "ingested.sqlite3")
+
+        self.blob = b"\x89PNG screenshot"
+        self.name = hashlib.sha256(self.blob).hexdigest() + ".png"
+        with attachment_storage(self.bot_storage).open_write(self.name) as writer:
+            writer.write(self.blob)
+        message = {"author": "a", "content": "proof", "timestamp": "t",
+                   "attachments": [{"url": f"https://web/attachments/{self.name}", "filename": "proof.png"},
+                                   {"url": "https://cdn.example/expired.png", "filename": "expired.png"}]}
+        with self.bot_storage.open_write("t.jsonl") as writer:
+            writer.write((dump_header("t", 1, "now") + dump_message(message)).encode())
+        with self.bot_storage.open_write("t.html") as writer:
+            writer.write(b"<html></html>")
+        self.client.outbox.add({"filename": "t.html"})
+
+    async def asyncTearDown(self):
+        self.dir.cleanup()
+
+    async def send(self, entries):
+        body = b"".join([chunk async for chunk in self.client._stream_batch(entries)])
+        return apply_batch(open_batch(io.BytesIO(body), "gzip"), self.web_storage, self.ingest_log, lambda e: None)
+
+    async def test_linked_attachments_are_sent_and_stored(self):
+        entries = self.client._build_batch()
+        self.assertEqual([item["name"] for item in entries[0]["files"]], [self.name, "t.jsonl", "t.html"])
+        self.assertEqual(await self.send(entries), {"accepted": 1, "duplicates": 0})
+        self.assertEqual(attachment_storage(self.web_storage).read_bytes(self.name), self.blob)
+
+    async def test_attachment_must_match_its_hash(self):
+        entries = self.client._build_batch()
+        with attachment_storage(self.bot_storage).open_write(self.name) as writer:
+            writer.write(b"\x89PNG tampered!!")
+        with self.assertRaises(ValueError):
+            await self.send(entries)
+        self.assertIsNone(attachment_storage(self.web_storage).stat(self.name))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+
+from rest_scheduler import BACKGROUND, INTERACTIVE, RestScheduler
+
+
+class MergeOrderTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.scheduler = RestScheduler(concurrency=1)
+        self.scheduler.start()
+        self.order = []
+        self.release = asyncio.Event()
+
+    async def asyncTearDown(self):
+        self.release.set()
+        await self.scheduler.drain()
+
+    def call(self, name, wait=False):
+        async def factory():
+            if wait:
+                await self.release.wait()
+            self.order.append(name)
+            return name
+        return factory
+
+    async def queue(self, name, merge_key=None, merge_state=None, priority=INTERACTIVE):
+        task = asyncio.create_task(self.scheduler.run("channel:1", self.call(name), priority=priority,
+                                                      merge_key=merge_key, merge_state=merge_state))
+        await asyncio.sleep(0)
+        return task
+
+    async def block(self):
+        blocker = asyncio.create_task(self.scheduler.run("channel:1", self.call("blocker", wait=True)))
+        await asyncio.sleep(0.01)
+        return blocker
+
+    async def test_latest_state_wins(self):
+        blocker = await self.block()
+        close1 = await self.queue("close#1", ("overwrites", 1), False)
+        opened = await self.queue("open", ("overwrites", 1), True)
+        close2 = await self.queue("close#2", ("overwrites", 1), False)
+        self.release.set()
+        results = await asyncio.gather(blocker, close1, opened, close2)
+        self.assertEqual(self.order, ["blocker", "close#1", "open", "close#2"])
+        self.assertEqual(results, ["blocker", "close#1", "open", "close#2"])
+
+    async def test_add_remove_add_ends_added(self):
+        blocker = await self.block()
+        key = ("permissions", 1, 2)
+        tasks = [await self.queue(name, key, state) for name, state in
+                 (("add#1", "add"), ("remove", "remove"), ("add#2", "add"))]
+        self.release.set()
+        await asyncio.gather(blocker, *tasks)
+        self.assertEqual(self.order[-1], "add#2")
+
+    async def test_repeated_state_merges_into_newest(self):
+        blocker = await self.block()
+        first = await self.queue("close#1", ("overwrites", 1), False)
+        second = await self.queue("close#2", ("overwrites", 1), False)
+        self.release.set()
+        results = await asyncio.gather(blocker, first, second)
+        self.assertEqual(self.order, ["blocker", "close#2"])
+        self.assertEqual(results[1:], ["close#2", "close#2"])
+        self.assertEqual(self.scheduler.stats()["merged"], 1)
+
+    async def test_promoted_call_keeps_its_order(self):
+        blocker = await self.block()
+        close1 = await self.queue("close#1", ("overwrites", 1), False, priority=BACKGROUND)
+        opened = await self.queue("open", ("overwrites", 1), True, priority=INTERACTIVE)
+        self.release.set()
+        await asyncio.gather(blocker, close1, opened)
+        self.assertEqual(self.order, ["blocker", "close#1", "open"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from transcript_attachments import ATTACHMENTS_DIRNAME
+from transcript_format import dump_header, dump_message
+from transcript_segments import SegmentStore
+
+DAY = 86400
+
+
+def blob(name: str) -> str:
+    return name * 64 + ".png"
+
+
+class AttachmentPruneTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.dir.name)
+        self.now = time.time()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write_transcript(self, name: str, age_days: float, attachments):
+        html = self.root / f"transcript-{name}.html"
+        html.write_text("<html></html>")
+        record = dump_header(name, 1, "") + dump_message({
+            "author": "a", "content": "", "timestamp": "",
+            "attachments": [{"filename": "x.png", "url": f"/{ATTACHMENTS_DIRNAME}/{a}"} for a in attachments],
+        })
+        html.with_suffix(".jsonl").write_text(record)
+        for path in (html, html.with_suffix(".jsonl")):
+            os.utime(path, (self.now - age_days * DAY,) * 2)
+
+    def write_blob(self, name: str, age_days: float) -> Path:
+        path = self.root / ATTACHMENTS_DIRNAME / name[:2] / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+        os.utime(path, (self.now - age_days * DAY,) * 2)
+        return path
+
+    def test_retention_prunes_unreferenced_blobs(self):
+        self.write_transcript("old", 100, [blob("a"), blob("b")])
+        self.write_transcript("packed", 40, [blob("b")])
+        self.write_transcript("loose", 1, [blob("c")])
+        expired = self.write_blob(blob("a"), 100)
+        shared = self.write_blob(blob("b"), 100)
+        loose = self.write_blob(blob("c"), 1)
+        fresh = self.write_blob(blob("d"), 0)
+
+        result = SegmentStore(self.root).compact(30, 90, now=self.now)
+
+        self.assertEqual(result, {"packed": 1, "deleted": 1, "attachments_deleted": 1})
+        self.assertFalse(expired.exists())
+        self.assertTrue(shared.exists())
+        self.assertTrue(loose.exists())
+        self.assertTrue(fresh.exists())
+
+    def test_packing_alone_keeps_blobs(self):
+        self.write_transcript("packed", 40, [])
+        orphan = self.write_blob(blob("e"), 100)
+        result = SegmentStore(self.root).compact(30, now=self.now)
+        self.assertEqual(result["attachments_deleted"], 0)
+        self.assertTrue(orphan.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
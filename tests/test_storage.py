@@ -0,0 +1,172 @@
+import io
+import os
+import tempfile
+import unittest
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from transcript_storage import ReadThroughCache, S3Storage
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+
+class MissingError(Exception):
+    def __init__(self):
+        super().__init__("Not Found")
+        self.response = {"Error": {"Code": "404"}}
+
+
+class FakeS3Client:
+    """The subset of the boto3 S3 client that S3Storage uses, kept in memory"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+
+    def put_object(self, Bucket, Key, Body, **extra):
+        self.calls.append("put_object")
+        self.objects[Key] = (bytes(Body), datetime.now(timezone.utc))
+
+    def create_multipart_upload(self, Bucket, Key, **extra):
+        self.calls.append("create_multipart_upload")
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.calls.append("upload_part")
+        self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append("complete_multipart_upload")
+        parts = self.uploads.pop(UploadId)
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        self.objects[Key] = (b"".join(parts[number] for number in numbers), datetime.now(timezone.utc))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append("abort_multipart_upload")
+        self.uploads.pop(UploadId, None)
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise MissingError()
+        return {"Body": io.BytesIO(self.objects[Key][0])}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise MissingError()
+        data, modified = self.objects[Key]
+        return {"ContentLength": len(data), "LastModified": modified}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+class S3StorageTest(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeS3Client()
+        self.storage = S3Storage("bucket", prefix="transcripts/", part_size=8, client=self.client)
+
+    def test_small_file_is_one_put(self):
+        with self.storage.open_write("a.html") as writer:
+            writer.write(b"<html>")
+        self.assertEqual(self.client.calls, ["put_object"])
+        self.assertEqual(self.storage.read_bytes("a.html"), b"<html>")
+        self.assertEqual(self.storage.stat("a.html").size, 6)
+
+    def test_multipart_commit_keeps_part_order(self):
+        data = b"".join(f"line {i}\n".encode() for i in range(20))
+        with self.storage.open_write("a.jsonl") as writer:
+            for start in range(0, len(data), 5):
+                writer.write(data[start:start + 5])
+        self.assertEqual(self.client.calls[0], "create_multipart_upload")
+        self.assertEqual(self.client.calls[-1], "complete_multipart_upload")
+        self.assertEqual(self.client.calls.count("upload_part"), -(-len(data) // 8))
+        self.assertEqual(self.client.uploads, {})
+        with self.storage.open_read("a.jsonl") as f:
+            self.assertEqual(f.readline(), b"line 0\n")
+            self.assertEqual(f.read(), data[len(b"line 0\n"):])
+
+    def test_abort_discards_the_upload(self):
+        with self.assertRaises(RuntimeError):
+            with self.storage.open_write("a.html") as writer:
+                writer.write(b"x" * 20)
+                raise RuntimeError("render failed")
+        self.assertIn("abort_multipart_upload", self.client.calls)
+        self.assertEqual(self.client.uploads, {})
+        self.assertIsNone(self.storage.stat("a.html"))
+
+    def test_failed_complete_aborts(self):
+        def fail(**kwargs):
+            raise OSError("connection reset")
+        self.client.complete_multipart_upload = fail
+        writer = self.storage.open_write("a.html")
+        writer.write(b"x" * 20)
+        with self.assertRaises(OSError):
+            writer.commit()
+        self.assertEqual(self.client.calls[-1], "abort_multipart_upload")
+        self.assertEqual(self.client.uploads, {})
+
+    def test_missing_object(self):
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open_read("missing.html")
+        self.assertIsNone(self.storage.stat("missing.html"))
+
+    def test_child_uses_a_key_prefix(self):
+        child = self.storage.child("attachments", fanout=2)
+        with child.open_write("ab12.png") as writer:
+            writer.write(b"png")
+        self.assertIn("transcripts/attachments/ab12.png", self.client.objects)
+
+    def test_put_file_uploads_and_consumes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "download.part"
+            path.write_bytes(b"y" * 20)
+            self.storage.put_file("b.png", path)
+            self.assertFalse(path.exists())
+        self.assertEqual(self.storage.read_bytes("b.png"), b"y" * 20)
+
+
+class ReadThroughCacheTest(unittest.TestCase):
+    def test_fetch_keeps_stored_mtime(self):
+        client = FakeS3Client()
+        storage = S3Storage("bucket", client=client)
+        with storage.open_write("a.html") as writer:
+            writer.write(b"<html>")
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ReadThroughCache(storage, Path(tmp))
+            path = cache.local_path("a.html")
+            self.assertEqual(path.read_bytes(), b"<html>")
+            self.assertEqual(path.stat().st_mtime, storage.stat("a.html").mtime)
+            self.assertEqual(cache.local_path("a.html"), path)
+            self.assertEqual(cache.stats()["hits"], 1)
+
+
+@unittest.skipUnless(boto3 and os.environ.get("TRANSCRIPT_TEST_S3_ENDPOINT"),
+                     "set TRANSCRIPT_TEST_S3_ENDPOINT (and TRANSCRIPT_TEST_S3_BUCKET) to run against MinIO")
+class LiveS3Test(unittest.TestCase):
+    """The same round trip against a real S3-compatible server, e.g. a local MinIO"""
+
+    def test_multipart_round_trip(self):
+        storage = S3Storage(os.environ.get("TRANSCRIPT_TEST_S3_BUCKET", "transcripts-test"),
+                            prefix=f"test-{uuid.uuid4().hex}/", endpoint_url=os.environ["TRANSCRIPT_TEST_S3_ENDPOINT"],
+                            part_size=5 * 1024 * 1024)
+        data = os.urandom(11 * 1024 * 1024)
+        with storage.open_write("big.jsonl") as writer:
+            for start in range(0, len(data), 1024 * 1024):
+                writer.write(data[start:start + 1024 * 1024])
+        try:
+            self.assertEqual(storage.stat("big.jsonl").size, len(data))
+            self.assertEqual(storage.read_bytes("big.jsonl"), data)
+        finally:
+            storage.delete("big.jsonl")
+
+
+if __name__ == "__main__":
+    unittest.main()
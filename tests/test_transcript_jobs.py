@@ -0,0 +1,24 @@
+import unittest
+
+from transcript_jobs import TranscriptJobQueue
+
+
+class ShutdownTest(unittest.IsolatedAsyncioTestCase):
+    async def test_pool_stays_up_until_close(self):
+        jobs = TranscriptJobQueue(workers=1, io_threads=1)
+        jobs.start()
+        future, _ = jobs.submit(1, lambda: jobs.run_io(sum, [1, 2]))
+        await jobs.drain()
+        self.assertEqual(await future, 3)
+        # Final flushes still run after the jobs are drained
+        self.assertEqual(await jobs.run_io(len, "abc"), 3)
+
+        jobs.close()
+        self.assertIsNone(jobs.io_pool)
+        with self.assertRaises(RuntimeError):
+            await jobs.run_io(len, "abc")
+        self.assertIsNone(jobs.io_pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
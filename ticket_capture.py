@@ -0,0 +1,215 @@
+"""Append-only per-channel logs of ticket messages captured from gateway events.
+
+Every ticket channel gets ``<channel_id>.jsonl`` in the capture directory.
+Each line is one event:
+
+- ``start``: the log was opened when the ticket channel was created
+- ``session``: first event written by a new gateway session (``since`` is a
+  snowflake from when that session became ready)
+- ``create`` / ``edit``: a full message record for message ``id``
+- ``delete``: message ``id`` was deleted
+
+Gateway handlers never touch the disk: events are added to a pending batch
+and a background task appends it on the I/O pool, one file open per channel
+per batch, in the order the events arrived. A crash can lose the last
+moments of a batch; messages created then are still fetched again, since
+they are newer than anything in the log.
+
+Replaying a log is done in two steps, both off the event loop. ``index``
+scans the log and keeps only the file offset of each message's latest
+version, the deleted ids and the id ranges in which the bot was not
+connected, so only those ranges need to be fetched from the REST API.
+``read_records`` then reads the records back in id order a batch at a time,
+so a long ticket is never held in memory as a whole.
+"""
+import asyncio
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+
+class CaptureIndex(NamedTuple):
+    # message id -> offset of the line holding its latest record
+    offsets: Dict[int, int]
+    deleted: Set[int]
+    # (after_id, before_id) ranges that were not observed live
+    gaps: List[Tuple[int, int]]
+
+
+class CaptureLog:
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True)
+        self.session_since: Optional[int] = None
+        self._session_channels: Set[int] = set()
+        # Channels with a log, so handlers can check without a stat
+        self._channels: Set[int] = {int(name[:-6]) for name in os.listdir(self.directory)
+                                    if name.endswith(".jsonl") and name[:-6].isdigit()}
+        # (channel id, events) in arrival order; None events delete the log
+        self._pending: List[Tuple[int, Optional[List[Dict]]]] = []
+        self._lock = threading.Lock()
+        # Held while a batch is written, so batches reach the files in order
+        self._write_lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def path(self, channel_id: int) -> Path:
+        return self.directory / f"{channel_id}.jsonl"
+
+    def has_log(self, channel_id: int) -> bool:
+        return channel_id in self._channels
+
+    def new_session(self, since: int):
+        """Start a new gateway session; the next write per channel records a gap marker"""
+        self.session_since = since
+        self._session_channels.clear()
+
+    def start_writer(self, run_io):
+        """Append pending events in the background using ``run_io``"""
+        self._wake = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop(run_io))
+
+    async def _write_loop(self, run_io):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            try:
+                await run_io(self.flush)
+            except Exception as e:
+                print(f"❌ Error writing capture logs: {e}")
+
+    async def close(self):
+        """Stop the background writer and write anything still pending"""
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+            self._wake = None
+        self.flush()
+
+    def _queue(self, channel_id: int, events: Optional[List[Dict]]):
+        with self._lock:
+            self._pending.append((channel_id, events))
+        if self._wake is not None:
+            self._wake.set()
+        else:
+            self.flush()
+
+    def flush(self):
+        """Append every pending event to its channel's log"""
+        with self._write_lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        files = {}
+        try:
+            for channel_id, events in pending:
+                f = files.pop(channel_id, None)
+                if events is None:
+                    if f is not None:
+                        f.close()
+                    try:
+                        self.path(channel_id).unlink()
+                    except FileNotFoundError:
+                        pass
+                    continue
+                if f is None:
+                    f = open(self.path(channel_id), "a", encoding="utf-8")
+                files[channel_id] = f
+                f.write("".join(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n"
+                                for event in events))
+        finally:
+            for f in files.values():
+                f.close()
+
+    def _session_marker(self, channel_id: int) -> List[Dict]:
+        if channel_id in self._session_channels or self.session_since is None:
+            return []
+        self._session_channels.add(channel_id)
+        return [{"op": "session", "since": self.session_since}]
+
+    def start(self, channel_id: int):
+        """Open the log for a newly created ticket channel"""
+        self._channels.add(channel_id)
+        self._queue(channel_id, self._session_marker(channel_id) + [{"op": "start", "id": channel_id}])
+
+    def append(self, channel_id: int, op: str, message_id: int, record: Optional[Dict] = None):
+        """Append a create, edit or delete event to an existing log"""
+        if channel_id not in self._channels:
+            return
+        event = {"op": op, "id": message_id}
+        if record is not None:
+            event["msg"] = record
+        self._queue(channel_id, self._session_marker(channel_id) + [event])
+
+    def discard(self, channel_id: int):
+        if channel_id in self._channels:
+            self._channels.discard(channel_id)
+            self._queue(channel_id, None)
+        self._session_channels.discard(channel_id)
+
+    def mark_session(self, channel_id: int):
+        """Record the current session in a log, so the downtime before it shows up as a gap"""
+        if channel_id in self._channels:
+            events = self._session_marker(channel_id)
+            if events:
+                self._queue(channel_id, events)
+
+    def index(self, channel_id: int) -> Optional[CaptureIndex]:
+        """Scan a channel's log (blocking) without keeping the message records.
+
+        Call ``mark_session`` first. Returns None if there is no log or the log
+        does not cover the ticket from its creation.
+        """
+        if channel_id not in self._channels:
+            return None
+        offsets: Dict[int, int] = {}
+        deleted: Set[int] = set()
+        gaps: List[Tuple[int, int]] = []
+        last_id = None
+        with self._write_lock:
+            self._flush_locked()
+            try:
+                f = open(self.path(channel_id), "rb")
+            except FileNotFoundError:
+                return None
+        with f:
+            offset = 0
+            for line in f:
+                line_offset, offset = offset, offset + len(line)
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue  # torn final line from a crash
+                op = event.get("op")
+                if op == "start":
+                    last_id = event["id"]
+                elif op == "session":
+                    if last_id is not None and event["since"] > last_id:
+                        gaps.append((last_id, event["since"]))
+                elif op in ("create", "edit"):
+                    message_id = event["id"]
+                    if message_id not in deleted:
+                        offsets[message_id] = line_offset
+                    if last_id is not None:
+                        last_id = max(last_id, message_id)
+                elif op == "delete":
+                    offsets.pop(event["id"], None)
+                    deleted.add(event["id"])
+
+        if last_id is None:
+            return None
+        return CaptureIndex(offsets, deleted, gaps)
+
+    def read_records(self, channel_id: int, offsets: List[int]) -> List[Dict]:
+        """The message records at the given log offsets (blocking)"""
+        records = []
+        with open(self.path(channel_id), "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                records.append(json.loads(f.readline())["msg"])
+        return records
@@ -0,0 +1,112 @@
+"""SQLite store for ticket state that must survive restarts.
+
+Ticket members, the ticket counter and the ticket category id are kept in
+memory by the bot and written here behind its back: changes are recorded
+in a pending batch and flushed in one transaction every few seconds on a
+background thread, so interaction handlers never wait on disk. ``close``
+flushes whatever is still pending.
+"""
+import asyncio
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from transcript_catalog import SQLiteFile
+
+STATE_FILENAME = "ticket_state.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ticket_members (
+    channel_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, member_id)
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+);
+"""
+
+
+class TicketStateStore(SQLiteFile):
+    def __init__(self, path: Path, flush_interval: float = 2.0):
+        super().__init__(path, SCHEMA)
+        self.flush_interval = flush_interval
+        # channel id -> member ids, or None to forget the channel
+        self._pending_members: Dict[int, Optional[List[int]]] = {}
+        self._pending_settings: Dict[str, Optional[int]] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+
+    def load(self) -> Tuple[Dict[int, List[int]], Dict[str, Optional[int]]]:
+        """Return ``(ticket_members, settings)`` as last flushed"""
+        self.ensure_schema()
+        members: Dict[int, List[int]] = {}
+        with self.connect() as conn:
+            for channel_id, member_id in conn.execute(
+                    "SELECT channel_id, member_id FROM ticket_members ORDER BY channel_id, position"):
+                members.setdefault(channel_id, []).append(member_id)
+            settings = dict(conn.execute("SELECT key, value FROM settings"))
+        return members, settings
+
+    def set_members(self, channel_id: int, member_ids: List[int]):
+        with self._lock:
+            self._pending_members[channel_id] = list(member_ids)
+
+    def forget(self, channel_id: int):
+        with self._lock:
+            self._pending_members[channel_id] = None
+
+    def set_value(self, key: str, value: Optional[int]):
+        with self._lock:
+            self._pending_settings[key] = value
+
+    def flush(self) -> int:
+        """Write all pending changes in one transaction; returns the number of changes"""
+        with self._lock:
+            members, self._pending_members = self._pending_members, {}
+            settings, self._pending_settings = self._pending_settings, {}
+        if not members and not settings:
+            return 0
+
+        self.ensure_schema()
+        try:
+            with self.connect() as conn:
+                for channel_id, member_ids in members.items():
+                    conn.execute("DELETE FROM ticket_members WHERE channel_id = ?", (channel_id,))
+                    if member_ids:
+                        conn.executemany(
+                            "INSERT OR IGNORE INTO ticket_members (channel_id, member_id, position) VALUES (?, ?, ?)",
+                            [(channel_id, member_id, position) for position, member_id in enumerate(member_ids)]
+                        )
+                conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", settings.items())
+        except Exception:
+            # Put the batch back unless newer changes superseded it
+            with self._lock:
+                for channel_id, member_ids in members.items():
+                    self._pending_members.setdefault(channel_id, member_ids)
+                for key, value in settings.items():
+                    self._pending_settings.setdefault(key, value)
+            raise
+        return len(members) + len(settings)
+
+    def start(self, run_io):
+        """Flush pending changes every ``flush_interval`` seconds using ``run_io``"""
+        self._flusher = asyncio.create_task(self._flush_loop(run_io))
+
+    async def _flush_loop(self, run_io):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await run_io(self.flush)
+            except Exception as e:
+                print(f"❌ Error saving ticket state: {e}")
+
+    async def close(self):
+        """Stop the background flusher and write anything still pending"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        self.flush()
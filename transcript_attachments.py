@@ -0,0 +1,313 @@
+"""Content-addressed archive of ticket attachments.
+
+Transcripts used to link straight to Discord's CDN, and those links expire.
+While a transcript is generated, every attachment is downloaded into the
+``attachments`` child of the transcript storage (``transcripts/attachments/
+<ab>/<sha256><ext>`` on local disk, ``<prefix>attachments/<sha256><ext>`` on
+S3) and the message record is rewritten to point at the web app's
+``/attachments/<name>`` route. Files are named by the SHA-256 of their
+content, so a screenshot posted in many tickets is stored once.
+
+Downloads run on a bounded pool and are streamed to a local temporary file
+in chunks, then moved (or uploaded) into storage under their hash. A small
+SQLite index on the bot's disk maps each source URL to its stored name, so
+generating the same ticket's transcript again does not download anything.
+An attachment that cannot be fetched (expired, too large, network error)
+keeps its original link. Files no remaining transcript links to are removed
+by ``prune_attachments`` when compaction deletes old transcripts.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from transcript_catalog import SQLiteFile
+from transcript_storage import TranscriptStorage
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+ATTACHMENTS_DIRNAME = "attachments"
+ATTACHMENT_INDEX_FILENAME = "index.sqlite3"
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+STORED_NAME_RE = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]{1,10})?$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attachments (
+    source TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+
+def stored_name(digest: str, filename: str) -> str:
+    """Name of an archived file: its content hash plus the original extension"""
+    ext = Path(filename).suffix.lower()
+    if not re.fullmatch(r"\.[a-z0-9]{1,10}", ext):
+        ext = ""
+    return digest + ext
+
+
+def is_stored_name(name: str) -> bool:
+    return bool(STORED_NAME_RE.match(name))
+
+
+def referenced_names(record_lines: Iterable) -> Set[str]:
+    """Archived files linked from a message record, read a line at a time"""
+    names = set()
+    marker = f"/{ATTACHMENTS_DIRNAME}/"
+    raw_marker = marker.encode()
+    for line in record_lines:
+        # Most messages have no archived attachment; skip them without parsing
+        if (raw_marker if isinstance(line, bytes) else marker) not in line:
+            continue
+        try:
+            message = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(message, dict):
+            continue
+        for att in message.get("attachments") or ():
+            url = att.get("url") or ""
+            name = url.rsplit("/", 1)[-1]
+            if marker in url and is_stored_name(name):
+                names.add(name)
+    return names
+
+
+def attachment_storage(storage: TranscriptStorage) -> TranscriptStorage:
+    """Where archived files live; on local disk they are fanned out by their first two hex digits"""
+    return storage.child(ATTACHMENTS_DIRNAME, fanout=2)
+
+
+def prune_attachments(directory: Path, referenced: Set[str], before: float) -> int:
+    """Delete archived files in a local attachments directory that no record links to.
+
+    Files modified after `before` are kept, since a transcript being generated
+    downloads its attachments before its record is written. Returns the number
+    of files deleted.
+    """
+    removed = []
+    try:
+        fans = os.scandir(directory)
+    except FileNotFoundError:
+        return 0
+    with fans:
+        for fan in fans:
+            if not fan.is_dir():
+                continue
+            with os.scandir(fan.path) as entries:
+                for entry in entries:
+                    if not is_stored_name(entry.name) or entry.name in referenced:
+                        continue
+                    try:
+                        if entry.stat().st_mtime >= before:
+                            continue
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        continue
+                    removed.append(entry.name)
+
+    index = SQLiteFile(Path(directory) / ATTACHMENT_INDEX_FILENAME, SCHEMA)
+    if removed and index.path.exists():
+        with index.connect() as conn:
+            conn.executemany("DELETE FROM attachments WHERE name = ?", ((name,) for name in removed))
+    return len(removed)
+
+
+def source_key(url: str) -> str:
+    """CDN links carry signed, expiring query parameters; the path identifies the file"""
+    return url.split("?", 1)[0]
+
+
+class AttachmentArchive(SQLiteFile):
+    def __init__(self, storage: TranscriptStorage, root: Path, concurrency: int = 4,
+                 max_bytes: int = 50 * 1024 * 1024):
+        # Blobs go to `storage`; the source index and partial downloads stay under the local `root`
+        super().__init__(Path(root) / ATTACHMENT_INDEX_FILENAME, SCHEMA)
+        self.storage = storage
+        self.root = Path(root)
+        self.concurrency = max(1, concurrency)
+        self.max_bytes = max_bytes
+        # Records held back while their attachments download, in message order
+        self.window = self.concurrency * 4
+        self.session = None
+        self._run_io: Optional[Callable[..., Awaitable]] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.downloaded = 0
+        self.reused = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.session is not None
+
+    def start(self, run_io: Callable[..., Awaitable]):
+        """Open the download session on the running event loop"""
+        if aiohttp is None:
+            print("❌ aiohttp is not installed; attachments will not be archived")
+            return
+        self._run_io = run_io
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300, sock_read=60))
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def lookup(self, source: str) -> Optional[str]:
+        """Stored name for a source URL, if it was archived and the file is still there"""
+        self.ensure_schema()
+        with self.connect() as conn:
+            row = conn.execute("SELECT name FROM attachments WHERE source = ?", (source,)).fetchone()
+        if row and self.storage.stat(row[0]) is not None:
+            return row[0]
+        return None
+
+    def _commit(self, tmp: Path, name: str, source: str, size: int):
+        """Move a finished download into storage, or drop it if the content is already stored"""
+        if self.storage.stat(name) is not None:
+            tmp.unlink()
+        else:
+            self.storage.put_file(name, tmp)
+        with self.connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO attachments (source, name, size) VALUES (?, ?, ?)",
+                         (source, name, size))
+
+    @staticmethod
+    def _write_chunk(f, digest, chunk: bytes):
+        f.write(chunk)
+        digest.update(chunk)
+
+    @staticmethod
+    def _discard(f, tmp: Path):
+        if f is not None:
+            f.close()
+        try:
+            tmp.unlink()
+        except FileNotFoundError:
+            pass
+
+    async def archive(self, url: str, filename: str) -> Optional[str]:
+        """Return the stored name for an attachment, downloading it if needed.
+
+        Concurrent requests for the same source share one download.
+        """
+        source = source_key(url)
+        pending = self._inflight.get(source)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[source] = future
+        try:
+            name = await self._fetch(url, filename, source)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            print(f"❌ Error archiving attachment {filename}: {e}")
+            self.failed += 1
+            name = None
+        finally:
+            self._inflight.pop(source, None)
+        future.set_result(name)
+        return name
+
+    async def _fetch(self, url: str, filename: str, source: str) -> Optional[str]:
+        run_io = self._run_io
+        await run_io(self.ensure_schema)
+        name = await run_io(self.lookup, source)
+        if name is not None:
+            self.reused += 1
+            return name
+
+        async with self._slots:
+            async with self.session.get(url) as response:
+                if response.status != 200:
+                    print(f"❌ Attachment {filename} unavailable: HTTP {response.status}")
+                    self.failed += 1
+                    return None
+                if response.content_length and response.content_length > self.max_bytes:
+                    print(f"⚠️ Attachment {filename} too large to archive ({response.content_length} bytes)")
+                    self.failed += 1
+                    return None
+
+                tmp = self.root / f".{uuid.uuid4().hex}.part"
+                digest = hashlib.sha256()
+                size = 0
+                f = None
+                try:
+                    f = await run_io(open, tmp, "wb")
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            print(f"⚠️ Attachment {filename} too large to archive (over {self.max_bytes} bytes)")
+                            await run_io(self._discard, f, tmp)
+                            self.failed += 1
+                            return None
+                        await run_io(self._write_chunk, f, digest, chunk)
+                    await run_io(f.close)
+                    name = stored_name(digest.hexdigest(), filename)
+                    await run_io(self._commit, tmp, name, source, size)
+                except BaseException:
+                    await run_io(self._discard, f, tmp)
+                    raise
+
+        self.downloaded += 1
+        return name
+
+    async def archive_record(self, record: Dict, base_url: str) -> Dict:
+        """Return the message record with its attachments pointing at the archive"""
+        prefix = f"{base_url}/{ATTACHMENTS_DIRNAME}/"
+        todo = [att for att in record["attachments"] if not att["url"].startswith(prefix)]
+        names = await asyncio.gather(*(self.archive(att["url"], att["filename"]) for att in todo))
+        stored = {id(att): name for att, name in zip(todo, names)}
+
+        attachments = []
+        for att in record["attachments"]:
+            name = stored.get(id(att))
+            if name is None:
+                attachments.append(att)
+            else:
+                attachments.append(dict(att, url=prefix + name, source_url=att["url"]))
+        return dict(record, attachments=attachments)
+
+    async def archive_records(self, records: AsyncIterator[Dict], base_url: str) -> AsyncIterator[Dict]:
+        """Yield records in order with their attachments archived.
+
+        Attachments of up to ``window`` upcoming messages download while
+        earlier records are being written, so memory stays bounded and the
+        output order matches the input.
+        """
+        pending = deque()
+        try:
+            async for record in records:
+                task = None
+                if record.get("attachments"):
+                    task = asyncio.ensure_future(self.archive_record(record, base_url))
+                pending.append((record, task))
+                while len(pending) > self.window:
+                    record, task = pending.popleft()
+                    yield await task if task is not None else record
+            while pending:
+                record, task = pending.popleft()
+                yield await task if task is not None else record
+        finally:
+            for _, task in pending:
+                if task is not None:
+                    task.cancel()
+
+    def stats(self) -> Dict:
+        return {"downloaded": self.downloaded, "reused": self.reused, "failed": self.failed}
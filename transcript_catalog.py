@@ -0,0 +1,179 @@
+"""SQLite catalog of saved transcripts.
+
+The bot records every transcript it writes, and the web app lists them from
+here without scanning the transcripts directory. Listing pages use keyset
+pagination on ``(created_at, filename)``, so a page costs the same no
+matter how deep into the archive it is.
+
+Run ``python transcript_catalog.py [transcripts_dir]`` once to add
+transcripts written before the catalog existed.
+"""
+import sqlite3
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from transcript_format import channel_name_from_filename, load_sidecar, sidecar_path
+
+CATALOG_FILENAME = "catalog.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    filename TEXT PRIMARY KEY,
+    channel_name TEXT NOT NULL,
+    channel_id INTEGER,
+    generator TEXT,
+    created_at INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    message_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_by_created ON transcripts (created_at DESC, filename DESC);
+"""
+
+
+class SQLiteFile:
+    """A SQLite database in WAL mode whose schema is created on first use"""
+    row_factory = None
+
+    def __init__(self, path: Path, schema: str):
+        self.path = Path(path)
+        self.schema = schema
+        self._schema_ready = False
+
+    @contextmanager
+    def connect(self):
+        """Open a connection that commits on success and is always closed"""
+        conn = sqlite3.connect(str(self.path), timeout=10)
+        if self.row_factory is not None:
+            conn.row_factory = self.row_factory
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def ensure_schema(self):
+        if self._schema_ready:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.schema)
+        self._schema_ready = True
+
+
+class TranscriptCatalog(SQLiteFile):
+    row_factory = sqlite3.Row
+
+    def __init__(self, path: Path):
+        super().__init__(path, SCHEMA)
+
+    def record(self, filename: str, channel_name: str, channel_id: Optional[int], generator: Optional[str],
+               created_at: int, size: int, message_count: int):
+        """Add or replace the catalog entry for a transcript"""
+        self.ensure_schema()
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO transcripts "
+                "(filename, channel_name, channel_id, generator, created_at, size, message_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (filename, channel_name, channel_id, generator, created_at, size, message_count)
+            )
+
+    def remove(self, filename: str):
+        """Drop the catalog entry for a deleted transcript"""
+        if not self.path.exists():
+            return
+        self.ensure_schema()
+        with self.connect() as conn:
+            conn.execute("DELETE FROM transcripts WHERE filename = ?", (filename,))
+
+    def page(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Return one page of transcripts, newest first, and the cursor for the next page"""
+        if not self.path.exists():
+            return [], None
+
+        query = "SELECT * FROM transcripts"
+        params: list = []
+        after = parse_cursor(cursor)
+        if after:
+            query += " WHERE created_at < ? OR (created_at = ? AND filename < ?)"
+            params += [after[0], after[0], after[1]]
+        query += " ORDER BY created_at DESC, filename DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self.connect() as conn:
+            rows = [dict(row) for row in conn.execute(query, params)]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['created_at']}:{rows[-1]['filename']}"
+        return rows, next_cursor
+
+    def iter_range(self, since: Optional[int] = None, until: Optional[int] = None,
+                   batch: int = 500) -> Iterator[Dict]:
+        """Entries created in [since, until), oldest first, read a batch at a time"""
+        if not self.path.exists():
+            return
+        after: Optional[Tuple[int, str]] = None
+        while True:
+            query = "SELECT * FROM transcripts WHERE created_at >= ? AND created_at < ?"
+            params: list = [since if since is not None else 0, until if until is not None else 2 ** 62]
+            if after:
+                query += " AND (created_at > ? OR (created_at = ? AND filename > ?))"
+                params += [after[0], after[0], after[1]]
+            query += " ORDER BY created_at, filename LIMIT ?"
+            params.append(batch)
+            with self.connect() as conn:
+                rows = [dict(row) for row in conn.execute(query, params)]
+            yield from rows
+            if len(rows) < batch:
+                return
+            after = (rows[-1]["created_at"], rows[-1]["filename"])
+
+    def get_many(self, filenames: Iterable[str]) -> Dict[str, Dict]:
+        """Entries for the given transcripts, by filename; unknown names are left out"""
+        filenames = list(filenames)
+        if not filenames or not self.path.exists():
+            return {}
+        placeholders = ",".join("?" * len(filenames))
+        with self.connect() as conn:
+            rows = conn.execute(f"SELECT * FROM transcripts WHERE filename IN ({placeholders})", filenames)
+            return {row["filename"]: dict(row) for row in rows}
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Tuple[int, str]]:
+    if not cursor or ":" not in cursor:
+        return None
+    created_at, filename = cursor.split(":", 1)
+    try:
+        return int(created_at), filename
+    except ValueError:
+        return None
+
+
+def rebuild_from_directory(transcripts_dir: Path) -> int:
+    """Catalog every transcript page in a directory; returns the number recorded"""
+    transcripts_dir = Path(transcripts_dir)
+    catalog = TranscriptCatalog(transcripts_dir / CATALOG_FILENAME)
+    count = 0
+    for html_path in transcripts_dir.glob("transcript-*.html"):
+        stat = html_path.stat()
+        record = load_sidecar(sidecar_path(html_path))
+        if record:
+            header, messages = record
+            channel_name, channel_id, message_count = header.get("channel_name"), header.get("channel_id"), len(messages)
+        else:
+            with open(html_path, "r", encoding="utf-8") as f:
+                message_count = f.read().count('<div class="message"')
+            channel_name, channel_id = channel_name_from_filename(html_path.name), None
+        catalog.record(html_path.name, channel_name, channel_id, None, int(stat.st_mtime), stat.st_size, message_count)
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    directory = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "transcripts"
+    print(f"✅ Catalogued {rebuild_from_directory(directory)} transcripts")
@@ -0,0 +1,109 @@
+"""ZIP archives written as a stream, for bulk transcript exports.
+
+``zipfile`` keeps a ``ZipInfo`` object per member until the archive is
+closed, so memory grows with the size of an export. ``ZipStream`` produces
+the same format as a sequence of byte chunks. Members are deflated as they
+are read, their sizes and CRC follow in a data descriptor so nothing is
+ever seeked back to, and the central directory records are spilled to a
+temporary file until the end. Memory use stays flat however many files go
+into the archive. ZIP64 records are added only when the archive passes the
+4 GiB or 65535 member limits; individual members must stay under 4 GiB.
+"""
+import struct
+import tempfile
+import time
+import zlib
+from typing import Iterable, Iterator
+
+from transcript_format import CHUNK_SIZE
+
+# General purpose flags: sizes in a data descriptor, UTF-8 names
+FLAGS = 0x08 | 0x800
+DEFLATED = 8
+VERSION = 20
+VERSION_ZIP64 = 45
+UINT16_MAX = 0xFFFF
+UINT32_MAX = 0xFFFFFFFF
+
+
+def dos_datetime(timestamp: float):
+    """MS-DOS (time, date) fields for a Unix timestamp, in UTC"""
+    t = time.gmtime(max(timestamp, 315532800))  # the format starts in 1980
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+class ZipStream:
+    def __init__(self):
+        self.offset = 0
+        self.count = 0
+        self.directory = tempfile.TemporaryFile()
+
+    def member(self, name: str, mtime: float, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Yield one deflated member built from `chunks`"""
+        encoded = name.encode("utf-8")
+        dostime, dosdate = dos_datetime(mtime)
+        start = self.offset
+        header = struct.pack("<4s5H3L2H", b"PK\x03\x04", VERSION, FLAGS, DEFLATED, dostime, dosdate,
+                             0, 0, 0, len(encoded), 0) + encoded
+        yield self._sent(header)
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        crc = size = compressed = 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            data = compressor.compress(chunk)
+            if data:
+                compressed += len(data)
+                yield self._sent(data)
+        data = compressor.flush()
+        compressed += len(data)
+        yield self._sent(data)
+        if size > UINT32_MAX or compressed > UINT32_MAX:
+            raise ValueError(f"{name} is too large for a ZIP member")
+        yield self._sent(struct.pack("<4s3L", b"PK\x07\x08", crc, compressed, size))
+
+        extra = b""
+        version = VERSION
+        if start >= UINT32_MAX:
+            extra = struct.pack("<2HQ", 1, 8, start)
+            version = VERSION_ZIP64
+        self.directory.write(struct.pack(
+            "<4s6H3L5H2L", b"PK\x01\x02", version, version, FLAGS, DEFLATED, dostime, dosdate,
+            crc, compressed, size, len(encoded), len(extra), 0, 0, 0, 0o100644 << 16, min(start, UINT32_MAX)
+        ) + encoded + extra)
+        self.count += 1
+
+    def file_member(self, name: str, mtime: float, f) -> Iterator[bytes]:
+        """Yield a member read from an open binary file, a chunk at a time"""
+        return self.member(name, mtime, iter(lambda: f.read(CHUNK_SIZE), b""))
+
+    def finish(self) -> Iterator[bytes]:
+        """Yield the central directory and end records, then release the spilled directory"""
+        try:
+            directory_offset = self.offset
+            directory_size = self.directory.tell()
+            self.directory.seek(0)
+            while True:
+                chunk = self.directory.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield self._sent(chunk)
+
+            if self.count >= UINT16_MAX or directory_offset >= UINT32_MAX or directory_size >= UINT32_MAX:
+                zip64_end = self.offset
+                yield self._sent(struct.pack("<4sQ2H2L4Q", b"PK\x06\x06", 44, VERSION_ZIP64, VERSION_ZIP64, 0, 0,
+                                             self.count, self.count, directory_size, directory_offset))
+                yield self._sent(struct.pack("<4sLQL", b"PK\x06\x07", 0, zip64_end, 1))
+            count = min(self.count, UINT16_MAX)
+            yield self._sent(struct.pack("<4s4H2LH", b"PK\x05\x06", 0, 0, count, count,
+                                         min(directory_size, UINT32_MAX), min(directory_offset, UINT32_MAX), 0))
+        finally:
+            self.close()
+
+    def close(self):
+        self.directory.close()
+
+    def _sent(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
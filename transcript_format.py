@@ -0,0 +1,176 @@
+"""Files stored next to every transcript page.
+
+The bot writes ``transcript-<channel>-<timestamp>.jsonl`` beside each HTML
+transcript. The first line is a header object and every following line is
+one message, so the web app can load a transcript without parsing HTML.
+
+Pre-compressed copies of the page (``.html.gz`` and, when the ``brotli``
+package is installed, ``.html.br``) are written once so the web app can
+send them as-is.
+"""
+import gzip
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SIDECAR_VERSION = 1
+SIDECAR_SUFFIX = ".jsonl"
+
+# transcript-<channel>-<YYYYMMDD>-<HHMMSS>.html, as named by the bot
+TRANSCRIPT_FILENAME_RE = re.compile(r"^transcript-(.*?)(?:-\d{8}-\d{6})?\.html$")
+
+# Content-Encoding -> file suffix, in order of preference
+COMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+# Read size used wherever transcript files are streamed
+CHUNK_SIZE = 256 * 1024
+
+
+def channel_name_from_filename(filename: str) -> str:
+    """Recover the channel name from a transcript filename, for transcripts without a record"""
+    match = TRANSCRIPT_FILENAME_RE.match(Path(filename).name)
+    return match.group(1) if match else Path(filename).stem
+
+
+def sidecar_path(html_path: Path) -> Path:
+    """Return the sidecar path that belongs to a transcript page"""
+    return Path(html_path).with_suffix(SIDECAR_SUFFIX)
+
+
+def dump_header(channel_name: str, channel_id: int, generated_at: str) -> str:
+    """Serialize the sidecar header line"""
+    return json.dumps({
+        "version": SIDECAR_VERSION,
+        "channel_name": channel_name,
+        "channel_id": channel_id,
+        "generated_at": generated_at
+    }, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def dump_message(message: Dict) -> str:
+    """Serialize one message record as a sidecar line"""
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _open_binary(source):
+    """Open a sidecar path for reading, or pass an already open binary file through"""
+    return source if hasattr(source, "read") else open(source, "rb")
+
+
+def load_sidecar(path) -> Optional[Tuple[Dict, List[Dict]]]:
+    """Load a sidecar from a path or open binary file; None if it is missing or from an unknown version"""
+    try:
+        with _open_binary(path) as f:
+            header = json.loads(f.readline())
+            if header.get("version") != SIDECAR_VERSION:
+                return None
+            messages = [json.loads(line) for line in f if line.strip()]
+    except (OSError, ValueError):
+        return None
+    return header, messages
+
+
+def read_sidecar_page(path, offset: Optional[int], limit: int) -> Optional[Tuple[Dict, List[Dict], Optional[int]]]:
+    """Read up to `limit` messages starting at byte `offset` (None for the first message).
+
+    `path` may also be an open binary file, such as a packed record.
+
+    Returns ``(header, messages, next_offset)``, where ``next_offset`` is None
+    on the last page, or None if the sidecar is missing or from an unknown
+    version. Only the requested lines are read, so the cost of a page does not
+    depend on the length of the transcript. Raises ValueError for an offset
+    that does not start a message line.
+    """
+    try:
+        f = _open_binary(path)
+    except OSError:
+        return None
+    with f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            return None
+        if header.get("version") != SIDECAR_VERSION:
+            return None
+        if offset is not None:
+            if offset < f.tell():
+                raise ValueError("offset is inside the header")
+            f.seek(offset)
+
+        messages = []
+        while len(messages) < limit:
+            line = f.readline()
+            if not line:
+                return header, messages, None
+            if line.strip():
+                messages.append(json.loads(line))
+
+        next_offset = f.tell()
+        more = any(line.strip() for line in iter(f.readline, b""))
+        return header, messages, next_offset if more else None
+
+
+def parse_transcript_html(html_content: str) -> List[Dict]:
+    """Rebuild the message list from a transcript page (for files without a record)"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, "html.parser")
+    
+    messages = []
+    for message_div in soup.find_all("div", class_="message"):
+        timestamp = message_div.find("div", class_="timestamp")
+        author = message_div.find("div", class_="author")
+        content = message_div.find("div", class_="content")
+        attachments = message_div.find("div", class_="attachments")
+        
+        message_data = {
+            "timestamp": timestamp.get_text() if timestamp else "",
+            "author": author.get_text() if author else "",
+            "content": content.get_text() if content else "",
+            "attachments": []
+        }
+        
+        if attachments:
+            for attachment in attachments.find_all("a", class_="attachment"):
+                message_data["attachments"].append({
+                    "filename": attachment.get_text(),
+                    "url": attachment.get("href")
+                })
+        
+        messages.append(message_data)
+    return messages
+
+
+def compressed_path(html_path: Path, encoding: str) -> Path:
+    """Return the pre-compressed copy of a transcript page for a Content-Encoding"""
+    html_path = Path(html_path)
+    return html_path.with_name(html_path.name + COMPRESSED_SUFFIXES[encoding])
+
+
+def available_encodings() -> List[str]:
+    """Encodings this process can produce, in order of preference"""
+    return [encoding for encoding in COMPRESSED_SUFFIXES if encoding != "br" or brotli is not None]
+
+
+def compress_stream(src, dst, encoding: str):
+    """Compress a readable binary stream into a writable one, a chunk at a time"""
+    if encoding == "gzip":
+        # mtime=0 keeps the output identical for identical pages
+        with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=9, mtime=0) as out:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
+    else:
+        compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=11)
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            dst.write(compressor.process(chunk))
+        dst.write(compressor.finish())
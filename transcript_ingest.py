@@ -0,0 +1,562 @@
+"""Pushing finished transcripts from the bot to the web app.
+
+The web app need not share a disk with the bot. Each transcript the bot
+writes goes into an outbox (``ingest_outbox.sqlite3``) under a random
+idempotency key. A background task sends the outbox to the web app's
+``POST /api/ingest`` in batches. It waits a moment first, so a burst of
+closed tickets goes up as a few requests rather than one each. Pending
+entries survive bot restarts, and failed sends are retried with
+exponential backoff until the web app is back.
+
+A batch is one gzip-compressed stream, written and read a chunk at a time
+on both sides. For each transcript the stream holds one JSON line
+describing it (key, catalog fields and the files that follow, with their
+sizes), then the raw bytes of each file in that order. The files are the
+archived attachments the record links to, then the record, the page and
+its compressed copies. Attachments are checked against the SHA-256 in
+their name and skipped when the web app already has them. The web app keeps
+the keys it has stored in ``ingested.sqlite3``. An entry seen before is
+skipped, so a retried batch never stores a transcript twice.
+
+The web app's copy is not assumed to be durable. On an ephemeral disk a
+restart loses the pushed files, the catalog and ``ingested.sqlite3``
+together, and with them the random store id kept in ``ingested.sqlite3``.
+Every few minutes the bot asks ``POST /api/ingest/missing`` for that id.
+When it differs from the one the bot last synced with, the bot sends the
+filenames in its own catalog, 500 at a time, and queues again every
+transcript the web app reports missing. A fresh web app is therefore
+refilled automatically, and the first sync also sends transcripts written
+before ingest was enabled. Transcripts the bot has already packed into
+segments are not re-sent; point both sides at S3 storage to keep them.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import random
+import time
+import uuid
+import zlib
+from itertools import islice
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from metrics import log_event
+from transcript_attachments import attachment_storage, is_stored_name, referenced_names
+from transcript_catalog import SQLiteFile
+from transcript_format import CHUNK_SIZE, COMPRESSED_SUFFIXES, compressed_path, sidecar_path
+from transcript_storage import TranscriptStorage, check_name
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+INGEST_PATH = "/api/ingest"
+MISSING_PATH = INGEST_PATH + "/missing"
+OUTBOX_FILENAME = "ingest_outbox.sqlite3"
+INGEST_LOG_FILENAME = "ingested.sqlite3"
+BATCH_CONTENT_TYPE = "application/x-transcript-batch"
+# Filenames per resync request
+RESYNC_BATCH = 500
+
+# Responses worth retrying; any other 4xx drops the batch
+RETRY_STATUSES = {401, 403, 408, 429}
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    entry TEXT NOT NULL
+);
+"""
+
+INGEST_LOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingested (
+    key TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    received_at INTEGER NOT NULL
+);
+"""
+
+# Both files keep a few named values: the web app its store id, the bot the id it last synced with
+META_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def catalog_entry(row: Dict) -> Dict:
+    """An outbox entry rebuilt from one of the bot's catalog rows"""
+    return {
+        "filename": row["filename"],
+        "channel_name": row["channel_name"],
+        "channel_id": row["channel_id"],
+        "generator": row["generator"],
+        "created_at": row["created_at"],
+        "file_size": row["size"],
+        "message_count": row["message_count"]
+    }
+
+
+def transcript_files(html_filename: str) -> List[str]:
+    """Files sent for one transcript: the record first, so a page never arrives without it"""
+    html_path = Path(html_filename)
+    names = [sidecar_path(html_path).name, html_filename]
+    names += [compressed_path(html_path, encoding).name for encoding in COMPRESSED_SUFFIXES]
+    return names
+
+
+class MetaFile(SQLiteFile):
+    """A SQLite file with a ``meta`` table of named values next to its own schema"""
+
+    def __init__(self, path: Path, schema: str):
+        super().__init__(path, schema + META_SCHEMA)
+
+    def get_meta(self, name: str) -> Optional[str]:
+        self.ensure_schema()
+        with self.connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+            return row[0] if row else None
+
+    def set_meta(self, name: str, value: str):
+        self.ensure_schema()
+        with self.connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+
+class IngestLog(MetaFile):
+    """Web app side: idempotency keys of the transcripts already stored"""
+
+    def __init__(self, path: Path):
+        super().__init__(path, INGEST_LOG_SCHEMA)
+
+    def seen(self, key: str) -> bool:
+        self.ensure_schema()
+        with self.connect() as conn:
+            return conn.execute("SELECT 1 FROM ingested WHERE key = ?", (key,)).fetchone() is not None
+
+    def add(self, key: str, filename: str):
+        self.ensure_schema()
+        with self.connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO ingested (key, filename, received_at) VALUES (?, ?, ?)",
+                         (key, filename, int(time.time())))
+
+    def store_id(self) -> str:
+        """Random id of this copy of the web app's data, created along with the file"""
+        self.ensure_schema()
+        with self.connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('store_id', ?)", (uuid.uuid4().hex,))
+            return conn.execute("SELECT value FROM meta WHERE name = 'store_id'").fetchone()[0]
+
+
+def _copy_exact(stream, size: int, write: Optional[Callable[[bytes], None]]):
+    """Move exactly `size` bytes from the stream to `write` (or discard them)"""
+    remaining = size
+    while remaining:
+        chunk = stream.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise ValueError("batch ended in the middle of a file")
+        if write is not None:
+            write(chunk)
+        remaining -= len(chunk)
+
+
+def _store_attachment(stream, attachments: TranscriptStorage, name: str, size: int):
+    """Store an archived file from the batch, refusing content that does not match its hash"""
+    digest = hashlib.sha256()
+    with attachments.open_write(name) as writer:
+        def write(chunk: bytes):
+            digest.update(chunk)
+            writer.write(chunk)
+        _copy_exact(stream, size, write)
+        if digest.hexdigest() != name[:64]:
+            raise ValueError(f"attachment {name} does not match its hash")
+
+
+def apply_batch(stream, storage: TranscriptStorage, ingest_log: IngestLog,
+                on_stored: Callable[[Dict], None]) -> Dict[str, int]:
+    """Store every new transcript in a batch stream; returns counts of accepted and duplicate entries.
+
+    `on_stored` is called with each new entry once its files are in storage,
+    before its key is logged, so a failure there leaves the entry to be sent
+    again. Raises ValueError for a malformed batch; entries before the bad one
+    stay stored.
+    """
+    accepted = duplicates = 0
+    attachments = attachment_storage(storage)
+    while True:
+        line = stream.readline()
+        if not line:
+            break
+        entry = json.loads(line)
+        if not isinstance(entry, dict):
+            raise ValueError("batch entry is not an object")
+        key, filename, files = entry.get("key"), entry.get("filename"), entry.get("files")
+        if not isinstance(key, str) or not isinstance(filename, str) or not isinstance(files, list):
+            raise ValueError("batch entry needs a key, a filename and a file list")
+        if not filename.endswith(".html"):
+            raise ValueError(f"invalid transcript file name {filename!r}")
+        check_name(filename)
+        allowed = set(transcript_files(filename))
+        duplicate = ingest_log.seen(key)
+        for item in files:
+            if not isinstance(item, dict):
+                raise ValueError(f"file list of {filename} holds a non-object")
+            name, size = item.get("name"), item.get("size")
+            attachment = item.get("attachment") is True
+            known = is_stored_name(name) if attachment and isinstance(name, str) else name in allowed
+            if not known or not isinstance(size, int) or size < 0:
+                raise ValueError(f"unexpected file {name!r} for {filename}")
+            if duplicate or (attachment and attachments.stat(name) is not None):
+                _copy_exact(stream, size, None)
+                continue
+            if attachment:
+                _store_attachment(stream, attachments, name, size)
+                continue
+            with storage.open_write(name) as writer:
+                _copy_exact(stream, size, writer.write)
+        if duplicate:
+            duplicates += 1
+            continue
+        on_stored(entry)
+        ingest_log.add(key, filename)
+        accepted += 1
+    return {"accepted": accepted, "duplicates": duplicates}
+
+
+def open_batch(stream, content_encoding: Optional[str]):
+    """Wrap a request body for reading, undoing its Content-Encoding"""
+    if content_encoding == "gzip":
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    if content_encoding in (None, "", "identity"):
+        return stream
+    raise ValueError(f"unsupported Content-Encoding {content_encoding!r}")
+
+
+class Outbox(MetaFile):
+    """Bot side: transcripts waiting to be pushed, oldest first"""
+
+    def __init__(self, path: Path):
+        super().__init__(path, OUTBOX_SCHEMA)
+
+    def add(self, entry: Dict) -> str:
+        self.ensure_schema()
+        key = entry.setdefault("key", uuid.uuid4().hex)
+        with self.connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO outbox (key, entry) VALUES (?, ?)",
+                         (key, json.dumps(entry, ensure_ascii=False)))
+        return key
+
+    def peek(self, limit: int) -> List[Dict]:
+        self.ensure_schema()
+        with self.connect() as conn:
+            return [json.loads(row[0]) for row in
+                    conn.execute("SELECT entry FROM outbox ORDER BY seq LIMIT ?", (limit,))]
+
+    def remove(self, keys: List[str]):
+        with self.connect() as conn:
+            conn.executemany("DELETE FROM outbox WHERE key = ?", [(key,) for key in keys])
+
+    def count(self) -> int:
+        self.ensure_schema()
+        with self.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def filenames(self) -> Set[str]:
+        self.ensure_schema()
+        with self.connect() as conn:
+            return {json.loads(row[0])["filename"] for row in conn.execute("SELECT entry FROM outbox")}
+
+
+class IngestClient:
+    def __init__(self, url: str, token: str, storage: TranscriptStorage, outbox_path: Path,
+                 batch_seconds: float = 2.0, batch_max_items: int = 50, batch_max_bytes: int = 32 * 1024 * 1024,
+                 max_backoff: float = 300.0, catalog=None, resync_seconds: float = 600.0):
+        self.url = url
+        # The missing-transcripts check lives next to the ingest endpoint
+        self.missing_url = url.rstrip("/") + MISSING_PATH[len(INGEST_PATH):]
+        self.token = token
+        self.storage = storage
+        self.attachments = attachment_storage(storage)
+        self.outbox = Outbox(outbox_path)
+        # Source of the filenames offered to the web app on resync; None disables resync
+        self.catalog = catalog
+        self.resync_seconds = resync_seconds
+        self.batch_seconds = batch_seconds
+        self.batch_max_items = batch_max_items
+        self.batch_max_bytes = batch_max_bytes
+        self.max_backoff = max_backoff
+        self.session = None
+        self._run_io: Optional[Callable[..., Awaitable]] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._resync_wake: Optional[asyncio.Event] = None
+        self._resync_task: Optional[asyncio.Task] = None
+        self._synced_store: Optional[str] = None
+        self.pushed = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.retries = 0
+        self.resynced = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.session is not None
+
+    def start(self, run_io: Callable[..., Awaitable]):
+        """Open the HTTP session and start sending whatever the outbox already holds"""
+        if aiohttp is None:
+            print("❌ aiohttp is not installed; transcripts will not be pushed to the web app")
+            return
+        self._run_io = run_io
+        self._wake = asyncio.Event()
+        self._wake.set()
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=30,
+                                                                           sock_read=300))
+        self._task = asyncio.create_task(self._run())
+        if self.catalog is not None and self.resync_seconds > 0:
+            self._resync_wake = asyncio.Event()
+            self._resync_task = asyncio.create_task(self._resync_loop())
+
+    async def close(self):
+        """Stop sending; unsent entries stay in the outbox for the next start"""
+        for task in (self._task, self._resync_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = self._resync_task = None
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def push(self, entry: Dict) -> str:
+        """Queue a stored transcript (its filename and catalog fields) for sending; returns its key"""
+        key = await self._run_io(self.outbox.add, dict(entry))
+        self._wake.set()
+        return key
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            # Let a burst of transcripts gather into the same batch
+            await asyncio.sleep(self.batch_seconds)
+            try:
+                while await self._send_next_batch():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Error pushing transcripts: {e}")
+                await asyncio.sleep(self.batch_seconds)
+                self._wake.set()
+
+    async def _send_next_batch(self) -> bool:
+        """Send the oldest entries, retrying until the web app takes them; False once the outbox is empty"""
+        entries = await self._run_io(self._build_batch)
+        if not entries:
+            return False
+
+        attempt = 0
+        started = time.perf_counter()
+        while True:
+            status, detail, retry_after = await self._post(entries)
+            if 200 <= status < 300:
+                self.pushed += detail.get("accepted", 0)
+                self.duplicates += detail.get("duplicates", 0)
+                store = detail.pop("store", None)
+                if store and store != self._synced_store and self._resync_wake is not None:
+                    # The web app lost its data since the last sync (or was never synced)
+                    self._resync_wake.set()
+                break
+            if status and status < 500 and status not in RETRY_STATUSES:
+                # The web app will never take this batch; keep the outbox moving
+                self.dropped += len(entries)
+                print(f"❌ Web app rejected {len(entries)} transcripts ({status}): {detail}")
+                break
+            attempt += 1
+            self.retries += 1
+            delay = retry_after if retry_after is not None else min(self.max_backoff, 2 ** attempt)
+            delay *= random.uniform(0.8, 1.2)
+            print(f"❌ Pushing transcripts failed ({status or detail}); retry {attempt} in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            if not status:
+                # The failure may be on this side: a file packed, expired or rewritten since the
+                # batch was built. Re-stat so vanished entries are dropped and sizes are current
+                entries = await self._run_io(self._build_batch)
+                if not entries:
+                    return True
+
+        await self._run_io(self.outbox.remove, [entry["key"] for entry in entries])
+        log_event("transcripts_pushed", entries=len(entries), attempts=attempt + 1,
+                  bytes=sum(item["size"] for entry in entries for item in entry["files"]),
+                  ms=round((time.perf_counter() - started) * 1000, 1), **detail)
+        return True
+
+    def _build_batch(self) -> List[Dict]:
+        """The oldest outbox entries that fit the batch limits, with their files' current sizes"""
+        batch, total = [], 0
+        missing = []
+        for entry in self.outbox.peek(self.batch_max_items):
+            files = []
+            for name in transcript_files(entry["filename"]):
+                stored = self.storage.stat(name)
+                if stored is not None:
+                    files.append({"name": name, "size": stored.size})
+            if not any(item["name"] == entry["filename"] for item in files):
+                # Deleted before it could be sent (retention)
+                missing.append(entry["key"])
+                continue
+            files = self._attachment_files(entry["filename"]) + files
+            size = sum(item["size"] for item in files)
+            if batch and total + size > self.batch_max_bytes:
+                break
+            batch.append(dict(entry, files=files))
+            total += size
+        if missing:
+            self.outbox.remove(missing)
+            self.dropped += len(missing)
+        return batch
+
+    def _attachment_files(self, html_filename: str) -> List[Dict]:
+        """Archived files the transcript's record links to, so the web app can serve them too"""
+        try:
+            with self.storage.open_read(sidecar_path(Path(html_filename)).name) as f:
+                names = referenced_names(f)
+        except FileNotFoundError:
+            return []
+        files = []
+        for name in sorted(names):
+            stored = self.attachments.stat(name)
+            if stored is not None:
+                files.append({"name": name, "size": stored.size, "attachment": True})
+        return files
+
+    async def _post(self, entries: List[Dict]) -> Tuple[int, Dict, Optional[float]]:
+        """One attempt; returns (status, response JSON or error, Retry-After seconds)"""
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": BATCH_CONTENT_TYPE,
+            "Content-Encoding": "gzip"
+        }
+        try:
+            async with self.session.post(self.url, data=self._stream_batch(entries), headers=headers) as response:
+                try:
+                    detail = await response.json(content_type=None)
+                except ValueError:
+                    detail = {"error": (await response.text())[:200]}
+                retry_after = response.headers.get("Retry-After")
+                return (response.status, detail if isinstance(detail, dict) else {},
+                        float(retry_after) if retry_after and retry_after.isdigit() else None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as e:
+            return 0, {"error": str(e) or type(e).__name__}, None
+
+    async def _stream_batch(self, entries: List[Dict]):
+        """Yield the gzip-compressed batch, reading files from storage a chunk at a time"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for entry in entries:
+            yield compressor.compress(json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n")
+            for item in entry["files"]:
+                source = self.attachments if item.get("attachment") else self.storage
+                f = await self._run_io(source.open_read, item["name"])
+                try:
+                    remaining = item["size"]
+                    while remaining:
+                        chunk = await self._run_io(f.read, min(CHUNK_SIZE, remaining))
+                        if not chunk:
+                            raise ValueError(f"{item['name']} is shorter than when the batch was built")
+                        remaining -= len(chunk)
+                        data = compressor.compress(chunk)
+                        if data:
+                            yield data
+                finally:
+                    await self._run_io(f.close)
+        yield compressor.flush()
+
+    async def _resync_loop(self):
+        while True:
+            try:
+                await self.resync_if_needed()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Error resyncing transcripts with the web app: {e}")
+            try:
+                await asyncio.wait_for(self._resync_wake.wait(), self.resync_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._resync_wake.clear()
+
+    async def resync_if_needed(self) -> int:
+        """Queue again what the web app is missing if its store changed since the last sync; returns entries queued"""
+        status, detail = await self._check_missing([])
+        store = detail.get("store")
+        if status != 200 or not isinstance(store, str):
+            raise RuntimeError(f"missing-transcripts check failed ({status or detail})")
+        if self._synced_store is None:
+            self._synced_store = await self._run_io(self.outbox.get_meta, "synced_store")
+        if store == self._synced_store:
+            return 0
+        queued = await self._resync(store)
+        await self._run_io(self.outbox.set_meta, "synced_store", store)
+        self._synced_store = store
+        return queued
+
+    async def _resync(self, store: str) -> int:
+        """Offer every cataloged filename to the web app and queue the ones it lacks"""
+        started = time.perf_counter()
+        rows = self.catalog.iter_range(batch=RESYNC_BATCH)
+        pending = await self._run_io(self.outbox.filenames)
+        checked = queued = 0
+        while True:
+            batch = await self._run_io(list, islice(rows, RESYNC_BATCH))
+            if not batch:
+                break
+            checked += len(batch)
+            status, detail = await self._check_missing([row["filename"] for row in batch])
+            if status != 200 or not isinstance(detail.get("missing"), list):
+                raise RuntimeError(f"missing-transcripts check failed ({status or detail})")
+            if detail.get("store") != store:
+                raise RuntimeError("the web app's store changed during the resync")
+            missing = set(detail["missing"])
+            entries = [catalog_entry(row) for row in batch
+                       if row["filename"] in missing and row["filename"] not in pending]
+            if entries:
+                await self._run_io(self._queue_entries, entries)
+                queued += len(entries)
+                self._wake.set()
+        self.resynced += queued
+        log_event("ingest_resync", checked=checked, queued=queued,
+                  ms=round((time.perf_counter() - started) * 1000, 1))
+        if queued:
+            print(f"✅ Queued {queued} transcripts missing from the web app")
+        return queued
+
+    def _queue_entries(self, entries: Iterable[Dict]):
+        for entry in entries:
+            self.outbox.add(entry)
+
+    async def _check_missing(self, filenames: List[str]) -> Tuple[int, Dict]:
+        """Ask which of `filenames` the web app lacks; returns (status, response JSON or error)"""
+        headers = {"Authorization": f"Bearer {self.token}"}
+        try:
+            async with self.session.post(self.missing_url, json={"filenames": filenames},
+                                         headers=headers) as response:
+                try:
+                    detail = await response.json(content_type=None)
+                except ValueError:
+                    detail = {"error": (await response.text())[:200]}
+                return response.status, detail if isinstance(detail, dict) else {}
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            return 0, {"error": str(e) or type(e).__name__}
+
+    def stats(self) -> Dict[str, int]:
+        return {"pushed": self.pushed, "duplicates": self.duplicates, "dropped": self.dropped,
+                "retries": self.retries, "resynced": self.resynced}
@@ -0,0 +1,106 @@
+"""Background queue for transcript generation.
+
+Jobs are keyed by channel id. A request for a channel that already has a
+queued or running job shares that job's future, so repeated clicks on
+Transcript produce one transcript. Blocking file I/O runs on a small
+thread pool via ``run_io`` so it never stalls the event loop.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+
+class TranscriptJob:
+    def __init__(self, channel_id: int, factory: Callable[[], Awaitable], future: asyncio.Future):
+        self.channel_id = channel_id
+        self.factory = factory
+        self.future = future
+        self.state = "queued"
+
+
+class TranscriptJobQueue:
+    def __init__(self, workers: int = 2, io_threads: int = 2):
+        self.worker_count = max(1, workers)
+        self.io_threads = max(1, io_threads)
+        self.io_pool: Optional[ThreadPoolExecutor] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.jobs: Dict[int, TranscriptJob] = {}
+        self._workers = []
+        self._closing = False
+        self._io_closed = False
+
+    def start(self):
+        """Start the worker tasks on the running event loop"""
+        self.queue = asyncio.Queue()
+        self._closing = False
+        self._io_closed = False
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    def submit(self, channel_id: int, factory: Callable[[], Awaitable]) -> Tuple[asyncio.Future, bool]:
+        """Queue a job for a channel.
+
+        Returns the job's future and whether the request was coalesced into a
+        job that was already queued or running for the same channel.
+        """
+        existing = self.jobs.get(channel_id)
+        if existing is not None:
+            return existing.future, True
+
+        future = asyncio.get_running_loop().create_future()
+        if self._closing or self.queue is None:
+            future.set_exception(RuntimeError("Transcript queue is shutting down"))
+            return future, False
+
+        job = TranscriptJob(channel_id, factory, future)
+        self.jobs[channel_id] = job
+        self.queue.put_nowait(job)
+        return future, False
+
+    def status(self, channel_id: int) -> Optional[str]:
+        """"queued" or "running" for a channel with a pending job, otherwise None"""
+        job = self.jobs.get(channel_id)
+        return job.state if job else None
+
+    async def run_io(self, func, *args):
+        """Run a blocking call on the I/O thread pool"""
+        if self._io_closed:
+            raise RuntimeError("Transcript I/O pool is shut down")
+        if self.io_pool is None:
+            self.io_pool = ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix="transcript-io")
+        return await asyncio.get_running_loop().run_in_executor(self.io_pool, func, *args)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            job.state = "running"
+            try:
+                result = await job.factory()
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self.jobs.pop(job.channel_id, None)
+                self.queue.task_done()
+
+    async def drain(self):
+        """Stop accepting jobs, finish everything queued, then stop the workers.
+
+        The I/O pool stays up for final flushes until ``close`` is called.
+        """
+        self._closing = True
+        if self.queue is not None:
+            await self.queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def close(self):
+        """Shut down the I/O pool; later ``run_io`` calls fail instead of starting a new one"""
+        self._io_closed = True
+        if self.io_pool is not None:
+            self.io_pool.shutdown(wait=True)
+            self.io_pool = None
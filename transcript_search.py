@@ -0,0 +1,175 @@
+"""Full-text index of transcript messages.
+
+Message content, author name, author id and channel name of every transcript are stored in
+an SQLite FTS5 table next to the transcripts. Lookups use the inverted
+index, so query time does not grow with the size of the archive. The bot
+indexes each transcript as it is saved.
+
+Run ``python transcript_search.py [transcripts_dir]`` once to index
+transcripts written before the index existed.
+"""
+import html
+import json
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from transcript_catalog import SQLiteFile
+from transcript_format import SIDECAR_VERSION, parse_transcript_html, sidecar_path
+
+SEARCH_FILENAME = "search.sqlite3"
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+    content,
+    author,
+    author_id,
+    channel_name,
+    filename UNINDEXED,
+    position UNINDEXED,
+    timestamp UNINDEXED,
+    tokenize = 'unicode61'
+);
+"""
+
+# Column weights for bm25(): content, author, author id, channel name, then unindexed columns
+RANK = "bm25(messages, 1.0, 2.0, 2.0, 0.5, 0.0, 0.0, 0.0)"
+
+# Control characters mark snippet highlights so the text can be escaped safely
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+
+class SearchIndex(SQLiteFile):
+    row_factory = sqlite3.Row
+
+    def __init__(self, path: Path):
+        super().__init__(path, SCHEMA)
+
+    def index_transcript(self, filename: str, channel_name: str, messages: Iterable[Dict]) -> int:
+        """Replace the indexed messages of one transcript; returns the number indexed"""
+        self.ensure_schema()
+        rows = (
+            (msg.get("content", ""), msg.get("author", ""), str(msg.get("author_id") or ""), channel_name,
+             filename, position, msg.get("timestamp", ""))
+            for position, msg in enumerate(messages)
+        )
+        with self.connect() as conn:
+            conn.execute("DELETE FROM messages WHERE filename = ?", (filename,))
+            cursor = conn.executemany(
+                "INSERT INTO messages (content, author, author_id, channel_name, filename, position, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            return cursor.rowcount
+
+    def index_record(self, filename: str, record_file) -> Optional[int]:
+        """Index a transcript from its open binary record; None if the record is from an unknown version"""
+        # Stream the record line by line so large transcripts are not held in memory
+        header = json.loads(record_file.readline())
+        if header.get("version") != SIDECAR_VERSION:
+            return None
+        messages = (json.loads(line) for line in record_file if line.strip())
+        return self.index_transcript(filename, header.get("channel_name", ""), messages)
+
+    def index_file(self, html_path: Path) -> int:
+        """Index a transcript page from its record, or by parsing the page if it has none"""
+        html_path = Path(html_path)
+        try:
+            with open(sidecar_path(html_path), "rb") as f:
+                count = self.index_record(html_path.name, f)
+            if count is not None:
+                return count
+        except (OSError, ValueError):
+            pass
+
+        with open(html_path, "r", encoding="utf-8") as f:
+            messages = parse_transcript_html(f.read())
+        channel_name = html_path.stem[len("transcript-"):].rsplit("-", 2)[0]
+        return self.index_transcript(html_path.name, channel_name, messages)
+
+    def remove(self, filename: str):
+        if not self.path.exists():
+            return
+        self.ensure_schema()
+        with self.connect() as conn:
+            conn.execute("DELETE FROM messages WHERE filename = ?", (filename,))
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        """Return ranked message hits with HTML-safe snippets"""
+        match = build_match_query(query)
+        if not match or not self.path.exists():
+            return []
+        self.ensure_schema()
+        with self.connect() as conn:
+            rows = conn.execute(
+                f"SELECT filename, channel_name, author, author_id, position, timestamp, {RANK} AS score, "
+                f"snippet(messages, 0, ?, ?, '…', 16) AS snippet "
+                f"FROM messages WHERE messages MATCH ? ORDER BY score LIMIT ? OFFSET ?",
+                (_MARK_START, _MARK_END, match, limit, offset)
+            ).fetchall()
+        return [{
+            "filename": row["filename"],
+            "channel_name": row["channel_name"],
+            "author": row["author"],
+            "author_id": row["author_id"] or None,
+            "position": row["position"],
+            "timestamp": row["timestamp"],
+            "score": round(-row["score"], 4),
+            "snippet": highlight(row["snippet"])
+        } for row in rows]
+
+    def iter_author_filenames(self, author: str, batch: int = 500) -> Iterator[str]:
+        """Transcripts with messages by an author, in filename order.
+
+        `author` must equal the whole display name (ignoring ASCII case) or the
+        user id. A phrase match narrows the rows through the index first; it
+        also hits names that merely contain the phrase, so the columns are
+        then compared exactly.
+        """
+        author = author.strip()
+        if not author or not self.path.exists():
+            return
+        self.ensure_schema()
+        query = "SELECT DISTINCT filename FROM messages WHERE (author = ? COLLATE NOCASE OR author_id = ?)"
+        params: list = [author, author]
+        if any(ch.isalnum() for ch in author):
+            query += " AND messages MATCH ?"
+            params.append('{author author_id} : "' + author.replace('"', '""') + '"')
+        query += " AND filename > ? ORDER BY filename LIMIT ?"
+        after = ""
+        while True:
+            with self.connect() as conn:
+                filenames = [row[0] for row in conn.execute(query, params + [after, batch])]
+            yield from filenames
+            if len(filenames) < batch:
+                return
+            after = filenames[-1]
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query matching all terms (``term*`` for prefixes)"""
+    terms = []
+    for term in query.split():
+        prefix = term.endswith("*")
+        term = term.rstrip("*").replace('"', '""')
+        if term:
+            terms.append(f'"{term}"' + ("*" if prefix else ""))
+    return " ".join(terms) or None
+
+
+def highlight(snippet: str) -> str:
+    """Escape a snippet and turn the highlight markers into <mark> tags"""
+    return html.escape(snippet or "").replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def rebuild_from_directory(transcripts_dir: Path) -> int:
+    """Index every transcript page in a directory; returns the number of messages indexed"""
+    transcripts_dir = Path(transcripts_dir)
+    index = SearchIndex(transcripts_dir / SEARCH_FILENAME)
+    return sum(index.index_file(html_path) for html_path in transcripts_dir.glob("transcript-*.html"))
+
+
+if __name__ == "__main__":
+    directory = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "transcripts"
+    print(f"✅ Indexed {rebuild_from_directory(directory)} messages")
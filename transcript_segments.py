@@ -0,0 +1,261 @@
+"""Retention and packing of old transcripts into segment files.
+
+Transcripts newer than ``loose_days`` stay in the transcripts directory as
+loose files. Older ones are appended, together with their message record
+and compressed copies, to the segment for the month they were written in
+(``segments/<YYYY-MM>.seg``) and removed from the directory. Segments are
+append-only. ``segments/index.sqlite3`` maps each packed file to its
+segment, byte offset and length, so the web app serves a packed transcript
+under its original URL with a single seek.
+
+With ``retention_days`` set, loose transcripts older than that are deleted,
+and a month's segment is deleted once everything in it is older than that.
+Deleted transcripts are also dropped from the catalog and search index, and
+archived attachments that no remaining record links to are deleted.
+
+Run ``python transcript_segments.py [transcripts_dir] [loose_days] [retention_days]``
+to compact by hand.
+"""
+import io
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from transcript_attachments import ATTACHMENTS_DIRNAME, prune_attachments, referenced_names
+from transcript_catalog import SQLiteFile
+from transcript_format import CHUNK_SIZE, COMPRESSED_SUFFIXES, SIDECAR_SUFFIX, compressed_path, sidecar_path
+
+SEGMENTS_DIRNAME = "segments"
+SEGMENT_INDEX_FILENAME = "index.sqlite3"
+SEGMENT_SUFFIX = ".seg"
+# Attachments this new are never pruned; their transcript may still be being written
+ATTACHMENT_GRACE_SECONDS = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS members (
+    filename TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    PRIMARY KEY (filename, kind)
+);
+CREATE INDEX IF NOT EXISTS members_by_segment ON members (segment);
+"""
+
+
+def member_paths(html_path: Path) -> Dict[str, Path]:
+    """Files packed for one transcript, by kind: the page, its record and compressed copies"""
+    paths = {"html": html_path, "record": sidecar_path(html_path)}
+    for encoding in COMPRESSED_SUFFIXES:
+        paths[encoding] = compressed_path(html_path, encoding)
+    return paths
+
+
+class PackedMember:
+    def __init__(self, path: Path, offset: int, length: int, mtime: int):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.mtime = mtime
+
+    def open(self) -> io.BufferedReader:
+        """Open the member as a read-only binary file of its own"""
+        return io.BufferedReader(SegmentMemberIO(self.path, self.offset, self.length))
+
+
+class SegmentMemberIO(io.RawIOBase):
+    """A byte range of a segment file, readable and seekable like a file of its own"""
+
+    def __init__(self, path: Path, offset: int, length: int):
+        super().__init__()
+        self._f = open(path, "rb", buffering=0)
+        self.offset = offset
+        self.length = length
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self.length - self.pos)
+        if size <= 0:
+            return 0
+        self._f.seek(self.offset + self.pos)
+        read = self._f.readinto(memoryview(buffer)[:size])
+        self.pos += read
+        return read
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            pos += self.pos
+        elif whence == io.SEEK_END:
+            pos += self.length
+        self.pos = max(0, pos)
+        return self.pos
+
+    def tell(self) -> int:
+        return self.pos
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+class SegmentStore(SQLiteFile):
+    def __init__(self, transcripts_dir: Path):
+        self.transcripts_dir = Path(transcripts_dir)
+        self.directory = self.transcripts_dir / SEGMENTS_DIRNAME
+        super().__init__(self.directory / SEGMENT_INDEX_FILENAME, SCHEMA)
+
+    def lookup(self, filename: str) -> Dict[str, PackedMember]:
+        """Packed members of a transcript by kind; empty if it is not packed"""
+        if not self.path.exists():
+            return {}
+        with self.connect() as conn:
+            rows = conn.execute("SELECT kind, segment, offset, length, mtime FROM members WHERE filename = ?",
+                                (filename,)).fetchall()
+        return {kind: PackedMember(self.directory / segment, offset, length, mtime)
+                for kind, segment, offset, length, mtime in rows}
+
+    def compact(self, loose_days: float, retention_days: float = 0, catalog=None, search_index=None,
+                now: Optional[float] = None) -> Dict[str, int]:
+        """Pack loose transcripts older than `loose_days` and apply the retention period.
+
+        Returns counts of transcripts packed and deleted, and of attachments
+        deleted. Deleted transcripts are removed from `catalog` and
+        `search_index` when given.
+        """
+        now = time.time() if now is None else now
+        self.ensure_schema()
+        pack_before = now - loose_days * 86400
+        delete_before = now - retention_days * 86400 if retention_days else None
+
+        to_pack: Dict[str, List[Path]] = {}
+        deleted: List[str] = []
+        with os.scandir(self.transcripts_dir) as entries:
+            for entry in entries:
+                if not (entry.name.startswith("transcript-") and entry.name.endswith(".html")):
+                    continue
+                mtime = entry.stat().st_mtime
+                if delete_before is not None and mtime < delete_before:
+                    self._unlink_loose(Path(entry.path))
+                    deleted.append(entry.name)
+                elif mtime < pack_before:
+                    month = time.strftime("%Y-%m", time.gmtime(mtime))
+                    to_pack.setdefault(month, []).append(Path(entry.path))
+
+        packed = 0
+        for month, html_paths in sorted(to_pack.items()):
+            packed += self._pack(month + SEGMENT_SUFFIX, sorted(html_paths))
+
+        if delete_before is not None:
+            deleted += self._expire_segments(delete_before)
+
+        for filename in deleted:
+            if catalog is not None:
+                catalog.remove(filename)
+            if search_index is not None:
+                search_index.remove(filename)
+
+        attachments = 0
+        if deleted:
+            attachments = prune_attachments(self.transcripts_dir / ATTACHMENTS_DIRNAME,
+                                            self._referenced_attachments(), now - ATTACHMENT_GRACE_SECONDS)
+        return {"packed": packed, "deleted": len(deleted), "attachments_deleted": attachments}
+
+    def _referenced_attachments(self) -> Set[str]:
+        """Archived files linked from any remaining message record, loose or packed"""
+        names = set()
+        with os.scandir(self.transcripts_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith("transcript-") and entry.name.endswith(SIDECAR_SUFFIX):
+                    try:
+                        with open(entry.path, "rb") as f:
+                            names |= referenced_names(f)
+                    except FileNotFoundError:
+                        pass
+        with self.connect() as conn:
+            rows = conn.execute("SELECT segment, offset, length, mtime FROM members WHERE kind = 'record'").fetchall()
+        for segment, offset, length, mtime in rows:
+            with PackedMember(self.directory / segment, offset, length, mtime).open() as f:
+                names |= referenced_names(f)
+        return names
+
+    def _pack(self, segment: str, html_paths: List[Path]) -> int:
+        """Append transcripts to a segment, index them, then remove the loose files"""
+        with self.connect() as conn:
+            already = {row[0] for row in conn.execute("SELECT DISTINCT filename FROM members WHERE segment = ?",
+                                                      (segment,))}
+        rows = []
+        with open(self.directory / segment, "ab") as out:
+            out.seek(0, io.SEEK_END)
+            for html_path in html_paths:
+                if html_path.name in already:
+                    continue
+                mtime = int(html_path.stat().st_mtime)
+                for kind, path in member_paths(html_path).items():
+                    try:
+                        src = open(path, "rb")
+                    except FileNotFoundError:
+                        continue
+                    with src:
+                        offset = out.tell()
+                        shutil.copyfileobj(src, out, CHUNK_SIZE)
+                    rows.append((html_path.name, kind, segment, offset, out.tell() - offset, mtime))
+            out.flush()
+            os.fsync(out.fileno())
+
+        # Loose files go only once the index points at their packed copies
+        with self.connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO members (filename, kind, segment, offset, length, mtime) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        for html_path in html_paths:
+            self._unlink_loose(html_path)
+        return len({row[0] for row in rows})
+
+    def _expire_segments(self, delete_before: float) -> List[str]:
+        """Delete segments whose newest transcript is older than the cutoff; returns their transcripts"""
+        with self.connect() as conn:
+            expired = [row[0] for row in conn.execute(
+                "SELECT segment FROM members GROUP BY segment HAVING MAX(mtime) < ?", (int(delete_before),))]
+        deleted = []
+        for segment in expired:
+            with self.connect() as conn:
+                deleted += [row[0] for row in conn.execute(
+                    "SELECT DISTINCT filename FROM members WHERE segment = ?", (segment,))]
+                conn.execute("DELETE FROM members WHERE segment = ?", (segment,))
+            try:
+                (self.directory / segment).unlink()
+            except FileNotFoundError:
+                pass
+        return deleted
+
+    @staticmethod
+    def _unlink_loose(html_path: Path):
+        for path in member_paths(html_path).values():
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+if __name__ == "__main__":
+    directory = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / "transcripts"
+    loose = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+    retention = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    from transcript_catalog import CATALOG_FILENAME, TranscriptCatalog
+    from transcript_search import SEARCH_FILENAME, SearchIndex
+    result = SegmentStore(directory).compact(loose, retention, TranscriptCatalog(directory / CATALOG_FILENAME),
+                                             SearchIndex(directory / SEARCH_FILENAME))
+    print(f"✅ Packed {result['packed']} transcripts, deleted {result['deleted']} "
+          f"and {result['attachments_deleted']} unreferenced attachments")
@@ -0,0 +1,534 @@
+"""Where transcript pages, their records and compressed copies are stored.
+
+The bot writes transcript files through a storage backend and the web app
+reads them through one, so the two can run on different machines:
+
+- ``LocalStorage`` keeps files in the transcripts directory. It is the
+  default, and the only layout segment packing applies to.
+- ``S3Storage`` keeps them in an S3-compatible bucket (AWS S3, MinIO, R2...).
+  Writes are streamed up as multipart uploads, so a large transcript is never
+  held in memory, and reads stream the object body.
+- ``ReadThroughCache`` wraps a remote backend on web nodes. The first read of
+  a file copies it into a local directory and later reads are served from
+  there, by sendfile or the front proxy. Transcript files are never
+  rewritten, so cached copies never go stale; the least recently used are
+  evicted once the cache outgrows its budget. Misses are remembered for a
+  few seconds, so repeated lookups of a missing file (a 404, a packed
+  transcript, an encoding that was never written) do not each cost a
+  request to the backend.
+
+``child(dirname)`` gives a backend for a subdirectory (or key prefix) of
+another one; archived attachments are stored through it, so they follow
+transcripts onto S3 and are served through the same cache.
+
+``storage_from_env`` picks the backend:
+
+    TRANSCRIPT_STORAGE             local (default) or s3
+    TRANSCRIPT_S3_BUCKET           bucket name
+    TRANSCRIPT_S3_PREFIX           key prefix, e.g. "transcripts/"
+    TRANSCRIPT_S3_ENDPOINT         endpoint URL for S3-compatible servers, e.g. http://minio:9000
+    TRANSCRIPT_S3_REGION           region name
+    TRANSCRIPT_CACHE_DIR           web node cache directory (default <transcripts>/cache)
+    TRANSCRIPT_CACHE_DISK_BYTES    web node cache budget (default 1 GiB)
+    TRANSCRIPT_CACHE_MISS_SECONDS  how long a web node remembers a missing file (default 10)
+
+Credentials come from boto3's usual sources (AWS_ACCESS_KEY_ID and
+AWS_SECRET_ACCESS_KEY, a profile, or an instance role).
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from transcript_format import CHUNK_SIZE, available_encodings, compress_stream, compressed_path
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+# S3 rejects multipart parts under 5 MiB, except the last
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_CACHE_BYTES = 1024 * 1024 * 1024
+DEFAULT_MISS_SECONDS = 10.0
+MAX_MISSING_ENTRIES = 10_000
+
+
+class StoredFile(NamedTuple):
+    size: int
+    mtime: float
+
+
+def check_name(name: str) -> str:
+    """Reject names that could escape the storage root"""
+    if not name or "/" in name or "\\" in name or name.startswith("."):
+        raise ValueError(f"invalid transcript file name {name!r}")
+    return name
+
+
+class StorageWriter:
+    """A file being written; nothing is visible under its name until `commit`.
+
+    Used as a context manager it commits on success and aborts on error.
+    """
+
+    def write(self, data: bytes):
+        raise NotImplementedError
+
+    def commit(self):
+        raise NotImplementedError
+
+    def abort(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class TranscriptStorage:
+    # Directory that `local_path` results live under, when the backend has one
+    local_root: Optional[Path] = None
+
+    def open_write(self, name: str) -> StorageWriter:
+        raise NotImplementedError
+
+    def open_read(self, name: str):
+        """Open a stored file as a binary stream; raises FileNotFoundError"""
+        raise NotImplementedError
+
+    def stat(self, name: str) -> Optional[StoredFile]:
+        raise NotImplementedError
+
+    def delete(self, name: str):
+        raise NotImplementedError
+
+    def local_path(self, name: str) -> Optional[Path]:
+        """A path on this machine holding the file, or None if it is missing or not on local disk"""
+        return None
+
+    def child(self, dirname: str, fanout: int = 0) -> "TranscriptStorage":
+        """Storage for the files under `dirname`; local directories are split by the first `fanout` characters"""
+        raise NotImplementedError
+
+    def put_file(self, name: str, path: Path):
+        """Store a finished local file under `name`, consuming it"""
+        with open(path, "rb") as src, self.open_write(name) as dst:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                dst.write(chunk)
+        os.unlink(path)
+
+    def read_bytes(self, name: str) -> bytes:
+        with self.open_read(name) as f:
+            return f.read()
+
+
+class LocalWriter(StorageWriter):
+    def __init__(self, path: Path):
+        self.path = path
+        self.tmp = path.with_name(f".{path.name}.tmp")
+        self.file = open(self.tmp, "wb")
+
+    def write(self, data: bytes):
+        self.file.write(data)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        self.file.close()
+        try:
+            self.tmp.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class LocalStorage(TranscriptStorage):
+    def __init__(self, root: Path, fanout: int = 0):
+        self.root = Path(root)
+        self.local_root = self.root
+        self.fanout = fanout
+
+    def path(self, name: str) -> Path:
+        check_name(name)
+        if self.fanout:
+            return self.root / name[:self.fanout] / name
+        return self.root / name
+
+    def _target(self, name: str) -> Path:
+        path = self.path(name)
+        if self.fanout:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def open_write(self, name: str) -> StorageWriter:
+        return LocalWriter(self._target(name))
+
+    def open_read(self, name: str):
+        return open(self.path(name), "rb")
+
+    def stat(self, name: str) -> Optional[StoredFile]:
+        try:
+            stat = self.path(name).stat()
+        except FileNotFoundError:
+            return None
+        return StoredFile(stat.st_size, stat.st_mtime)
+
+    def delete(self, name: str):
+        try:
+            self.path(name).unlink()
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, name: str) -> Optional[Path]:
+        path = self.path(name)
+        return path if path.is_file() else None
+
+    def child(self, dirname: str, fanout: int = 0) -> "LocalStorage":
+        return LocalStorage(self.root / check_name(dirname), fanout)
+
+    def put_file(self, name: str, path: Path):
+        os.replace(path, self._target(name))
+
+
+def _is_missing(error: Exception) -> bool:
+    """Whether a botocore error means the object does not exist"""
+    code = (getattr(error, "response", None) or {}).get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+class StreamingBodyIO(io.RawIOBase):
+    """Raw file interface over an S3 response body, so it can be buffered and read by line"""
+
+    def __init__(self, body):
+        super().__init__()
+        self.body = body
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.body.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.body.close()
+        super().close()
+
+
+class S3Writer(StorageWriter):
+    """Upload in parts of `part_size` as data arrives; small files go up in a single request"""
+
+    def __init__(self, client, bucket: str, key: str, part_size: int, content_type: Optional[str]):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.extra = {"ContentType": content_type} if content_type else {}
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    def write(self, data: bytes):
+        self.buffer += data
+        while len(self.buffer) >= self.part_size:
+            part = bytes(self.buffer[:self.part_size])
+            del self.buffer[:self.part_size]
+            self._upload_part(part)
+
+    def _upload_part(self, data: bytes):
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, **self.extra)["UploadId"]
+        number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=number, Body=data)
+        self.parts.append({"PartNumber": number, "ETag": response["ETag"]})
+
+    def commit(self):
+        try:
+            if self.upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer), **self.extra)
+            else:
+                if self.buffer:
+                    self._upload_part(bytes(self.buffer))
+                self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                      MultipartUpload={"Parts": self.parts})
+        except Exception:
+            self.abort()
+            raise
+        self.buffer = bytearray()
+
+    def abort(self):
+        self.buffer = bytearray()
+        if self.upload_id is not None:
+            upload_id, self.upload_id = self.upload_id, None
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=upload_id)
+            except Exception as e:
+                # Bucket lifecycle rules clean up uploads that are never aborted
+                print(f"❌ Error aborting upload of {self.key}: {e}")
+
+
+class S3Storage(TranscriptStorage):
+    CONTENT_TYPES = {".html": "text/html; charset=utf-8", ".jsonl": "application/x-ndjson"}
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, part_size: int = DEFAULT_PART_SIZE, client=None):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("S3 transcript storage needs the boto3 package")
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+
+    def key(self, name: str) -> str:
+        return self.prefix + check_name(name)
+
+    def open_write(self, name: str) -> StorageWriter:
+        return S3Writer(self.client, self.bucket, self.key(name), self.part_size,
+                        self.CONTENT_TYPES.get(Path(name).suffix))
+
+    def open_read(self, name: str):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key(name))
+        except Exception as e:
+            if _is_missing(e):
+                raise FileNotFoundError(name) from e
+            raise
+        return io.BufferedReader(StreamingBodyIO(response["Body"]), CHUNK_SIZE)
+
+    def stat(self, name: str) -> Optional[StoredFile]:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+        except Exception as e:
+            if _is_missing(e):
+                return None
+            raise
+        return StoredFile(response["ContentLength"], response["LastModified"].timestamp())
+
+    def delete(self, name: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
+
+    def child(self, dirname: str, fanout: int = 0) -> "S3Storage":
+        # Keys need no fan-out
+        return S3Storage(self.bucket, self.prefix + check_name(dirname) + "/", part_size=self.part_size,
+                         client=self.client)
+
+
+class CacheWriter(StorageWriter):
+    """A backend writer that tells the cache once its file exists"""
+
+    def __init__(self, writer: StorageWriter, on_commit):
+        self.writer = writer
+        self.on_commit = on_commit
+
+    def write(self, data: bytes):
+        self.writer.write(data)
+
+    def commit(self):
+        self.writer.commit()
+        self.on_commit()
+
+    def abort(self):
+        self.writer.abort()
+
+
+class ReadThroughCache(TranscriptStorage):
+    """Serve a remote backend's files from a size-bounded local directory"""
+
+    def __init__(self, backend: TranscriptStorage, cache_dir: Path, max_bytes: int = DEFAULT_CACHE_BYTES,
+                 miss_seconds: float = DEFAULT_MISS_SECONDS):
+        self.backend = backend
+        self.cache_dir = Path(cache_dir)
+        self.local_root = self.cache_dir
+        self.max_bytes = max_bytes
+        self.miss_seconds = miss_seconds
+        self.lock = threading.Lock()
+        # name -> size, least recently used first
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        # name -> monotonic time until which it is known to be missing, oldest first
+        self.missing: "OrderedDict[str, float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.missing_hits = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        """Adopt files cached by an earlier run (or another worker), oldest access first"""
+        found = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    found.append((stat.st_atime, entry.name, stat.st_size))
+        for _, name, size in sorted(found):
+            self.entries[name] = size
+            self.total_bytes += size
+        self._evict()
+
+    def local_path(self, name: str) -> Optional[Path]:
+        path = self.cache_dir / check_name(name)
+        with self.lock:
+            if name in self.entries:
+                if path.is_file():
+                    self.entries.move_to_end(name)
+                    self.hits += 1
+                    return path
+                # Evicted by another worker sharing the directory
+                self.total_bytes -= self.entries.pop(name)
+            expires = self.missing.get(name)
+            if expires is not None:
+                if expires > time.monotonic():
+                    self.missing_hits += 1
+                    return None
+                del self.missing[name]
+            self.misses += 1
+        return self._fetch(name, path)
+
+    def _remember_missing(self, name: str):
+        if self.miss_seconds <= 0:
+            return
+        with self.lock:
+            self.missing[name] = time.monotonic() + self.miss_seconds
+            self.missing.move_to_end(name)
+            while len(self.missing) > MAX_MISSING_ENTRIES:
+                self.missing.popitem(last=False)
+
+    def _forget_missing(self, name: str):
+        with self.lock:
+            self.missing.pop(name, None)
+
+    def _fetch(self, name: str, path: Path) -> Optional[Path]:
+        stored = self.backend.stat(name)
+        if stored is None:
+            self._remember_missing(name)
+            return None
+        fd, tmp = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as out, self.backend.open_read(name) as src:
+                shutil.copyfileobj(src, out, CHUNK_SIZE)
+            # The stored modification time keeps ETags identical on every web node
+            os.utime(tmp, (stored.mtime, stored.mtime))
+            os.replace(tmp, path)
+        except FileNotFoundError:
+            self._unlink(Path(tmp))
+            self._remember_missing(name)
+            return None
+        except BaseException:
+            self._unlink(Path(tmp))
+            raise
+        with self.lock:
+            if name not in self.entries:
+                self.entries[name] = stored.size
+                self.total_bytes += stored.size
+            self._evict()
+        return path
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            # Requests already streaming the file keep their open handle
+            self._unlink(self.cache_dir / name)
+
+    @staticmethod
+    def _unlink(path: Path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def open_read(self, name: str):
+        path = self.local_path(name)
+        if path is None:
+            raise FileNotFoundError(name)
+        return open(path, "rb")
+
+    def stat(self, name: str) -> Optional[StoredFile]:
+        path = self.local_path(name)
+        if path is None:
+            return None
+        stat = path.stat()
+        return StoredFile(stat.st_size, stat.st_mtime)
+
+    def open_write(self, name: str) -> StorageWriter:
+        return CacheWriter(self.backend.open_write(name), lambda: self._forget_missing(name))
+
+    def put_file(self, name: str, path: Path):
+        self.backend.put_file(name, path)
+        self._forget_missing(name)
+
+    def child(self, dirname: str, fanout: int = 0) -> "ReadThroughCache":
+        """A cache of the backend's subdirectory, in a subdirectory of this cache with its own budget"""
+        return ReadThroughCache(self.backend.child(dirname, fanout), self.cache_dir / check_name(dirname),
+                                self.max_bytes, self.miss_seconds)
+
+    def delete(self, name: str):
+        self.backend.delete(name)
+        with self.lock:
+            size = self.entries.pop(check_name(name), None)
+            if size is not None:
+                self.total_bytes -= size
+        self._unlink(self.cache_dir / name)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.total_bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses,
+                    "missing": len(self.missing), "missing_hits": self.missing_hits}
+
+
+def compress_stored(storage: TranscriptStorage, name: str) -> List[str]:
+    """Write pre-compressed copies of a stored page, streaming it back once per encoding"""
+    written = []
+    for encoding in available_encodings():
+        with storage.open_read(name) as src, storage.open_write(compressed_path(Path(name), encoding).name) as dst:
+            compress_stream(src, dst, encoding)
+        written.append(encoding)
+    return written
+
+
+def storage_from_env(transcripts_dir: Path, cache: bool = False) -> TranscriptStorage:
+    """Build the configured backend; with `cache`, remote backends are wrapped in a local read-through cache"""
+    transcripts_dir = Path(transcripts_dir)
+    kind = os.environ.get("TRANSCRIPT_STORAGE", "local").lower()
+    if kind == "local":
+        return LocalStorage(transcripts_dir)
+    if kind != "s3":
+        raise ValueError(f"unknown TRANSCRIPT_STORAGE {kind!r}")
+
+    storage = S3Storage(
+        bucket=os.environ["TRANSCRIPT_S3_BUCKET"],
+        prefix=os.environ.get("TRANSCRIPT_S3_PREFIX", ""),
+        endpoint_url=os.environ.get("TRANSCRIPT_S3_ENDPOINT") or None,
+        region=os.environ.get("TRANSCRIPT_S3_REGION") or None
+    )
+    if not cache:
+        return storage
+    return ReadThroughCache(
+        storage,
+        Path(os.environ.get("TRANSCRIPT_CACHE_DIR", transcripts_dir / "cache")),
+        int(os.environ.get("TRANSCRIPT_CACHE_DISK_BYTES", DEFAULT_CACHE_BYTES)),
+        float(os.environ.get("TRANSCRIPT_CACHE_MISS_SECONDS", DEFAULT_MISS_SECONDS))
+    )
@@ -0,0 +1,77 @@
+"""Transcript page templates shared by the bot and the web app.
+
+Both processes render transcript pages from the same three Jinja templates
+in ``templates/``: the header, one message, and the footer. They are
+compiled once at import. The bot streams header, messages and footer into
+the saved page; the web app renders the first page of messages the same
+way and lets ``static/transcript.js`` load the rest. Styling lives in
+``static/transcript.css``, which pages link to with a content-versioned
+URL so browsers cache it instead of each page carrying its own copy.
+"""
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional
+
+from jinja2 import Environment, FileSystemLoader
+
+BASE_DIR = Path(__file__).parent
+TEMPLATES_DIR = BASE_DIR / "templates"
+STATIC_DIR = BASE_DIR / "static"
+
+STYLESHEET = "transcript.css"
+SCRIPT = "transcript.js"
+
+env = Environment(
+    loader=FileSystemLoader(str(TEMPLATES_DIR)),
+    autoescape=True,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    keep_trailing_newline=True
+)
+header_template = env.get_template("transcript_header.html")
+message_macro = env.get_template("transcript_message.html").module.message
+footer_template = env.get_template("transcript_footer.html")
+
+
+def _digest(paths) -> str:
+    sha = hashlib.sha1()
+    for path in paths:
+        sha.update(path.read_bytes())
+    return sha.hexdigest()[:8]
+
+
+# Changes whenever the stylesheet or script changes, so their URLs can be cached forever
+ASSET_VERSION = _digest([STATIC_DIR / STYLESHEET, STATIC_DIR / SCRIPT])
+
+# Changes whenever anything that affects a rendered page changes
+TEMPLATE_VERSION = _digest([TEMPLATES_DIR / name for name in
+                            ("transcript_header.html", "transcript_message.html", "transcript_footer.html")]
+                           + [STATIC_DIR / STYLESHEET, STATIC_DIR / SCRIPT])
+
+
+def asset_url(name: str, base_url: str = "") -> str:
+    """Versioned URL of a static asset; `base_url` is empty for links relative to the web app"""
+    return f"{base_url}/static/{name}?v={ASSET_VERSION}"
+
+
+def render_header(channel_name: str, generated_at: str, base_url: str = "") -> str:
+    """HTML up to and including the opening of the message list"""
+    return header_template.render(
+        channel_name=channel_name,
+        generated_at=generated_at,
+        stylesheet_url=asset_url(STYLESHEET, base_url)
+    )
+
+
+def render_message(msg: Dict, position: int) -> str:
+    """HTML for a single message record; `position` is its anchor in the page"""
+    return message_macro(msg, position)
+
+
+def render_footer(base_url: str = "", next_cursor: Optional[str] = None, api_url: Optional[str] = None) -> str:
+    """Close the message list and the page, adding the incremental loader when more pages exist"""
+    return footer_template.render(
+        next_cursor=next_cursor,
+        api_url=api_url,
+        script_url=asset_url(SCRIPT, base_url)
+    )
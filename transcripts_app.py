@@ -1,7 +1,31 @@
-from flask import Flask, send_file, render_template_string
+from flask import (Flask, Response, send_file, render_template, jsonify, request, make_response, abort, url_for, g,
+                   stream_with_context)
+from werkzeug.wsgi import wrap_file
+import gzip
+import hmac
+import itertools
+import json
+import mimetypes
 import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
+
+from metrics import CONTENT_TYPE, REGISTRY, bearer_matches, log_event
+from transcript_attachments import attachment_storage, is_stored_name
+from transcript_catalog import CATALOG_FILENAME, TranscriptCatalog
+from transcript_export import ZipStream
+from transcript_format import (CHUNK_SIZE, COMPRESSED_SUFFIXES, SIDECAR_VERSION, channel_name_from_filename,
+                               compressed_path, load_sidecar, parse_transcript_html, read_sidecar_page, sidecar_path)
+from transcript_ingest import (INGEST_LOG_FILENAME, INGEST_PATH, MISSING_PATH, RESYNC_BATCH, IngestLog,
+                               apply_batch, open_batch)
+from transcript_search import SEARCH_FILENAME, SearchIndex
+from transcript_segments import SegmentStore
+from transcript_storage import storage_from_env
+from transcript_templates import ASSET_VERSION, TEMPLATE_VERSION, render_footer, render_header, render_message
 
 app = Flask(__name__)
 
@@ -16,159 +40,424 @@ try:
 except Exception as e:
     print(f"❌ Error creating directory: {e}")
 
-# Simple HTML template for single transcript view
-SIMPLE_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Transcript #{{ channel_name }}</title>
-    <style>
-        body { 
-            font-family: Arial, sans-serif; 
-            margin: 20px; 
-            background: #f5f5f5; 
-        }
-        .container { 
-            max-width: 1200px; 
-            margin: 0 auto; 
-            background: white; 
-            padding: 20px; 
-            border-radius: 10px; 
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1); 
-        }
-        .header { 
-            text-align: center; 
-            margin-bottom: 20px; 
-            padding-bottom: 15px; 
-            border-bottom: 2px solid #eee; 
-        }
-        .message { 
-            margin: 10px 0; 
-            padding: 12px; 
-            border-left: 4px solid #007bff; 
-            background: #f8f9fa; 
-            border-radius: 5px; 
-        }
-        .timestamp { 
-            color: #6c757d; 
-            font-size: 0.9em; 
-            margin-bottom: 3px; 
-        }
-        .author { 
-            font-weight: bold; 
-            color: #495057; 
-        }
-        .content { 
-            margin: 5px 0; 
-            line-height: 1.4; 
-        }
-        .attachments { 
-            margin-top: 8px; 
-        }
-        .attachment { 
-            display: block; 
-            color: #007bff; 
-            text-decoration: none; 
-            margin: 3px 0; 
-            font-size: 0.9em; 
-        }
-        .attachment:hover { 
-            text-decoration: underline; 
-        }
-        .back-button { 
-            display: inline-block; 
-            margin: 15px 0; 
-            padding: 8px 16px; 
-            background: #6c757d; 
-            color: white; 
-            text-decoration: none; 
-            border-radius: 5px; 
-            font-size: 0.9em; 
-        }
-        .back-button:hover { 
-            background: #5a6268; 
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>Transcript #{{ channel_name }}</h1>
-            <p>Generated on {{ generated_time }}</p>
-        </div>
-        
-        <a href="javascript:history.back()" class="back-button">← Go Back</a>
-        
-        <div class="messages">
-            {% for msg in messages %}
-            <div class="message">
-                <div class="timestamp">{{ msg.timestamp }}</div>
-                <div class="author">{{ msg.author }}</div>
-                <div class="content">{{ msg.content }}</div>
-                {% if msg.attachments %}
-                <div class="attachments">
-                    {% for att in msg.attachments %}
-                    <a href="{{ att.url }}" class="attachment" target="_blank">📎 {{ att.filename }}</a>
-                    {% endfor %}
-                </div>
-                {% endif %}
-            </div>
-            {% endfor %}
-        </div>
-        
-        <a href="javascript:history.back()" class="back-button">← Go Back</a>
-    </div>
-</body>
-</html>
-"""
+# Per-worker budget for parsed transcripts kept in memory
+TRANSCRIPT_CACHE_BYTES = int(os.environ.get('TRANSCRIPT_CACHE_BYTES', 64 * 1024 * 1024))
+
+# "render" rebuilds the viewer page from the message record on each request;
+# "static" sends the page the bot wrote, pre-compressed when the client allows
+SERVE_MODE = os.environ.get('TRANSCRIPT_SERVE_MODE', 'render')
+
+# Pages are read from the configured storage; a remote store is cached on this node's disk
+storage = storage_from_env(TRANSCRIPTS_DIR, cache=True)
+attachments = attachment_storage(storage)
+
+# In static mode, pages can be handed to a front proxy instead of sent by the worker:
+# "X-Accel-Redirect" (nginx, with an internal location at TRANSCRIPT_ACCEL_PREFIX aliased
+# to the transcripts directory, or the cache directory with remote storage) or "X-Sendfile" (Apache mod_xsendfile, lighttpd)
+SENDFILE_HEADER = os.environ.get('TRANSCRIPT_SENDFILE_HEADER')
+ACCEL_REDIRECT_PREFIX = os.environ.get('TRANSCRIPT_ACCEL_PREFIX', '/_transcripts/')
+app.config['USE_X_SENDFILE'] = SENDFILE_HEADER == 'X-Sendfile'
+
+# The viewer renders this many messages up front and fetches the rest on scroll
+VIEWER_PAGE_SIZE = int(os.environ.get('TRANSCRIPT_VIEWER_PAGE_SIZE', 100))
+MAX_API_PAGE_SIZE = 500
+
+# Saved transcripts are never rewritten, so every transcript URL is immutable
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Listing of all transcripts, kept up to date by the bot
+catalog = TranscriptCatalog(TRANSCRIPTS_DIR / CATALOG_FILENAME)
+INDEX_PAGE_SIZE = 50
+MAX_INDEX_PAGE_SIZE = 200
+
+# Transcripts past the loose-file window are read from segment files by offset
+segment_store = SegmentStore(TRANSCRIPTS_DIR)
+
+# Full-text index of message content, authors and channel names
+search_index = SearchIndex(TRANSCRIPTS_DIR / SEARCH_FILENAME)
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+
+# Pages that expose more than one transcript require ?key= or X-Access-Key;
+# without a configured key they are disabled, so single transcript URLs stay the only way in
+ACCESS_KEY = os.environ.get('TRANSCRIPTS_ACCESS_KEY')
+
+# Bulk exports are streamed in chunks of about CHUNK_SIZE, one transcript at a time
+EXPORT_BATCH = 500
+EXPORT_FORMATS = {'zip': 'application/zip', 'jsonl': 'application/x-ndjson'}
+
+# The bot pushes transcripts to INGEST_PATH with this bearer token; unset disables the endpoint
+INGEST_TOKEN = os.environ.get('TRANSCRIPT_INGEST_TOKEN')
+ingest_log = IngestLog(TRANSCRIPTS_DIR / INGEST_LOG_FILENAME)
+
+# /metrics requires this bearer token; unset disables the endpoint
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Fraction of requests written to the structured request log; errors are always logged
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get('REQUEST_LOG_SAMPLE_RATE', 0.01))
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'transcripts_request_seconds', 'Request latency by endpoint and status', ['endpoint', 'status'])
+BYTES_SERVED = REGISTRY.counter('transcripts_bytes_served_total', 'Response body bytes sent', ['endpoint'])
+PARSE_SECONDS = REGISTRY.histogram(
+    'transcripts_parse_seconds', 'Time spent loading transcript messages', ['source'])
+
+# Part of the rendered page's ETag, so changing the templates invalidates caches
+RENDER_VERSION = TEMPLATE_VERSION
+
+
+class TranscriptCache:
+    """Least-recently-used cache of parsed transcripts, bounded by total bytes.
+
+    Entries are keyed on filename and remember the file's mtime and size, so a
+    rewritten file is treated as a miss. The cost of an entry is the size of
+    the transcript file it was parsed from.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, filename, signature):
+        with self.lock:
+            entry = self.entries.get(filename)
+            if entry is None or entry[0] != signature:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(filename)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, filename, signature, value, size):
+        with self.lock:
+            old = self.entries.pop(filename, None)
+            if old is not None:
+                self.total_bytes -= old[2]
+            if size > self.max_bytes:
+                return
+            self.entries[filename] = (signature, value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'pid': os.getpid(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+transcript_cache = TranscriptCache(TRANSCRIPT_CACHE_BYTES)
+
+def _cache_gauge(field):
+    return lambda: {(): transcript_cache.stats()[field]}
+
+REGISTRY.gauge('transcripts_cache_entries', 'Parsed transcripts held by this worker', [], _cache_gauge('entries'))
+REGISTRY.gauge('transcripts_cache_bytes', 'Size of the parsed transcripts held by this worker', [], _cache_gauge('bytes'))
+
+class TranscriptSource:
+    """A transcript's files: loose in storage (at a local path), or packed into a segment"""
+
+    def __init__(self, filename, path=None, packed=None):
+        self.filename = filename
+        self.path = path
+        self.packed = packed or {}
+
+    def open_record(self):
+        """The message record as a path or open binary file, or None if there is none"""
+        if not self.packed:
+            return storage.local_path(sidecar_path(self.path).name)
+        member = self.packed.get('record')
+        return member.open() if member else None
+
+    def open_html(self):
+        """The page as an open binary file"""
+        return self.packed['html'].open() if self.packed else open(self.path, 'rb')
+
+    def read_html(self):
+        with self.open_html() as f:
+            return f.read().decode('utf-8')
+
+    def mtime(self):
+        return self.packed['html'].mtime if self.packed else self.path.stat().st_mtime
+
+    def signature(self):
+        """Changes whenever the page is rewritten or repacked"""
+        if self.packed:
+            member = self.packed['html']
+            return (str(member.path), member.offset, member.length)
+        stat = self.path.stat()
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def size(self):
+        return self.packed['html'].length if self.packed else self.path.stat().st_size
+
+    def validators(self, variant):
+        if not self.packed:
+            return file_validators(self.path, variant)
+        return packed_validators(self.packed['html'], variant)
+
+def find_transcript(filename):
+    """Locate a transcript page by its URL name, loose or packed; None if it does not exist"""
+    if not filename.endswith('.html') or filename.startswith('.'):
+        return None
+    path = storage.local_path(filename)
+    if path is not None:
+        return TranscriptSource(filename, path)
+    packed = segment_store.lookup(filename)
+    if 'html' in packed:
+        return TranscriptSource(filename, packed=packed)
+    return None
+
+def load_transcript(source):
+    """Load channel name, generation time and messages, preferring the structured record over HTML"""
+    record = None
+    with PARSE_SECONDS.time(source='record'):
+        record_file = source.open_record()
+        if record_file is not None:
+            record = load_sidecar(record_file)
+    if record:
+        header, messages = record
+        channel_name = header.get('channel_name') or channel_name_from_filename(source.filename)
+        return channel_name, header.get('generated_at', ''), messages
+    
+    with PARSE_SECONDS.time(source='html'):
+        html_content = source.read_html()
+        generated_at = datetime.fromtimestamp(source.mtime()).strftime('%Y-%m-%d %H:%M:%S')
+        messages = parse_transcript_html(html_content)
+    return channel_name_from_filename(source.filename), generated_at, messages
+
+def load_transcript_cached(source):
+    """Load a transcript through the per-worker parsed transcript cache"""
+    signature = source.signature()
+    cached = transcript_cache.get(source.filename, signature)
+    if cached is not None:
+        return cached
+    
+    transcript = load_transcript(source)
+    transcript_cache.put(source.filename, signature, transcript, source.size())
+    return transcript
+
+def parse_message_cursor(cursor):
+    """Split a "<position>.<byte offset>" cursor; the offset is empty for transcripts without a record"""
+    if not cursor:
+        return 0, None
+    position, _, offset = cursor.partition('.')
+    position = int(position)
+    offset = int(offset) if offset else None
+    if position < 0 or (offset is not None and offset < 0):
+        raise ValueError(f"invalid cursor {cursor!r}")
+    return position, offset
+
+def load_message_page(source, cursor, limit):
+    """Load one page of messages, each tagged with its position in the transcript.
+
+    Transcripts with a record are read by seeking straight to the cursor's byte
+    offset; older ones are sliced from the cached BeautifulSoup parse. Returns
+    (channel_name, generated_at, messages, next_cursor).
+    """
+    position, offset = parse_message_cursor(cursor)
+    if offset is not None or position == 0:
+        page = None
+        with PARSE_SECONDS.time(source='record_page'):
+            record_file = source.open_record()
+            if record_file is not None:
+                page = read_sidecar_page(record_file, offset, limit)
+        if page:
+            header, messages, next_offset = page
+            channel_name = header.get('channel_name') or channel_name_from_filename(source.filename)
+            messages = [dict(msg, position=position + i) for i, msg in enumerate(messages)]
+            next_cursor = f"{position + len(messages)}.{next_offset}" if next_offset is not None else None
+            return channel_name, header.get('generated_at', ''), messages, next_cursor
+    
+    channel_name, generated_at, all_messages = load_transcript_cached(source)
+    end = position + limit
+    messages = [dict(msg, position=i) for i, msg in enumerate(all_messages[position:end], start=position)]
+    next_cursor = f"{end}." if end < len(all_messages) else None
+    return channel_name, generated_at, messages, next_cursor
+
+def file_validators(path, variant):
+    """Strong ETag and Last-Modified for one representation of an immutable file"""
+    stat = path.stat()
+    etag = f"{variant}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+    return etag, last_modified
+
+def packed_validators(member, variant):
+    """ETag and Last-Modified for a file packed into a segment"""
+    etag = f"{variant}-p{member.offset:x}-{member.length:x}"
+    return etag, datetime.fromtimestamp(member.mtime, timezone.utc)
+
+def is_not_modified(etag, last_modified):
+    """Evaluate If-None-Match, or If-Modified-Since when no ETag was sent"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+def add_cache_headers(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+def cached_response(body, etag, last_modified, **headers):
+    """Build a response with validators, or a bodiless 304 if the client is current"""
+    if is_not_modified(etag, last_modified):
+        response = make_response('', 304)
+    else:
+        response = make_response(body)
+    response.headers.update(headers)
+    return add_cache_headers(response, etag, last_modified)
+
+def negotiate_encoding(file_path):
+    """Pick the best stored copy of a page for the request's Accept-Encoding"""
+    for encoding in COMPRESSED_SUFFIXES:
+        if request.accept_encodings.quality(encoding) > 0:
+            candidate = storage.local_path(compressed_path(file_path, encoding).name)
+            if candidate is not None:
+                return encoding, candidate
+    return None, file_path
+
+def serve_stored_page(file_path):
+    """Send the bot-written page from disk, using a pre-compressed copy when accepted.
+
+    The bytes are never read into Python: send_file hands the open file to the
+    server's wsgi.file_wrapper (sendfile under gunicorn), or the path is handed
+    to the front proxy. Range, If-Range and conditional requests are answered
+    by send_file, or by the proxy when it serves the file.
+    """
+    encoding, path = negotiate_encoding(file_path)
+    etag, last_modified = file_validators(path, encoding or 'identity')
+    if SENDFILE_HEADER == 'X-Accel-Redirect':
+        if is_not_modified(etag, last_modified):
+            response = make_response('', 304)
+        else:
+            response = make_response('')
+            response.headers['X-Accel-Redirect'] = (ACCEL_REDIRECT_PREFIX.rstrip('/') + '/'
+                                                    + path.relative_to(storage.local_root).as_posix())
+            response.mimetype = 'text/html'
+        add_cache_headers(response, etag, last_modified)
+    else:
+        response = send_file(path, mimetype='text/html', etag=etag, last_modified=last_modified,
+                             conditional=True, max_age=None)
+    if encoding and response.status_code != 304:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+def serve_packed_page(source):
+    """Send a packed page straight out of its segment with one seek, honouring Range"""
+    encoding, member = None, source.packed['html']
+    for candidate in COMPRESSED_SUFFIXES:
+        if candidate in source.packed and request.accept_encodings.quality(candidate) > 0:
+            encoding, member = candidate, source.packed[candidate]
+            break
+    etag, last_modified = packed_validators(member, encoding or 'identity')
+    
+    response = Response(wrap_file(request.environ, member.open()), mimetype='text/html', direct_passthrough=True)
+    response.content_length = member.length
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.make_conditional(request.environ, accept_ranges=True, complete_length=member.length)
+    if encoding and response.status_code != 304:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+def access_key_status():
+    """None if the request carries the access key; 404 when no key is configured, else 403"""
+    if not ACCESS_KEY:
+        return 404
+    supplied = request.headers.get('X-Access-Key') or request.args.get('key') or ''
+    if not hmac.compare_digest(supplied.encode('utf-8'), ACCESS_KEY.encode('utf-8')):
+        return 403
+    return None
+
+def require_access_key():
+    """Reject the request unless it carries the configured access key"""
+    status = access_key_status()
+    if status:
+        abort(status)
+
+def page_size_arg(default, maximum):
+    try:
+        return max(1, min(int(request.args.get('limit', default)), maximum))
+    except ValueError:
+        return default
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    """Observe latency and bytes sent, and log a sample of requests"""
+    elapsed = time.perf_counter() - g.pop('request_started', time.perf_counter())
+    endpoint = request.endpoint or 'unmatched'
+    size = response.content_length or 0
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, status=response.status_code)
+    BYTES_SERVED.inc(size, endpoint=endpoint)
+    log_event('request', sample_rate=1.0 if response.status_code >= 500 else REQUEST_LOG_SAMPLE_RATE,
+              method=request.method, path=request.path, endpoint=endpoint, status=response.status_code,
+              ms=round(elapsed * 1000, 2), bytes=size, pid=os.getpid())
+    return response
+
+@app.after_request
+def cache_versioned_assets(response):
+    """Versioned asset URLs (?v=) never change content, so browsers may keep them"""
+    if request.path.startswith('/static/') and request.args.get('v') == ASSET_VERSION and response.status_code == 200:
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
 
 @app.route('/')
 def home():
-    """Simple homepage redirect or message"""
-    return """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Transcript Viewer</title>
-        <style>
-            body { 
-                font-family: Arial, sans-serif; 
-                margin: 40px; 
-                background: #f5f5f5; 
-                text-align: center; 
-            }
-            .container { 
-                max-width: 600px; 
-                margin: 100px auto; 
-                background: white; 
-                padding: 40px; 
-                border-radius: 10px; 
-                box-shadow: 0 4px 20px rgba(0,0,0,0.1); 
-            }
-            h1 { color: #333; }
-            p { color: #666; line-height: 1.6; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Transcript Viewer</h1>
-            <p>This service displays individual Discord channel transcripts.</p>
-            <p>Access specific transcripts via direct URLs provided by the bot.</p>
-        </div>
-    </body>
-    </html>
-    """, 200
+    """Paginated listing of transcripts from the catalog, newest first"""
+    require_access_key()
+    rows, next_cursor = catalog.page(page_size_arg(INDEX_PAGE_SIZE, MAX_INDEX_PAGE_SIZE), request.args.get('before'))
+    transcripts = [{
+        'name': row['filename'][:-len('.html')] if row['filename'].endswith('.html') else row['filename'],
+        'filename': row['filename'],
+        'channel_name': row['channel_name'],
+        'created_date': datetime.fromtimestamp(row['created_at'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
+        'size': row['size'],
+        'message_count': row['message_count'],
+        'generator': row['generator']
+    } for row in rows]
+    return render_template(
+        'index.html',
+        transcripts=transcripts,
+        next_cursor=next_cursor,
+        access_key=request.args.get('key'),
+        current_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    )
 
 @app.route('/transcripts/<filename>')
 def serve_transcript(filename):
     """Serve a single transcript without any navigation to others"""
-    file_path = TRANSCRIPTS_DIR / filename
-    
-    print(f"📥 Requested: {filename}")
-    print(f"🔍 Path: {file_path.absolute()}")
-    print(f"✅ Exists: {file_path.exists()}")
+    # Only transcript pages are served; records, compressed copies and the catalog are not
+    if not filename.endswith('.html'):
+        abort(404)
     
-    if not file_path.exists():
+    source = find_transcript(filename)
+    if source is None:
         return f"""
         <!DOCTYPE html>
         <html>
@@ -204,51 +493,25 @@ def serve_transcript(filename):
         """, 404
     
     try:
-        # Read the HTML file
-        with open(file_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        
-        # Extract channel name from filename
-        channel_name = filename.replace('transcript-', '').replace('.html', '')
-        channel_name = channel_name.split('-2025')[0]  # Remove timestamp
+        if SERVE_MODE == 'static':
+            return serve_packed_page(source) if source.packed else serve_stored_page(source.path)
         
-        # Parse the HTML to extract messages for the simple template
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(html_content, 'html.parser')
+        # Answer revalidations before loading or rendering anything
+        etag, last_modified = source.validators(f"r{RENDER_VERSION}")
+        if is_not_modified(etag, last_modified):
+            return cached_response('', etag, last_modified)
         
-        messages = []
-        for message_div in soup.find_all('div', class_='message'):
-            timestamp = message_div.find('div', class_='timestamp')
-            author = message_div.find('div', class_='author')
-            content = message_div.find('div', class_='content')
-            attachments = message_div.find('div', class_='attachments')
-            
-            message_data = {
-                'timestamp': timestamp.get_text() if timestamp else '',
-                'author': author.get_text() if author else '',
-                'content': content.get_text() if content else '',
-                'attachments': []
-            }
-            
-            if attachments:
-                for attachment in attachments.find_all('a', class_='attachment'):
-                    message_data['attachments'].append({
-                        'filename': attachment.get_text(),
-                        'url': attachment.get('href')
-                    })
-            
-            messages.append(message_data)
+        # Only the first page is rendered; the viewer fetches the rest on scroll
+        channel_name, generated_at, messages, next_cursor = load_message_page(source, None, VIEWER_PAGE_SIZE)
         
-        # Render using simple template
-        return render_template_string(
-            SIMPLE_TEMPLATE,
-            channel_name=channel_name,
-            generated_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            messages=messages
-        )
+        # Same templates the bot writes pages with
+        parts = [render_header(channel_name, generated_at)]
+        parts.extend(render_message(msg, msg['position']) for msg in messages)
+        parts.append(render_footer(next_cursor=next_cursor, api_url=url_for('transcript_messages', filename=filename)))
+        return cached_response(''.join(parts), etag, last_modified)
         
     except Exception as e:
-        print(f"❌ Error processing transcript: {e}")
+        log_event('transcript_error', file=filename, error=str(e))
         return f"""
         <!DOCTYPE html>
         <html>
@@ -282,6 +545,298 @@ def serve_transcript(filename):
         </html>
         """, 500
 
+@app.route('/api/transcripts/<filename>/messages')
+def transcript_messages(filename):
+    """One page of a transcript's messages as JSON, addressed by an opaque cursor"""
+    source = find_transcript(filename)
+    if source is None:
+        return jsonify({'error': 'Transcript not found'}), 404
+    
+    etag, last_modified = source.validators('api')
+    if is_not_modified(etag, last_modified):
+        return cached_response('', etag, last_modified)
+    
+    try:
+        channel_name, _, messages, next_cursor = load_message_page(
+            source, request.args.get('cursor'), page_size_arg(VIEWER_PAGE_SIZE, MAX_API_PAGE_SIZE)
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    return cached_response(jsonify({
+        'channel_name': channel_name,
+        'messages': messages,
+        'next_cursor': next_cursor
+    }), etag, last_modified)
+
+@app.route('/attachments/<name>')
+def serve_attachment(name):
+    """Serve an archived attachment by content hash, with Range and conditional request support"""
+    if not is_stored_name(name):
+        abort(404)
+    path = attachments.local_path(name)
+    if path is None:
+        abort(404)
+    
+    # Media opens in the browser; anything else (html, svg, scripts) is downloaded
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    inline = mimetype.startswith(('image/', 'video/', 'audio/')) and mimetype != 'image/svg+xml'
+    response = send_file(path, mimetype=mimetype, as_attachment=not inline, download_name=name,
+                         etag=name.split('.')[0], conditional=True)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+@app.route('/search')
+def search():
+    """Ranked message hits across all transcripts, with snippets and deep links.
+
+    Searching reads every transcript, so it is refused, like the listing,
+    unless the request carries the configured access key.
+    """
+    status = access_key_status()
+    if status:
+        return jsonify({'error': 'search needs the access key' if status == 403 else 'search is disabled'}), status
+    query = request.args.get('q', '').strip()
+    limit = page_size_arg(SEARCH_PAGE_SIZE, MAX_SEARCH_PAGE_SIZE)
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        offset = 0
+    
+    hits = search_index.search(query, limit=limit, offset=offset) if query else []
+    for hit in hits:
+        hit['url'] = url_for('serve_transcript', filename=hit['filename'], _anchor=f"m{hit['position']}")
+    return jsonify({
+        'query': query,
+        'offset': offset,
+        'limit': limit,
+        'hits': hits,
+        'next_offset': offset + limit if len(hits) == limit else None
+    })
+
+def parse_export_time(value, end=False):
+    """A YYYY-MM-DD date (UTC) or Unix timestamp as a bound for created_at.
+
+    With `end` the result is exclusive but covers the value given: the whole
+    day for a date, that second for a timestamp.
+    """
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value) + (1 if end else 0)
+    day = datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    return int(day.timestamp()) + (86400 if end else 0)
+
+def iter_export_entries(user, since, until):
+    """Catalog entries matching the export filters, read in batches rather than collected"""
+    if not user:
+        yield from catalog.iter_range(since, until, EXPORT_BATCH)
+        return
+    filenames = search_index.iter_author_filenames(user, EXPORT_BATCH)
+    while True:
+        chunk = list(itertools.islice(filenames, EXPORT_BATCH))
+        if not chunk:
+            return
+        rows = catalog.get_many(chunk)
+        for filename in chunk:
+            row = rows.get(filename)
+            if row is None:
+                continue
+            if (since is None or row['created_at'] >= since) and (until is None or row['created_at'] < until):
+                yield row
+
+def open_record_file(source):
+    """The transcript's message record as an open binary file, or None if it has none"""
+    record = source.open_record()
+    if record is None or hasattr(record, 'read'):
+        return record
+    try:
+        return open(record, 'rb')
+    except FileNotFoundError:
+        return None
+
+def export_zip(entries, stats):
+    """Each matching page, and its message record when it has one, as members of a ZIP stream"""
+    archive = ZipStream()
+    try:
+        for row in entries:
+            source = find_transcript(row['filename'])
+            if source is None:
+                continue
+            with source.open_html() as f:
+                yield from archive.file_member(row['filename'], row['created_at'], f)
+            record = open_record_file(source)
+            if record is not None:
+                with record:
+                    yield from archive.file_member(sidecar_path(Path(row['filename'])).name, row['created_at'], record)
+            stats['transcripts'] += 1
+        yield from archive.finish()
+    finally:
+        archive.close()
+
+def export_jsonl(entries, stats):
+    """A "transcript" line per match followed by a "message" line per message.
+
+    Message lines are copied from the record without being parsed; transcripts
+    that predate records are parsed from their HTML.
+    """
+    for row in entries:
+        source = find_transcript(row['filename'])
+        if source is None:
+            continue
+        stats['transcripts'] += 1
+        url = url_for('serve_transcript', filename=row['filename'], _external=True)
+        yield (json.dumps({'type': 'transcript', **row, 'url': url}, ensure_ascii=False) + '\n').encode('utf-8')
+        
+        prefix = b'{"type":"message","filename":' + json.dumps(row['filename']).encode('utf-8') + b',"position":'
+        parts, size, position = [], 0, 0
+        f = open_record_file(source)
+        if f is not None:
+            with f:
+                header = json.loads(f.readline() or b'{}')
+                if header.get('version') == SIDECAR_VERSION:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        parts.append(prefix + str(position).encode() + b',"message":' + line + b'}\n')
+                        size += len(parts[-1])
+                        position += 1
+                        if size >= CHUNK_SIZE:
+                            yield b''.join(parts)
+                            parts, size = [], 0
+                    yield b''.join(parts)
+                    continue
+        
+        _, _, messages = load_transcript(source)
+        for position, msg in enumerate(messages):
+            parts.append(prefix + str(position).encode() + b',"message":'
+                         + json.dumps(msg, ensure_ascii=False).encode('utf-8') + b'}\n')
+        yield b''.join(parts)
+
+def track_export(body, fmt, stats):
+    """Count what an export sends; the request hooks only see the response headers"""
+    started = time.perf_counter()
+    sent = 0
+    try:
+        for data in body:
+            if data:
+                sent += len(data)
+                yield data
+    finally:
+        BYTES_SERVED.inc(sent, endpoint='export')
+        log_event('export', format=fmt, transcripts=stats['transcripts'], bytes=sent,
+                  ms=round((time.perf_counter() - started) * 1000, 1))
+
+@app.route('/export')
+def export():
+    """Download every transcript matching ?user=, ?from= and ?to= as ?format=zip or jsonl.
+
+    `user` is a display name or user id that posted in the ticket; `from` and
+    `to` are inclusive UTC dates (or Unix timestamps). The body is produced
+    while it is sent: catalog entries are read in batches and each transcript
+    is streamed from disk or its segment in chunks, so memory use stays flat
+    however many transcripts match, and the download starts at once. Exports
+    that run for minutes need a gunicorn worker allowed to (gthread, or a
+    raised --timeout).
+    """
+    require_access_key()
+    fmt = request.args.get('format', 'zip')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        since = parse_export_time(request.args.get('from'))
+        until = parse_export_time(request.args.get('to'), end=True)
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD dates or Unix timestamps'}), 400
+    
+    stats = {'transcripts': 0}
+    entries = iter_export_entries(request.args.get('user', '').strip(), since, until)
+    body = export_zip(entries, stats) if fmt == 'zip' else export_jsonl(entries, stats)
+    response = Response(stream_with_context(track_export(body, fmt, stats)), mimetype=EXPORT_FORMATS[fmt])
+    filename = f"transcripts-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # Keep nginx from buffering the stream, so the download starts immediately
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def record_ingested(entry):
+    """Catalog and index a pushed transcript once its files are stored"""
+    filename = entry['filename']
+    catalog.record(filename, entry.get('channel_name') or channel_name_from_filename(filename),
+                   entry.get('channel_id'), entry.get('generator'), int(entry.get('created_at') or time.time()),
+                   int(entry.get('file_size') or 0), int(entry.get('message_count') or 0))
+    try:
+        with storage.open_read(sidecar_path(Path(filename)).name) as f:
+            search_index.index_record(filename, f)
+    except FileNotFoundError:
+        pass
+
+def ingest_auth_error():
+    """None if the request carries the ingest token, else the error response"""
+    if not INGEST_TOKEN:
+        abort(404)
+    supplied = request.headers.get('Authorization', '').encode('utf-8')
+    if not hmac.compare_digest(supplied, f'Bearer {INGEST_TOKEN}'.encode('utf-8')):
+        return jsonify({'error': 'invalid ingest token'}), 401
+    return None
+
+@app.route(INGEST_PATH, methods=['POST'])
+def ingest():
+    """Store a batch of transcripts pushed by the bot; entries already stored are skipped"""
+    error = ingest_auth_error()
+    if error:
+        return error
+    
+    try:
+        stream = open_batch(request.stream, request.headers.get('Content-Encoding'))
+        result = apply_batch(stream, storage, ingest_log, record_ingested)
+    except (ValueError, EOFError, gzip.BadGzipFile, zlib.error) as e:
+        # Malformed batches get a 400 and are dropped by the bot; storage errors
+        # propagate as 500s, which the bot retries
+        log_event('ingest_rejected', error=str(e))
+        return jsonify({'error': str(e)}), 400
+    log_event('ingest', **result)
+    return jsonify(dict(result, store=ingest_log.store_id()))
+
+@app.route(MISSING_PATH, methods=['POST'])
+def ingest_missing():
+    """Which of the bot's transcripts this app lacks, with the id of its current store.
+
+    The store id changes whenever ingested.sqlite3 is lost (an ephemeral disk
+    after a restart), which tells the bot to offer its catalog again.
+    """
+    error = ingest_auth_error()
+    if error:
+        return error
+    body = request.get_json(silent=True)
+    filenames = body.get('filenames') if isinstance(body, dict) else None
+    if (not isinstance(filenames, list) or len(filenames) > RESYNC_BATCH
+            or not all(isinstance(name, str) for name in filenames)):
+        return jsonify({'error': f'expected up to {RESYNC_BATCH} filenames'}), 400
+    known = catalog.get_many(filenames)
+    return jsonify({'store': ingest_log.store_id(), 'missing': [name for name in filenames if name not in known]})
+
+@app.route('/metrics')
+def metrics():
+    """This worker's metrics in the Prometheus text format"""
+    if not METRICS_TOKEN:
+        abort(404)
+    if not bearer_matches(request.headers.get('Authorization'), METRICS_TOKEN):
+        return jsonify({'error': 'invalid metrics token'}), 401
+    return REGISTRY.render(), 200, {'Content-Type': CONTENT_TYPE}
+
+@app.route('/cache-stats')
+def cache_stats():
+    """Hit/miss counters of this worker's parsed transcript cache, and of the storage cache when there is one"""
+    require_access_key()
+    stats = transcript_cache.stats()
+    if hasattr(storage, 'stats'):
+        stats = dict(stats, storage=storage.stats())
+    return jsonify(stats)
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     print(f"🚀 Starting transcript server on port {port}")